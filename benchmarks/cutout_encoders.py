@@ -0,0 +1,76 @@
+"""
+Benchmark the direct FITS and HDF5 cutout encoders against the astropy and
+h5py-on-BytesIO encoders they replaced.
+
+Run with:
+
+```
+python benchmarks/cutout_encoders.py
+```
+
+Inputs are lists of lists, as returned by the backend. For each size we
+report mean latency per encode and peak traced allocation.
+"""
+
+import io
+import timeit
+import tracemalloc
+
+import h5py
+import numpy as np
+from astropy.io import fits
+
+from lightserve.processing.encoders import encode_fits_image, encode_hdf5
+
+
+def fits_astropy(data):
+    with io.BytesIO() as output:
+        fits.PrimaryHDU(data=np.array(data)).writeto(output)
+        return output.getvalue()
+
+
+def fits_direct(data):
+    return encode_fits_image(data)
+
+
+def hdf5_bytesio(data):
+    with io.BytesIO() as output:
+        with h5py.File(output, "w") as f:
+            f.create_dataset("data", data=np.array(data))
+        return output.getvalue()
+
+
+def hdf5_core(data):
+    return encode_hdf5({"data": (data, {})})
+
+
+def peak_allocation(func, data) -> int:
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return peak
+
+
+def main():
+    rng = np.random.default_rng(1234)
+
+    print(f"{'encoder':<14} {'size':>9} {'latency [us]':>14} {'peak [KiB]':>12}")
+
+    for size in (32, 128, 512):
+        data = rng.normal(size=(size, size)).tolist()
+
+        for func in (fits_astropy, fits_direct, hdf5_bytesio, hdf5_core):
+            number = max(5, 200_000 // (size * size))
+            latency = timeit.timeit(lambda: func(data), number=number) / number
+            peak = peak_allocation(func, data)
+
+            print(
+                f"{func.__name__:<14} {f'{size}x{size}':>9} "
+                f"{latency * 1e6:>14.1f} {peak / 1024:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
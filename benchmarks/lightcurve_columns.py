@@ -0,0 +1,97 @@
+"""
+Benchmark lightcurve column preparation and CSV formatting against the
+per-element implementation they replaced.
+
+Run with:
+
+```
+python benchmarks/lightcurve_columns.py
+```
+
+Bands are built as the backend returns them: lists of datetimes, UUIDs
+and floats. For each size we report mean latency of preparing the typed
+columns, and of preparing and formatting the whole band as CSV.
+"""
+
+import timeit
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+from lightserve.processing.renderer import (
+    LIGHTCURVE_FIELD_CONFIG,
+    _prepare_data_columnar,
+    iterate_lightcurve_csv,
+)
+
+LEGACY_CONVERSIONS = {
+    "measurement_id": str,
+    "time": lambda x: int(x.timestamp()),
+}
+
+
+def columns_legacy(band):
+    data = {}
+
+    for field in LIGHTCURVE_FIELD_CONFIG:
+        data[field] = getattr(band, field)
+
+        if field in LEGACY_CONVERSIONS:
+            data[field] = list(map(LEGACY_CONVERSIONS[field], data[field]))
+
+    return data
+
+
+def columns_vectorized(band):
+    return _prepare_data_columnar(band)
+
+
+def csv_legacy(band):
+    formatting_string = ",".join(
+        c["format_string"] for c in LIGHTCURVE_FIELD_CONFIG.values()
+    )
+
+    return "".join(
+        formatting_string.format(*args) + "\n"
+        for args in zip(*columns_legacy(band).values())
+    ).encode()
+
+
+def csv_vectorized(band):
+    return b"".join(iterate_lightcurve_csv({"band": band}))
+
+
+def make_band(size: int, rng: np.random.Generator) -> SimpleNamespace:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    return SimpleNamespace(
+        measurement_id=[uuid.uuid4() for _ in range(size)],
+        time=[start + timedelta(seconds=37 * i) for i in range(size)],
+        flux=rng.normal(1.0, 0.1, size).tolist(),
+        flux_err=rng.uniform(0.01, 0.1, size).tolist(),
+        ra=rng.uniform(0, 360, size).tolist(),
+        dec=rng.uniform(-90, 90, size).tolist(),
+        frequency=145,
+        module="i1",
+    )
+
+
+def main():
+    rng = np.random.default_rng(1234)
+
+    print(f"{'stage':<20} {'points':>9} {'latency [ms]':>14}")
+
+    for size in (100_000, 1_000_000):
+        band = make_band(size, rng)
+
+        for func in (columns_legacy, columns_vectorized, csv_legacy, csv_vectorized):
+            number = 3 if size <= 100_000 else 1
+            latency = timeit.timeit(lambda: func(band), number=number) / number
+
+            print(f"{func.__name__:<20} {size:>9} {latency * 1e3:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
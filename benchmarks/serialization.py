@@ -0,0 +1,146 @@
+"""
+Benchmark serialization of large lightcurve and source-list responses
+through FastAPI's paths against lightserve.api.serialization.
+
+Run with:
+
+```
+python benchmarks/serialization.py
+```
+
+Models mirror the structure of the lightcurvedb ones (a dict of bands,
+each a list per field; a list of sources). For each size we report mean
+latency of:
+
+- jsonable_encoder: jsonable_encoder then json.dumps, as FastAPI does when
+  it cannot dump straight to JSON (and as older releases always did).
+- fastapi_dump_json: validation against, and serialization through, the
+  response union, as current FastAPI releases do.
+- serialize_json: lightserve's direct pydantic-core serialization.
+- serialize_msgpack: the same, to MessagePack (if msgpack is installed).
+"""
+
+import json
+import timeit
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, TypeAdapter
+
+from lightserve.api.serialization import MSGPACK_AVAILABLE, serialize
+
+
+class Band(BaseModel):
+    source_id: UUID
+    module: str | None
+    frequency: int
+    measurement_id: list[UUID]
+    time: list[datetime]
+    ra: list[float]
+    dec: list[float]
+    flux: list[float]
+    flux_err: list[float]
+
+
+class LightcurveFrequency(BaseModel):
+    source_id: UUID
+    lightcurves: dict[int, Band]
+
+
+class LightcurveInstrument(BaseModel):
+    source_id: UUID
+    lightcurves: dict[str, Band]
+
+
+class Source(BaseModel):
+    source_id: UUID
+    name: str | None
+    ra: float | None
+    dec: float | None
+
+
+def make_lightcurve(size: int, rng: np.random.Generator) -> LightcurveInstrument:
+    source_id = uuid4()
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    band = Band(
+        source_id=source_id,
+        module="i1",
+        frequency=145,
+        measurement_id=[uuid4() for _ in range(size)],
+        time=[start + timedelta(seconds=37 * i) for i in range(size)],
+        ra=rng.uniform(0, 360, size).tolist(),
+        dec=rng.uniform(-90, 90, size).tolist(),
+        flux=rng.normal(1.0, 0.1, size).tolist(),
+        flux_err=rng.uniform(0.01, 0.1, size).tolist(),
+    )
+
+    return LightcurveInstrument(source_id=source_id, lightcurves={"i1_f145": band})
+
+
+def make_sources(size: int, rng: np.random.Generator) -> list[Source]:
+    return [
+        Source(source_id=uuid4(), name=f"S{i}", ra=ra, dec=dec)
+        for i, (ra, dec) in enumerate(
+            zip(rng.uniform(-180, 180, size), rng.uniform(-90, 90, size))
+        )
+    ]
+
+
+def main():
+    rng = np.random.default_rng(1234)
+
+    cases = [
+        (
+            "lightcurve",
+            size,
+            make_lightcurve(size, rng),
+            TypeAdapter(LightcurveFrequency | LightcurveInstrument),
+            None,
+        )
+        for size in (10_000, 100_000, 1_000_000)
+    ] + [
+        (
+            "sources",
+            size,
+            make_sources(size, rng),
+            TypeAdapter(list[Source]),
+            list[Source],
+        )
+        for size in (10_000, 100_000)
+    ]
+
+    paths = {
+        "jsonable_encoder": lambda value, adapter, annotation: json.dumps(
+            jsonable_encoder(value)
+        ).encode(),
+        "fastapi_dump_json": lambda value, adapter, annotation: adapter.dump_json(
+            adapter.validate_python(value)
+        ),
+        "serialize_json": lambda value, adapter, annotation: serialize(
+            value, "json", annotation
+        ),
+    }
+
+    if MSGPACK_AVAILABLE:
+        paths["serialize_msgpack"] = lambda value, adapter, annotation: serialize(
+            value, "msgpack", annotation
+        )
+
+    print(f"{'payload':<12} {'items':>9} {'path':<20} {'latency [ms]':>14}")
+
+    for payload, size, value, adapter, annotation in cases:
+        for name, path in paths.items():
+            number = 3 if size <= 100_000 else 1
+            latency = (
+                timeit.timeit(lambda: path(value, adapter, annotation), number=number)
+                / number
+            )
+
+            print(f"{payload:<12} {size:>9} {name:<20} {latency * 1e3:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,22 +5,62 @@ Add observations to a source.
 from uuid import UUID
 
 import pandas as pd
-from fastapi import APIRouter, HTTPException, Request, UploadFile, status
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    HTTPException,
+    Request,
+    UploadFile,
+    status,
+)
 from lightcurvedb.models.cutout import Cutout
 from lightcurvedb.models.flux import FluxMeasurement
+from loguru import logger
 
 from lightgest.database import DatabaseBackend
 
 from .auth import requires
+from .settings import settings
 
 observations_router = APIRouter(prefix="/observations", tags=["Observations"])
 
 
+def warm_cutout_cache(cutouts: list[Cutout]):
+    """
+    Pre-render newly ingested cutouts into lightserve's on-disk cache. Run
+    as a background task once the response has been sent; the cache is only
+    an optimization, so failures are logged and otherwise ignored.
+    """
+    try:
+        # Imported here so that lightserve's rendering stack is only loaded
+        # when warming is enabled. These modules do not load lightserve's API.
+        from lightserve.processing.cutouts import CutoutEncoder
+        from lightserve.processing.disk_cache import DiskCache
+        from lightserve.warming import warm_cutouts
+
+        warm_cutouts(
+            cutouts,
+            DiskCache(settings.cutout_disk_cache_directory),
+            formats=settings.cache_warm_formats,
+            thumbnail_sizes=settings.cache_warm_thumbnail_sizes,
+            encoder=CutoutEncoder(
+                png_compress_level=settings.png_compress_level,
+                webp_lossless=settings.webp_lossless,
+                webp_quality=settings.webp_quality,
+                webp_method=settings.webp_method,
+            ),
+        )
+    except Exception:
+        logger.exception(f"Failed to pre-render {len(cutouts)} ingested cutouts")
+
+
 @observations_router.put(
     "/",
     summary="Create observation",
     description=(
-        "Create a flux measurement and optional cutout. Requires scope lcs:create."
+        "Create a flux measurement and optional cutout. If a cutout cache is "
+        "configured, the cutout is pre-rendered into it after the response is "
+        "sent. Requires scope lcs:create."
     ),
 )
 @requires("lcs:create")
@@ -28,6 +68,7 @@ async def add_observation(
     request: Request,
     flux_measurement: FluxMeasurement,
     backend: DatabaseBackend,
+    background_tasks: BackgroundTasks,
     cutout: Cutout | None = None,
 ) -> tuple[UUID, UUID | None]:
     measurement_id = await backend.fluxes.create(measurement=flux_measurement)
@@ -38,6 +79,9 @@ async def add_observation(
         )
 
         cutout_id = await backend.cutouts.create(cutout=enforced_cutout)
+
+        if settings.cutout_disk_cache_directory is not None:
+            background_tasks.add_task(warm_cutout_cache, [enforced_cutout])
     else:
         cutout_id = None
 
@@ -49,7 +93,8 @@ async def add_observation(
     summary="Create observations in batch",
     description=(
         "Create multiple flux measurements with optional cutouts in a single call. "
-        "Requires scope lcs:create."
+        "If a cutout cache is configured, the cutouts are pre-rendered into it "
+        "after the response is sent. Requires scope lcs:create."
     ),
 )
 @requires("lcs:create")
@@ -57,6 +102,7 @@ async def add_observation_batch(
     request: Request,
     flux_measurements: list[FluxMeasurement],
     backend: DatabaseBackend,
+    background_tasks: BackgroundTasks,
     cutouts: list[Cutout] | None = None,
 ) -> tuple[list[UUID], list[UUID] | None]:
     measurement_ids = await backend.fluxes.create_batch(measurements=flux_measurements)
@@ -74,6 +120,9 @@ async def add_observation_batch(
         ]
 
         cutout_ids = await backend.cutouts.create_batch(cutouts=cutouts)
+
+        if settings.cutout_disk_cache_directory is not None:
+            background_tasks.add_task(warm_cutout_cache, cutouts)
     else:
         cutout_ids = None
 
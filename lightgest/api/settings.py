@@ -2,6 +2,9 @@
 Settings for the project.
 """
 
+from pathlib import Path
+from typing import Literal
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -29,6 +32,18 @@ class Settings(BaseSettings):
 
     bearer_token_fixed: str | None = None
 
+    cutout_disk_cache_directory: Path | None = None
+    "Directory of lightserve's on-disk cutout cache; if set, ingested cutouts are pre-rendered into it."
+    cache_warm_formats: list[Literal["webp", "png"]] = ["webp", "png"]
+    cache_warm_thumbnail_sizes: list[int] = [128]
+    "Image formats, and thumbnail sizes (as well as full size), pre-rendered for ingested cutouts."
+
+    png_compress_level: int = 6
+    webp_lossless: bool = True
+    webp_quality: int = 90
+    webp_method: int = 4
+    "Image encoder settings for pre-rendered cutouts; set them as for lightserve (same variable names), which only uses renders made with its own."
+
     telemetry: LightServeOtelSettings
     "Settings for OpenTelemetry tracing. Set environment variables with prefix TELEMETRY__ to override defaults."
 
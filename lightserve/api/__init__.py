@@ -47,6 +47,13 @@ if settings.add_cors:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[
+            "ETag",
+            "X-Missing-Measurements",
+            "X-Render-Vmin",
+            "X-Render-Vmax",
+            "X-Next-Since",
+        ],
     )
 
 app = setup_auth(app)
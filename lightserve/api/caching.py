@@ -0,0 +1,88 @@
+"""
+Helpers for HTTP caching: strong entity tags and conditional requests.
+"""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from hashlib import blake2b
+from typing import Any
+
+from fastapi import Request, Response, status
+
+from lightserve.processing.cache import strong_etag as strong_etag
+
+
+def weak_etag(*parts: Any) -> str:
+    """
+    Compute a weak entity tag from values that identify a version of a
+    resource (e.g. its latest modification and size), rather than from the
+    encoded body. Parts must have a stable repr.
+    """
+    return 'W/"' + blake2b(repr(parts).encode(), digest_size=16).hexdigest() + '"'
+
+
+def http_date(time: datetime) -> str:
+    """
+    Format a time as an HTTP date, e.g. for Last-Modified. Naive times are
+    taken to be UTC.
+    """
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+
+    return format_datetime(time.astimezone(timezone.utc), usegmt=True)
+
+
+def unmodified_since(request: Request, last_modified: datetime) -> bool:
+    """
+    Check whether the If-Modified-Since header of a request is no earlier
+    than the given time. Ignored, as required, when If-None-Match is sent.
+    """
+    header = request.headers.get("if-modified-since")
+
+    if header is None or "if-none-match" in request.headers:
+        return False
+
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+
+    # HTTP dates have a resolution of one second.
+    return last_modified.replace(microsecond=0) <= since
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check whether the If-None-Match header of a request matches the given
+    entity tag. Uses the weak comparison required for If-None-Match.
+    """
+    header = request.headers.get("if-none-match")
+
+    if header is None:
+        return False
+
+    if header.strip() == "*":
+        return True
+
+    candidates = (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+    return etag.removeprefix("W/") in candidates
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    """
+    Build a 304 Not Modified response, carrying over only the headers that
+    are allowed on one.
+    """
+    allowed = {"etag", "cache-control", "last-modified", "vary", "expires"}
+
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={k: v for k, v in headers.items() if k.lower() in allowed},
+    )
@@ -2,14 +2,18 @@
 Endpoints to get cutouts corresponding to specific observations.
 """
 
+import asyncio
 import io
-from pathlib import Path
-from typing import Any, BinaryIO, Literal, Optional, Union
+import os
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timezone
+from typing import Any, Iterator, Literal, Optional
 from uuid import UUID
 
-import matplotlib.pyplot as plt
+import h5py
 import numpy as np
-from astropy.io import fits
 from fastapi import (
     APIRouter,
     Depends,
@@ -22,167 +26,1100 @@ from fastapi import (
 from fastapi import (
     Path as FastAPIPath,
 )
-from lightcurvedb.models.exceptions import CutoutNotFoundException
-from matplotlib.colors import LogNorm
+from fastapi.responses import StreamingResponse
+from lightcurvedb.client.feed import feed_read
+from lightcurvedb.models.cutout import Cutout
+from lightcurvedb.models.exceptions import (
+    CutoutNotFoundException,
+    SourceNotFoundException,
+)
 from pydantic import BaseModel, Field
 
-from lightserve.database import DatabaseBackend
+from lightserve.database import DatabaseBackend, Feed, Workers
+from lightserve.feed import MaterializedFeed
+from lightserve.processing.cache import ByteBudgetLRUCache, CacheStatistics
+from lightserve.processing.cutouts import (
+    CUTOUT_MEDIA_TYPES,
+    CompressionOptions,
+    CutoutEncoder,
+    RenderedCutout,
+    RenderOptions,
+    ResampleOptions,
+    cutout_cache_key,
+    encode_cutout,
+    render_limits,
+)
+from lightserve.processing.disk_cache import DiskCache
+from lightserve.processing.encoders import (
+    encode_fits,
+    encode_fits_compressed_image,
+    encode_fits_table,
+    encode_hdf5,
+    fits_header,
+    image_cards,
+    write_fits_image_planes,
+)
+from lightserve.processing.streaming import file_size, iterate_file
 
 from .auth import requires
+from .caching import etag_matches, not_modified, strong_etag
+from .negotiation import negotiate
+from .settings import settings
 
 cutouts_router = APIRouter(prefix="/cutouts", tags=["Cutouts"])
 
 
-class RenderOptions(BaseModel):
-    cmap: str = Field(default="viridis")
-    "Color map to use for rendering, defaults to 'viridis', and may not be used if RGBA buffers are provided."
-    vmin: float = Field(default=0.0)
-    "Color map range minimum, defaults to 0.0"
-    vmax: float = Field(default=1000.0)
-    "Color map range maximum, defaults to 1000.0"
-    log_norm: bool = Field(default=False)
-    "Whether to use a log normalization, defaults to False."
-    clip: bool = Field(default=True)
-    "Whether to clip values outside of the range, defaults to True."
-
-    @property
-    def norm(self) -> plt.Normalize:
-        if self.log_norm:
-            return LogNorm(vmin=self.vmin, vmax=self.vmax, clip=self.clip)
-        else:
-            return plt.Normalize(vmin=self.vmin, vmax=self.vmax, clip=self.clip)
-
-
-class Renderer:
-    format: Optional[str]
-    "Format to render images to, defaults to 'webp'."
-    pil_kwargs: Optional[dict[str, Any]]
-    "Keyword arguments to pass to PIL for rendering, defaults to None."
-
-    def __init__(
-        self,
-        format: Optional[str] = "webp",
-        pil_kwargs: Optional[dict[str, Any]] = None,
-    ):
-        self.format = format
-        self.pil_kwargs = pil_kwargs
-
-        return
-
-    def render(
-        self,
-        fname: Union[str, Path, BinaryIO],
-        buffer: np.ndarray,
-        render_options: RenderOptions,
-    ):
-        """
-        Renders the buffer to the given file.
-
-        Parameters
-        ----------
-        fname : Union[str, Path, BinaryIO]
-            Output for the rendering.
-        buffer : np.ndarray
-            Buffer to render to disk or IO.
-        render_options : RenderOptions
-            Options for rendering.
-
-        Notes
-        -----
-
-        Buffer is transposed in x, y to render correctly within this function.
-        """
-
-        if buffer.ndim == 2:
-            # Render with colour mapping, this is 'raw data'.
-            cmap = plt.get_cmap(render_options.cmap)
-            cmap.set_bad("#dddddd", 0.0)
-            plt.imsave(
-                fname,
-                render_options.norm(buffer),
-                cmap=cmap,
-                pil_kwargs=self.pil_kwargs,
-                format=self.format,
-                # Data is pre-normalized using render_options.norm
-                vmin=0.0,
-                vmax=1.0,
-                origin="lower",
+class CutoutIdentifier(BaseModel):
+    source_id: UUID
+    "Source identifier for the measurement."
+    measurement_id: UUID
+    "Flux measurement identifier."
+
+
+class CutoutBatchRequest(BaseModel):
+    cutouts: list[CutoutIdentifier] = Field(
+        min_length=1, max_length=settings.cutout_batch_max_size
+    )
+    "Cutouts to return, in order."
+
+
+class MontageTile(BaseModel):
+    source_id: UUID
+    "Source shown in this tile."
+    measurement_id: UUID | None
+    "Flux measurement whose cutout is shown, None if the source has no cutout."
+    x: int
+    "Offset of the left edge of the tile, in pixels."
+    y: int
+    "Offset of the top edge of the tile, in pixels."
+    width: int
+    "Width of the cutout in the tile, in pixels; zero if there is none."
+    height: int
+    "Height of the cutout in the tile, in pixels; zero if there is none."
+
+
+class MontageIndex(BaseModel):
+    start: int
+    "Feed offset that this montage starts at."
+    columns: int
+    "Number of tiles per row."
+    rows: int
+    "Number of rows of tiles."
+    tile_width: int
+    "Width of every tile slot, in pixels; smaller cutouts sit at the top left of their slot."
+    tile_height: int
+    "Height of every tile slot, in pixels."
+    tiles: list[MontageTile]
+    "Tiles, in feed order."
+
+
+FEED_PAGE_SIZE = 16
+"Number of sources in each page of the feed, as served by /sources/feed."
+
+render_options = RenderOptions()
+cutout_encoder = CutoutEncoder(
+    png_compress_level=settings.png_compress_level,
+    webp_lossless=settings.webp_lossless,
+    webp_quality=settings.webp_quality,
+    webp_method=settings.webp_method,
+)
+"Image encoder settings for cutouts, from the png_ and webp_ settings."
+renderers = cutout_encoder.renderers()
+renderer = renderers["png"]
+montage_renderers = renderers
+
+
+def encode_cutout_batch(
+    cutouts: list[Cutout],
+    ext: Literal["png", "fits", "hdf5"],
+    render_options: RenderOptions,
+    compression_options: CompressionOptions | None = None,
+) -> tuple[bytes, str]:
+    """
+    Encode many cutouts into a single file: a multi-extension FITS file with
+    an image extension per measurement, an HDF5 file with a dataset per
+    measurement, or a zip archive of PNGs. Run in the worker pool.
+
+    Parameters
+    ----------
+    cutouts : list[Cutout]
+        Cutouts to encode, in order.
+    ext : Literal["png", "fits", "hdf5"]
+        Output format.
+    render_options : RenderOptions
+        Options for rendering, only used for PNGs.
+    compression_options : CompressionOptions | None
+        Options for compressing FITS output.
+
+    Returns
+    -------
+    tuple[bytes, str]
+        The encoded file and its media type.
+    """
+
+    if ext == "png":
+        with io.BytesIO() as output:
+            # PNGs are already compressed, so we just store them.
+            with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as zf:
+                for cutout in cutouts:
+                    content, _ = encode_cutout(
+                        cutout.data, "png", render_options, encoder=cutout_encoder
+                    )
+                    zf.writestr(f"cutout_flux_id_{cutout.measurement_id}.png", content)
+            return output.getvalue(), "application/zip"
+    elif ext == "fits":
+        images = (
+            (
+                cutout.data,
+                str(cutout.measurement_id),
+                [
+                    ("SOURCEID", str(cutout.source_id)),
+                    ("MEASID", str(cutout.measurement_id)),
+                    ("DATE-OBS", cutout.time.isoformat()),
+                ],
             )
-        else:
-            # Direct rendering
-            plt.imsave(
-                fname,
-                np.ascontiguousarray(buffer.swapaxes(0, 1)),
-                pil_kwargs=self.pil_kwargs,
-                format=self.format,
+            for cutout in cutouts
+        )
+
+        if compression_options is None or compression_options.compression is None:
+            return encode_fits(images), "image/fits"
+
+        content = encode_fits(
+            images,
+            dtype="f4",
+            compression=compression_options.compression,
+            quantize_level=compression_options.quantize_level,
+        )
+        return content, "image/fits"
+    elif ext == "hdf5":
+        datasets = {
+            str(cutout.measurement_id): (
+                cutout.data,
+                {"source_id": str(cutout.source_id), "time": cutout.time.isoformat()},
             )
+            for cutout in cutouts
+        }
+        return encode_hdf5(datasets), "application/x-hdf5"
 
-        return
+    raise ValueError(f"Unsupported cutout format {ext}")
 
 
-render_options = RenderOptions()
-renderer = Renderer(format="png")
+def _cube_shape(cutouts: list[Cutout]) -> tuple[int, int, int]:
+    """
+    Shape of the (time, y, x) cube holding the cutouts. Cutouts smaller
+    than the largest one (e.g. at map edges) are padded with NaN.
+    """
+    shapes = [np.shape(c.data) for c in cutouts]
+
+    return (len(cutouts), max(x[0] for x in shapes), max(x[1] for x in shapes))
+
+
+def _cube_planes(
+    cutouts: list[Cutout], shape: tuple[int, int, int]
+) -> Iterator[np.ndarray]:
+    """
+    Yield the planes of a cube one at a time, so the cube itself is never
+    held in memory.
+    """
+    for cutout in cutouts:
+        plane = np.asarray(cutout.data, dtype=np.float32)
+
+        if plane.shape != shape[1:]:
+            padded = np.full(shape[1:], np.nan, dtype=np.float32)
+            padded[: plane.shape[0], : plane.shape[1]] = plane
+            plane = padded
+
+        yield plane
+
+
+def write_cutout_cube(
+    bands: dict[str, list[Cutout]],
+    ext: Literal["fits", "hdf5"],
+    path: str,
+    compression_options: CompressionOptions | None = None,
+):
+    """
+    Write time-ordered cutout cubes, one per band, to a file plane by plane.
+    Run in the worker pool.
+
+    For HDF5, each band is a group containing a chunked, compressed `data`
+    dataset of shape (time, y, x) with one chunk per cutout, alongside
+    `time` (unix seconds) and `measurement_id` datasets. For FITS, each band
+    is an image extension holding the cube followed by a binary table
+    extension (named with a `_TIME` suffix) with the times and measurement
+    IDs. Tile-compressed FITS cubes use one tile per cutout, but must be
+    assembled in memory a band at a time before compression.
+
+    Parameters
+    ----------
+    bands : dict[str, list[Cutout]]
+        Cutouts for each band, sorted by time.
+    ext : Literal["fits", "hdf5"]
+        Output format.
+    path : str
+        File to write to, overwritten if it exists.
+    compression_options : CompressionOptions | None
+        Options for compressing FITS output.
+    """
+
+    compression = compression_options.compression if compression_options else None
+
+    if ext == "hdf5":
+        with h5py.File(path, "w") as f:
+            for band_name, cutouts in bands.items():
+                shape = _cube_shape(cutouts)
+                group = f.create_group(band_name)
+                group.attrs["source_id"] = str(cutouts[0].source_id)
+                group.attrs["module"] = cutouts[0].module
+                group.attrs["frequency"] = cutouts[0].frequency
+
+                data = group.create_dataset(
+                    "data",
+                    shape=shape,
+                    dtype="f4",
+                    chunks=(1, *shape[1:]),
+                    compression="gzip",
+                    shuffle=True,
+                )
+                data.attrs["units"] = cutouts[0].units
+                data.dims[0].label = "time"
+
+                for index, plane in enumerate(_cube_planes(cutouts, shape)):
+                    data[index] = plane
+
+                time = group.create_dataset(
+                    "time",
+                    data=np.array([c.time.timestamp() for c in cutouts]),
+                    dtype="f8",
+                )
+                time.attrs["units"] = "seconds"
+                group.create_dataset(
+                    "measurement_id",
+                    data=np.array(
+                        [str(c.measurement_id) for c in cutouts], dtype="S36"
+                    ),
+                )
+    elif ext == "fits":
+        with open(path, "wb") as handle:
+            handle.write(fits_header(image_cards((), np.float32)))
+
+            for band_name, cutouts in bands.items():
+                shape = _cube_shape(cutouts)
+                cards = [
+                    ("SOURCEID", str(cutouts[0].source_id)),
+                    ("BUNIT", cutouts[0].units),
+                    ("CTYPE3", "TIME"),
+                ]
+
+                if compression is None:
+                    write_fits_image_planes(
+                        handle,
+                        _cube_planes(cutouts, shape),
+                        shape,
+                        cards=cards,
+                        extension=True,
+                        name=band_name,
+                        dtype=np.float32,
+                    )
+                else:
+                    handle.write(
+                        encode_fits_compressed_image(
+                            np.stack(list(_cube_planes(cutouts, shape))),
+                            cards=cards,
+                            name=band_name,
+                            compression=compression,
+                            quantize_level=compression_options.quantize_level,
+                            tile_shape=(1, *shape[1:]),
+                        )
+                    )
+                handle.write(
+                    encode_fits_table(
+                        {
+                            "TIME": np.array([c.time.timestamp() for c in cutouts]),
+                            "MEASID": np.array(
+                                [str(c.measurement_id) for c in cutouts], dtype="S36"
+                            ),
+                        },
+                        units={"TIME": "s"},
+                        name=f"{band_name}_TIME",
+                    )
+                )
+    else:
+        raise ValueError(f"Unsupported cube format {ext}")
+
+
+def render_montage(
+    cutouts: list[Cutout | None],
+    columns: int,
+    format: Literal["png", "webp"],
+    render_options: RenderOptions,
+) -> tuple[bytes, str, int, int]:
+    """
+    Tile cutouts into a single sprite image. All tiles share the same
+    normalization, and the whole sprite is colour mapped and encoded in one
+    pass. Each cutout is placed at the top left of a slot the size of the
+    largest cutout, and missing cutouts are left blank. Run in the worker
+    pool.
+
+    Parameters
+    ----------
+    cutouts : list[Cutout | None]
+        Cutouts to tile, filled left to right and then top to bottom.
+    columns : int
+        Number of tiles per row.
+    format : Literal["png", "webp"]
+        Image format.
+    render_options : RenderOptions
+        Options for rendering, shared by all tiles.
+
+    Returns
+    -------
+    tuple[bytes, str, int, int]
+        The encoded sprite, its media type, and the tile width and height.
+    """
+
+    planes = [np.asarray(c.data) if c is not None else None for c in cutouts]
+    present = [p for p in planes if p is not None]
+    tile_height = max(p.shape[0] for p in present)
+    tile_width = max(p.shape[1] for p in present)
+    rows = -(-len(planes) // columns)
+
+    mosaic = np.full((rows * tile_height, columns * tile_width), np.nan)
+
+    for index, plane in enumerate(planes):
+        if plane is None:
+            continue
+
+        # The renderer flips the whole mosaic as data has its origin at the
+        # bottom, so tile rows are laid out from the bottom up, and the top
+        # of a slot is its last row.
+        row, column = divmod(index, columns)
+        top = (rows - row) * tile_height
+        x = column * tile_width
+        mosaic[top - plane.shape[0] : top, x : x + plane.shape[1]] = plane
+
+    with io.BytesIO() as output:
+        montage_renderers[format].render(output, mosaic, render_options=render_options)
+        return output.getvalue(), f"image/{format}", tile_width, tile_height
+
+
+def _latest_measurement(lightcurve: Any, frequency: int) -> UUID | None:
+    """
+    Find the most recent measurement in the band at the given frequency of
+    a frequency-selected lightcurve.
+    """
+    for band in lightcurve.lightcurves.values():
+        if band.frequency == frequency and band.time:
+            latest = max(range(len(band.time)), key=band.time.__getitem__)
+            return band.measurement_id[latest]
+
+    return None
+
+
+latest_measurement_cache = ByteBudgetLRUCache(
+    max_bytes=settings.montage_measurement_cache_entries
+)
+"Latest feed-band measurement of feed sources, with the time it was read; each entry has size 1."
+
+
+async def feed_measurements(
+    backend: DatabaseBackend, start: int, feed: MaterializedFeed | None = None
+) -> tuple[list[UUID], list[UUID | None]]:
+    """
+    Read a page of the feed, from the materialized feed if it holds the
+    feed band, and find the latest measurement (in the feed band) of each
+    of its sources. Measurements read within the last
+    montage_measurement_cache_ttl seconds are not read again.
+
+    Returns
+    -------
+    tuple[list[UUID], list[UUID | None]]
+        Source IDs in feed order, and their latest measurement IDs.
+    """
+
+    snapshot = feed.snapshot(settings.feed_frequency) if feed is not None else None
+
+    if snapshot is not None:
+        items = snapshot.items[start : start + FEED_PAGE_SIZE]
+    else:
+        result = await feed_read(
+            start=start,
+            number=FEED_PAGE_SIZE,
+            frequency=settings.feed_frequency,
+            backend=backend,
+        )
+        items = result.items
+
+    source_ids = [item.source_id for item in items]
+
+    async def latest(source_id: UUID) -> UUID | None:
+        cached = latest_measurement_cache.get(source_id)
+
+        if (
+            cached is not None
+            and time.monotonic() - cached[0] < settings.montage_measurement_cache_ttl
+        ):
+            return cached[1]
+
+        read = time.monotonic()
+
+        try:
+            lightcurve = await backend.lightcurves.get_source_lightcurve(
+                source_id=source_id, selection_strategy="frequency"
+            )
+        except SourceNotFoundException:
+            return None
+
+        measurement_id = _latest_measurement(lightcurve, settings.feed_frequency)
+        latest_measurement_cache.put(source_id, (read, measurement_id), size=1)
+
+        return measurement_id
+
+    return source_ids, list(await asyncio.gather(*(latest(x) for x in source_ids)))
+
+
+async def retrieve_feed_cutouts(
+    backend: DatabaseBackend, start: int, feed: MaterializedFeed | None = None
+) -> tuple[list[UUID], list[Cutout | None]]:
+    """
+    Read a page of the feed and fetch the latest cutout (in the feed band)
+    for each of its sources.
+
+    Returns
+    -------
+    tuple[list[UUID], list[Cutout | None]]
+        Source IDs in feed order, and their latest cutouts.
+    """
+
+    source_ids, measurement_ids = await feed_measurements(backend, start, feed)
+
+    return source_ids, await retrieve_feed_page_cutouts(
+        backend, source_ids, measurement_ids
+    )
+
+
+async def retrieve_feed_page_cutouts(
+    backend: DatabaseBackend,
+    source_ids: list[UUID],
+    measurement_ids: list[UUID | None],
+) -> list[Cutout | None]:
+    """
+    Fetch the cutouts of a feed page's latest measurements; None where a
+    source has no measurement or cutout.
+    """
+
+    identifiers = [
+        CutoutIdentifier(source_id=source_id, measurement_id=measurement_id)
+        for source_id, measurement_id in zip(source_ids, measurement_ids)
+        if measurement_id is not None
+    ]
+    retrieved = iter(await retrieve_cutouts(backend, identifiers))
+
+    return [
+        next(retrieved) if measurement_id is not None else None
+        for measurement_id in measurement_ids
+    ]
+
+
+def _as_utc(time: datetime | None) -> datetime | None:
+    if time is not None and time.tzinfo is None:
+        return time.replace(tzinfo=timezone.utc)
+
+    return time
+
+
+async def retrieve_cutouts(
+    backend: DatabaseBackend, identifiers: list[CutoutIdentifier]
+) -> list[Cutout | None]:
+    """
+    Fetch many cutouts from the backend concurrently, with at most
+    cutout_batch_concurrency requests in flight. Missing cutouts are None.
+    """
+
+    semaphore = asyncio.Semaphore(settings.cutout_batch_concurrency)
+
+    async def retrieve(identifier: CutoutIdentifier) -> Cutout | None:
+        async with semaphore:
+            try:
+                return await backend.cutouts.retrieve_cutout(
+                    source_id=identifier.source_id,
+                    measurement_id=identifier.measurement_id,
+                )
+            except CutoutNotFoundException:
+                return None
+
+    return await asyncio.gather(*(retrieve(x) for x in identifiers))
+
+
+cutout_cache = ByteBudgetLRUCache(max_bytes=settings.cutout_cache_bytes)
+"Rendered cutouts, keyed on (source_id, measurement_id, ext, render options)."
+thumbnail_cache = ByteBudgetLRUCache(max_bytes=settings.thumbnail_cache_bytes)
+"Resampled cutouts, kept apart so that full-size cutouts cannot evict them."
+limits_cache = ByteBudgetLRUCache(max_bytes=settings.render_limits_cache_entries)
+"Automatically scaled (vmin, vmax) per cutout and scaling; each entry has size 1."
+disk_cache = (
+    DiskCache(settings.cutout_disk_cache_directory)
+    if settings.cutout_disk_cache_directory is not None
+    else None
+)
+"Persistent cache of pre-rendered cutouts, filled by the warming pipeline."
+
+
+@cutouts_router.get(
+    "/cache",
+    summary="Get cutout cache statistics",
+    description=(
+        "Return size, hit, miss and eviction counts for the in-process caches of "
+        "rendered cutouts, thumbnails and automatic render limits. Requires scope "
+        "lcs:read."
+    ),
+)
+@requires("lcs:read")
+async def cutouts_get_cache_statistics(
+    request: Request,
+) -> dict[str, CacheStatistics]:
+    return {
+        "cutouts": cutout_cache.statistics(),
+        "thumbnails": thumbnail_cache.statistics(),
+        "limits": limits_cache.statistics(),
+    }
 
 
 @cutouts_router.get(
     "/flux/{source_id}/{measurement_id}",
     summary="Get cutout by flux measurement id",
     description=(
-        "Return a rendered cutout for a flux measurement. Requires scope lcs:read."
+        "Return a rendered cutout for a flux measurement, optionally shrunk with "
+        "size or scale for use as a thumbnail. FITS output may be tile-compressed "
+        "with compression and quantize_level. The format is taken from ext or, "
+        "if that is not given, negotiated from the Accept header (preferring "
+        "WebP). With an automatic scaling, the range used is returned in "
+        "X-Render-Vmin and X-Render-Vmax. Responses carry a strong ETag and "
+        "honour If-None-Match. Requires scope lcs:read."
     ),
 )
 @requires("lcs:read")
 async def cutouts_get_from_flux_id(
     request: Request,
     backend: DatabaseBackend,
+    workers: Workers,
     measurement_id: UUID = FastAPIPath(..., description="Flux measurement identifier."),
     source_id: UUID = FastAPIPath(
         ..., description="Source identifier for the measurement."
     ),
+    ext: Optional[Literal["webp", "png", "fits", "hdf5"]] = Query(
+        None,
+        description="Output format for the rendered cutout; negotiated if omitted.",
+    ),
+    render_options: RenderOptions = Depends(RenderOptions),
+    resample_options: ResampleOptions = Depends(ResampleOptions),
+    compression_options: CompressionOptions = Depends(CompressionOptions),
+) -> Response:
+    """
+    Return the cutout assocaited with a flux measurement's ID. Cutouts are
+    immutable, so rendered outputs are cached in-process, and pre-rendered
+    outputs are read from the on-disk cache if one is configured.
+    """
+
+    if ext is None:
+        media_type = negotiate(request, list(CUTOUT_MEDIA_TYPES.values()))
+        ext = next(k for k, v in CUTOUT_MEDIA_TYPES.items() if v == media_type)
+
+    cache = cutout_cache if resample_options.native else thumbnail_cache
+    key = cutout_cache_key(
+        source_id,
+        measurement_id,
+        ext,
+        render_options=render_options,
+        resample_options=resample_options,
+        compression_options=compression_options,
+        encoder=cutout_encoder,
+    )
+    rendered = cache.get(key)
+
+    if rendered is None and disk_cache is not None:
+        rendered = await asyncio.to_thread(disk_cache.get, key)
+
+        if rendered is not None:
+            cache.put(key, rendered, size=len(rendered.content))
+
+    if rendered is None:
+        try:
+            cutout = await backend.cutouts.retrieve_cutout(
+                source_id=source_id, measurement_id=measurement_id
+            )
+        except CutoutNotFoundException:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Cutout not found for flux measurement {measurement_id}",
+            )
+
+        extra_headers = {}
+
+        try:
+            if ext in renderers and render_options.scaling != "fixed":
+                # Limits come from the full-resolution cutout, so thumbnails
+                # and other colour maps of it share them.
+                limits_key = (
+                    source_id,
+                    measurement_id,
+                    render_options.scaling,
+                    render_options.percentile,
+                    render_options.log_norm,
+                )
+                limits = limits_cache.get(limits_key)
+
+                if limits is None:
+                    limits = await workers.run(
+                        render_limits, cutout.data, render_options=render_options
+                    )
+                    limits_cache.put(limits_key, limits, size=1)
+
+                render_options = render_options.model_copy(
+                    update={"vmin": limits[0], "vmax": limits[1], "scaling": "fixed"}
+                )
+                extra_headers = {
+                    "X-Render-Vmin": repr(limits[0]),
+                    "X-Render-Vmax": repr(limits[1]),
+                }
+
+            content, media_type = await workers.run(
+                encode_cutout,
+                cutout.data,
+                ext=ext,
+                render_options=render_options,
+                resample_options=resample_options,
+                compression_options=compression_options,
+                encoder=cutout_encoder,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        rendered = RenderedCutout(
+            content=content,
+            media_type=media_type,
+            etag=strong_etag(content),
+            headers=extra_headers,
+        )
+        cache.put(key, rendered, size=len(content))
+
+    filename = f"cutout_flux_id_{measurement_id}.{ext}"
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "ETag": rendered.etag,
+        "Cache-Control": f"private, max-age={settings.cutout_cache_max_age}",
+        "Vary": "Accept",
+        **rendered.headers,
+    }
+
+    if etag_matches(request, rendered.etag):
+        return not_modified(headers)
+
+    return Response(
+        content=rendered.content,
+        media_type=rendered.media_type,
+        headers=headers,
+    )
+
+
+@cutouts_router.post(
+    "/flux/batch",
+    summary="Get many cutouts at once",
+    description=(
+        "Return cutouts for a list of (source_id, measurement_id) pairs in one "
+        "response: a multi-extension FITS file, an HDF5 file with a dataset per "
+        "measurement, or a zip of PNGs. Measurements without cutouts are skipped "
+        "and listed in the X-Missing-Measurements header. FITS output may be "
+        "tile-compressed. Requires scope lcs:read."
+    ),
+)
+@requires("lcs:read")
+async def cutouts_post_batch(
+    request: Request,
+    backend: DatabaseBackend,
+    workers: Workers,
+    batch: CutoutBatchRequest,
     ext: Literal["png", "fits", "hdf5"] = Query(
-        ..., description="Output format for the rendered cutout."
+        ..., description="Output format; png returns a zip archive of images."
     ),
     render_options: RenderOptions = Depends(RenderOptions),
+    compression_options: CompressionOptions = Depends(CompressionOptions),
 ) -> Response:
     """
-    Return the cutout assocaited with a flux measurement's ID.
+    Return many cutouts in a single file, fetching them concurrently.
     """
 
+    cutouts = await retrieve_cutouts(backend, batch.cutouts)
+
+    found = [c for c in cutouts if c is not None]
+    missing = [
+        str(identifier.measurement_id)
+        for identifier, cutout in zip(batch.cutouts, cutouts)
+        if cutout is None
+    ]
+
+    if not found:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No cutouts found for any of the requested flux measurements",
+        )
+
     try:
-        cutout = await backend.cutouts.retrieve_cutout(
-            source_id=source_id, measurement_id=measurement_id
+        content, media_type = await workers.run(
+            encode_cutout_batch,
+            found,
+            ext=ext,
+            render_options=render_options,
+            compression_options=compression_options,
         )
-        filename = f"cutout_flux_id_{measurement_id}.{ext}"
-    except CutoutNotFoundException:
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    filename = f"cutouts_batch.{'zip' if ext == 'png' else ext}"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+
+    if missing:
+        headers["X-Missing-Measurements"] = ",".join(missing)
+
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+@cutouts_router.get(
+    "/cube/{source_id}",
+    summary="Get a time-ordered cutout cube for a source",
+    description=(
+        "Return every cutout for a source, optionally within a time window, "
+        "stacked into a (time, y, x) cube per band. HDF5 output uses chunked, "
+        "compressed datasets; FITS output uses an image extension per band with "
+        "a table of times and measurement IDs, optionally tile-compressed. "
+        "Requires scope lcs:read."
+    ),
+)
+@requires("lcs:read")
+async def cutouts_get_cube(
+    request: Request,
+    backend: DatabaseBackend,
+    workers: Workers,
+    source_id: UUID = FastAPIPath(..., description="Source identifier."),
+    ext: Literal["fits", "hdf5"] = Query("hdf5", description="Output format."),
+    start_time: datetime | None = Query(
+        None, description="ISO-8601 start of the time window (inclusive)."
+    ),
+    end_time: datetime | None = Query(
+        None, description="ISO-8601 end of the time window (inclusive)."
+    ),
+    selection_strategy: Literal["frequency", "instrument"] = Query(
+        "instrument",
+        description="Choose frequency- or instrument-selected bands.",
+    ),
+    compression_options: CompressionOptions = Depends(CompressionOptions),
+) -> StreamingResponse:
+    """
+    Assemble all cutouts for a source into per-band data cubes, streamed
+    back from a temporary file.
+    """
+
+    try:
+        lightcurve = await backend.lightcurves.get_source_lightcurve(
+            source_id=source_id, selection_strategy=selection_strategy
+        )
+    except SourceNotFoundException:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Cutout not found for flux measurement {measurement_id}",
+            detail=f"Source {source_id} not found or has no observations",
         )
 
-    numpy_buf = np.array(cutout.data)
-    if ext == "png":
-        with io.BytesIO() as output:
-            renderer.render(output, numpy_buf, render_options=render_options)
-            content = output.getvalue()
-            media_type = "image/png"
-    elif ext == "fits":
-        with io.BytesIO() as output:
-            hdu = fits.PrimaryHDU(data=numpy_buf)
-            hdu.writeto(output)
-            content = output.getvalue()
-            media_type = "image/fits"
-    elif ext == "hdf5":
-        with io.BytesIO() as output:
-            import h5py
+    start_time, end_time = _as_utc(start_time), _as_utc(end_time)
 
-            with h5py.File(output, "w") as f:
-                f.create_dataset("data", data=numpy_buf)
-            content = output.getvalue()
-            media_type = "application/x-hdf5"
-    return Response(
-        content=content,
-        media_type=media_type,
+    selected = {
+        str(band_name): [
+            CutoutIdentifier(source_id=source_id, measurement_id=measurement_id)
+            for measurement_id, time in zip(band.measurement_id, band.time)
+            if (start_time is None or time >= start_time)
+            and (end_time is None or time <= end_time)
+        ]
+        for band_name, band in lightcurve.lightcurves.items()
+    }
+
+    if sum(len(x) for x in selected.values()) > settings.cutout_cube_max_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=(
+                f"More than {settings.cutout_cube_max_size} cutouts requested, "
+                "please narrow the time window"
+            ),
+        )
+
+    retrieved = iter(
+        await retrieve_cutouts(
+            backend, [x for identifiers in selected.values() for x in identifiers]
+        )
+    )
+
+    bands = {}
+
+    for band_name, identifiers in selected.items():
+        cutouts = [c for _, c in zip(identifiers, retrieved) if c is not None]
+
+        if cutouts:
+            bands[band_name] = sorted(cutouts, key=lambda c: c.time)
+
+    if not bands:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No cutouts found for source {source_id} in this time window",
+        )
+
+    # Workers may be separate processes, so they write to a path rather than
+    # a handle. The file is unlinked as soon as we have it open.
+    descriptor, path = tempfile.mkstemp(suffix=f".{ext}")
+    os.close(descriptor)
+
+    try:
+        await workers.run(
+            write_cutout_cube,
+            bands,
+            ext=ext,
+            path=path,
+            compression_options=compression_options,
+        )
+        # Opened off the event loop; iterate_file closes it once sent.
+        handle = await asyncio.to_thread(open, path, "rb")
+    finally:
+        os.unlink(path)
+
+    return StreamingResponse(
+        iterate_file(handle),
+        media_type="image/fits" if ext == "fits" else "application/x-hdf5",
         headers={
-            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Disposition": (
+                f"attachment; filename=cutout_cube_source_{source_id}.{ext}"
+            ),
+            "Content-Length": str(file_size(handle)),
         },
     )
+
+
+_montage_builds: dict[tuple, asyncio.Future] = {}
+"Montages being built, by cache key, so that concurrent requests share one build."
+
+
+def _finish_montage_build(key: tuple):
+    """
+    Done callback for a montage build: forget it, and retrieve its
+    exception, which is otherwise logged as never retrieved if every
+    request waiting on the build has gone away.
+    """
+
+    def finish(build: asyncio.Future):
+        _montage_builds.pop(key, None)
+
+        if not build.cancelled():
+            build.exception()
+
+    return finish
+
+
+async def _build_montage(
+    backend: DatabaseBackend,
+    workers: Workers,
+    key: tuple,
+    start: int,
+    source_ids: list[UUID],
+    measurement_ids: list[UUID | None],
+    format: Literal["png", "webp"],
+    render_options: RenderOptions,
+) -> tuple[RenderedCutout, MontageIndex]:
+    """
+    Fetch the cutouts of a feed page, render them into a montage and its
+    index, and store both in the cutout cache under key.
+    """
+
+    cutouts = await retrieve_feed_page_cutouts(backend, source_ids, measurement_ids)
+
+    if not any(cutouts):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No cutouts found for the feed starting at {start}",
+        )
+
+    try:
+        content, media_type, tile_width, tile_height = await workers.run(
+            render_montage,
+            cutouts,
+            columns=settings.montage_columns,
+            format=format,
+            render_options=render_options,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    columns = settings.montage_columns
+    shapes = [np.shape(c.data) if c is not None else (0, 0) for c in cutouts]
+    index = MontageIndex(
+        start=start,
+        columns=columns,
+        rows=-(-len(cutouts) // columns),
+        tile_width=tile_width,
+        tile_height=tile_height,
+        tiles=[
+            MontageTile(
+                source_id=source_id,
+                measurement_id=cutout.measurement_id if cutout is not None else None,
+                x=(i % columns) * tile_width,
+                y=(i // columns) * tile_height,
+                width=shape[1],
+                height=shape[0],
+            )
+            for i, (source_id, cutout, shape) in enumerate(
+                zip(source_ids, cutouts, shapes)
+            )
+        ],
+    )
+    rendered = RenderedCutout(
+        content=content, media_type=media_type, etag=strong_etag(content)
+    )
+
+    cutout_cache.put(key, (rendered, index), size=len(content))
+
+    return rendered, index
+
+
+async def _feed_montage(
+    backend: DatabaseBackend,
+    workers: Workers,
+    feed: MaterializedFeed | None,
+    start: int,
+    format: Literal["png", "webp"],
+    render_options: RenderOptions,
+) -> tuple[RenderedCutout, MontageIndex]:
+    """
+    Get the montage, and its index, for a feed page from the cutout cache,
+    or build them. Montages are keyed on the measurements they show, which
+    are found without fetching any cutouts, so they go stale as soon as the
+    feed moves on and cache hits cost no pixel reads.
+    """
+
+    source_ids, measurement_ids = await feed_measurements(backend, start, feed)
+
+    if not any(measurement_ids):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No cutouts found for the feed starting at {start}",
+        )
+
+    key = (
+        "montage",
+        start,
+        tuple(source_ids),
+        tuple(measurement_ids),
+        settings.montage_columns,
+        format,
+        tuple(render_options.model_dump().values()),
+    )
+    cached = cutout_cache.get(key)
+
+    if cached is not None:
+        return cached
+
+    build = _montage_builds.get(key)
+
+    if build is None:
+        build = asyncio.ensure_future(
+            _build_montage(
+                backend,
+                workers,
+                key,
+                start=start,
+                source_ids=source_ids,
+                measurement_ids=measurement_ids,
+                format=format,
+                render_options=render_options,
+            )
+        )
+        _montage_builds[key] = build
+        build.add_done_callback(_finish_montage_build(key))
+
+    # Shielded so that one client going away does not cancel the build for
+    # the others waiting on it.
+    return await asyncio.shield(build)
+
+
+@cutouts_router.get(
+    "/feed/montage",
+    summary="Get a montage of the latest cutouts in a feed page",
+    description=(
+        "Return a single sprite image tiling the latest cutout of every source in "
+        "a page of the feed, rendered with shared normalization. Tile offsets are "
+        "available from /cutouts/feed/montage/index. Requires scope lcs:read."
+    ),
+)
+@requires("lcs:read")
+async def cutouts_get_feed_montage(
+    request: Request,
+    backend: DatabaseBackend,
+    workers: Workers,
+    feed: Feed,
+    start: int = Query(0, ge=0, description="Feed pagination offset (zero-based)."),
+    format: Literal["png", "webp"] = Query("png", description="Image format."),
+    render_options: RenderOptions = Depends(RenderOptions),
+) -> Response:
+    """
+    Return the montage image for a feed page.
+    """
+
+    rendered, _ = await _feed_montage(
+        backend,
+        workers,
+        feed,
+        start=start,
+        format=format,
+        render_options=render_options,
+    )
+    headers = {
+        "ETag": rendered.etag,
+        "Cache-Control": "private, no-cache",
+    }
+
+    if etag_matches(request, rendered.etag):
+        return not_modified(headers)
+
+    return Response(
+        content=rendered.content, media_type=rendered.media_type, headers=headers
+    )
+
+
+@cutouts_router.get(
+    "/feed/montage/index",
+    summary="Get the tile index for a feed montage",
+    description=(
+        "Return the position of each source's tile within the montage returned "
+        "by /cutouts/feed/montage for the same parameters. The index is cached "
+        "with the montage, so fetching both costs a single render. Requires "
+        "scope lcs:read."
+    ),
+)
+@requires("lcs:read")
+async def cutouts_get_feed_montage_index(
+    request: Request,
+    backend: DatabaseBackend,
+    workers: Workers,
+    feed: Feed,
+    start: int = Query(0, ge=0, description="Feed pagination offset (zero-based)."),
+    format: Literal["png", "webp"] = Query("png", description="Image format."),
+    render_options: RenderOptions = Depends(RenderOptions),
+) -> MontageIndex:
+    """
+    Return the tile index for a feed page's montage.
+    """
+
+    _, index = await _feed_montage(
+        backend,
+        workers,
+        feed,
+        start=start,
+        format=format,
+        render_options=render_options,
+    )
+
+    return index
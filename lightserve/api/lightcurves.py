@@ -2,11 +2,15 @@
 Endpoints for lightcurves
 """
 
-from datetime import datetime
-from typing import Literal
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Literal, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException, Path, Query, Request, status
+from fastapi import APIRouter, HTTPException, Path, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from lightcurvedb.client.source import source_read_in_radius
 from lightcurvedb.models.exceptions import SourceNotFoundException
 from lightcurvedb.models.lightcurves import (
     SourceLightcurveBinnedFrequency,
@@ -14,36 +18,197 @@ from lightcurvedb.models.lightcurves import (
     SourceLightcurveFrequency,
     SourceLightcurveInstrument,
 )
+from lightcurvedb.models.source import Source
+from pydantic import BaseModel, Field, model_validator
 
-from lightserve.database import DatabaseBackend
+from lightserve.database import DatabaseBackend, SpatialIndex, Workers
+from lightserve.processing.binning import (
+    BandArrays,
+    BinnedLightcurve,
+    bin_lightcurve,
+    lightcurve_arrays,
+)
+from lightserve.processing.cache import ByteBudgetLRUCache
+from lightserve.processing.downsampling import (
+    DownsamplingMethod,
+    downsample_lightcurve,
+    take_measurements,
+)
+from lightserve.processing.plotting import (
+    PLOT_MEDIA_TYPES,
+    PlotFormat,
+    render_lightcurve_plot,
+)
+from lightserve.processing.renderer import (
+    TABLE_MEDIA_TYPES,
+    TABLES_AVAILABLE,
+    LightcurveArchive,
+    encode_lightcurve_table,
+    iterate_lightcurve_csv,
+    iterate_lightcurve_hdf5,
+    select_bands,
+)
+from lightserve.processing.streaming import file_size, iterate_file
 
 from .auth import requires
+from .caching import (
+    etag_matches,
+    http_date,
+    not_modified,
+    strong_etag,
+    unmodified_since,
+    weak_etag,
+)
+from .serialization import TableFormat, model_response, resolve_format
+from .settings import settings
 
 lightcurves_router = APIRouter(prefix="/lightcurves", tags=["Lightcurves"])
 
+LightcurveFormat = TableFormat
+
+
+class ConeSelection(BaseModel):
+    ra: float
+    "Right ascension of the cone center in degrees (-180 to 180)."
+    dec: float
+    "Declination of the cone center in degrees (-90 to 90)."
+    radius: float = Field(ge=0.0)
+    "Cone radius in degrees."
+
+
+class LightcurveExportRequest(BaseModel):
+    source_ids: list[UUID] | None = Field(
+        default=None, min_length=1, max_length=settings.lightcurve_export_max_sources
+    )
+    "Sources to export."
+    cone: ConeSelection | None = None
+    "Export every source in this cone instead of a list of sources."
+    selection_strategy: Literal["frequency", "instrument"] = "instrument"
+    "Frequency- or instrument-selected lightcurve view."
+    band: list[str] | None = None
+    "Bands to include, by name; defaults to all bands."
+
+    @model_validator(mode="after")
+    def check_selection(self) -> "LightcurveExportRequest":
+        if (self.source_ids is None) == (self.cone is None):
+            raise ValueError("Give exactly one of source_ids or cone")
+
+        return self
+
+
+array_cache = ByteBudgetLRUCache(max_bytes=settings.lightcurve_array_cache_bytes)
+"Unbinned lightcurves as arrays, keyed on (source_id, selection_strategy), with the time they were fetched."
+
+
+async def _get_lightcurve_arrays(
+    backend: DatabaseBackend,
+    workers: Workers,
+    source_id: UUID,
+    selection_strategy: str,
+) -> dict[str, BandArrays]:
+    """
+    Get the unbinned lightcurve of a source as arrays, from the cache if
+    they were fetched within the last lightcurve_array_cache_ttl seconds.
+    """
+    key = (source_id, selection_strategy)
+    cached = array_cache.get(key)
+
+    if (
+        cached is not None
+        and time.monotonic() - cached[0] < settings.lightcurve_array_cache_ttl
+    ):
+        return cached[1]
+
+    lightcurve = await backend.lightcurves.get_source_lightcurve(
+        source_id=source_id, selection_strategy=selection_strategy
+    )
+    fetched = time.monotonic()
+    bands = await workers.run(lightcurve_arrays, select_bands(lightcurve.lightcurves))
+
+    array_cache.put(key, (fetched, bands), size=sum(x.nbytes for x in bands.values()))
+
+    return bands
+
+
+plot_cache = ByteBudgetLRUCache(max_bytes=settings.lightcurve_plot_cache_bytes)
+"Rendered plots and their ETags, keyed on source, latest measurement and plot options."
+
+
+async def _table_response(
+    workers: Workers,
+    lightcurve: Any,
+    format: str,
+    metadata: dict[str, str],
+    filename: str,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    """
+    Encode a lightcurve, with a row per measurement across all bands, as an
+    Arrow IPC stream or Parquet file.
+    """
+    content = await workers.run(
+        encode_lightcurve_table,
+        select_bands(lightcurve.lightcurves),
+        format=format,
+        metadata=metadata,
+    )
+
+    return Response(
+        content=content,
+        media_type=TABLE_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}.{format}",
+            "Vary": "Accept",
+            **(headers or {}),
+        },
+    )
+
 
 @lightcurves_router.get(
     "/{source_id}/unbinned",
     summary="Get unbinned lightcurve",
     description=(
         "Return an unbinned lightcurve for a source, using either frequency- or "
-        "instrument-selected views. Requires scope lcs:read."
+        "instrument-selected views. Returned as JSON by default, or as a single "
+        "Arrow IPC stream or Parquet table (with format, or through the Accept "
+        "header). With max_points, each band is downsampled for plotting to at "
+        "most that many measurements, keeping the shape of the curve (lttb) or "
+        "the extremes of every bucket (minmax). For polling, since returns only "
+        "newer measurements (pass back the X-Next-Since header of the previous "
+        "response), and If-None-Match or If-Modified-Since return 304 while no "
+        "measurements have been added. Requires scope lcs:read."
     ),
 )
 @requires("lcs:read")
 async def lightcurves_get_unbinned_lightcurve(
     request: Request,
     backend: DatabaseBackend,
+    workers: Workers,
     source_id: UUID = Path(..., description="Source identifier."),
     selection_strategy: Literal["frequency", "instrument"] = Query(
         "instrument",
         description="Choose frequency- or instrument-selected lightcurve view.",
     ),
+    since: Optional[datetime] = Query(
+        None,
+        description="Only return measurements taken after this ISO-8601 time.",
+    ),
+    max_points: Optional[int] = Query(
+        None, ge=4, description="Maximum number of measurements per band."
+    ),
+    downsampling: DownsamplingMethod = Query(
+        "lttb", description="Method used to downsample bands to max_points."
+    ),
+    format: Optional[LightcurveFormat] = Query(
+        None, description="Output format; negotiated if omitted."
+    ),
 ) -> SourceLightcurveFrequency | SourceLightcurveInstrument:
     """Return the lightcurve for a single band selection."""
 
+    format = resolve_format(request, format)
+
     try:
-        return await backend.lightcurves.get_source_lightcurve(
+        lightcurve = await backend.lightcurves.get_source_lightcurve(
             source_id=source_id, selection_strategy=selection_strategy
         )
     except SourceNotFoundException:
@@ -52,19 +217,84 @@ async def lightcurves_get_unbinned_lightcurve(
             detail=f"Source {source_id} not found or has no observations in this band",
         )
 
+    # The lightcurve only changes when measurements are added (or removed),
+    # so that is all the validators need to capture.
+    versions = [
+        (str(name), len(band.time), max(band.time, default=None))
+        for name, band in lightcurve.lightcurves.items()
+    ]
+    latest = max((x[2] for x in versions if x[2] is not None), default=None)
+
+    headers = {
+        "ETag": weak_etag(source_id, selection_strategy, format, versions),
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept",
+    }
+
+    if latest is not None:
+        headers["Last-Modified"] = http_date(latest)
+        headers["X-Next-Since"] = latest.isoformat()
+
+    if etag_matches(request, headers["ETag"]) or (
+        latest is not None and unmodified_since(request, latest)
+    ):
+        return not_modified(headers)
+
+    if since is not None:
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+
+        lightcurve = lightcurve.model_copy(
+            update={
+                "lightcurves": {
+                    name: take_measurements(
+                        band, (i for i, t in enumerate(band.time) if t > since)
+                    )
+                    for name, band in lightcurve.lightcurves.items()
+                }
+            }
+        )
+
+    if max_points is not None and any(
+        len(band.time) > max_points for band in lightcurve.lightcurves.values()
+    ):
+        lightcurve = await workers.run(
+            downsample_lightcurve, lightcurve, max_points, method=downsampling
+        )
+
+    if format in TABLE_MEDIA_TYPES:
+        return await _table_response(
+            workers,
+            lightcurve,
+            format=format,
+            metadata={
+                "source_id": str(source_id),
+                "selection_strategy": selection_strategy,
+            },
+            filename=f"lightcurve_source_{source_id}",
+            headers=headers,
+        )
+
+    return model_response(lightcurve, format, headers=headers)
+
 
 @lightcurves_router.get(
     "/{source_id}/binned",
     summary="Get binned lightcurve",
     description=(
         "Return a binned lightcurve for a source using a time binning strategy. "
-        "Requires scope lcs:read."
+        "Any other bin width can be given with bin_width, in which case each bin "
+        "holds the inverse-variance weighted mean flux, its uncertainty and the "
+        "number of measurements, with bins aligned to start_time. Returned as "
+        "JSON by default, or as a single Arrow IPC stream or Parquet table (with "
+        "format, or through the Accept header). Requires scope lcs:read."
     ),
 )
 @requires("lcs:read")
 async def lightcurves_get_binned_lightcurve(
     request: Request,
     backend: DatabaseBackend,
+    workers: Workers,
     source_id: UUID = Path(..., description="Source identifier."),
     start_time: datetime = Query(
         ..., description="ISO-8601 start time for the binning window."
@@ -80,89 +310,420 @@ async def lightcurves_get_binned_lightcurve(
         "7 days",
         description="Bin size for the lightcurve time series.",
     ),
-) -> SourceLightcurveBinnedFrequency | SourceLightcurveBinnedInstrument:
-    """Return a binned lightcurve for a single band selection."""
+    bin_width: Optional[timedelta] = Query(
+        None,
+        description=(
+            "Arbitrary bin width, as an ISO-8601 duration (e.g. PT1H, P3D); "
+            "overrides binning_strategy."
+        ),
+    ),
+    format: Optional[LightcurveFormat] = Query(
+        None, description="Output format; negotiated if omitted."
+    ),
+) -> (
+    SourceLightcurveBinnedFrequency
+    | SourceLightcurveBinnedInstrument
+    | BinnedLightcurve
+):
+    """
+    Return a binned lightcurve for a single band selection. The standard
+    bin widths are aggregated by the database; others are binned here from
+    the (cached) unbinned lightcurve.
+    """
+
+    format = resolve_format(request, format)
 
     try:
-        return await backend.lightcurves.get_binned_source_lightcurve(
-            source_id=source_id,
-            selection_strategy=selection_strategy,
-            binning_strategy=binning_strategy,
-            start_time=start_time,
-            end_time=end_time,
-        )
+        if bin_width is None:
+            lightcurve = await backend.lightcurves.get_binned_source_lightcurve(
+                source_id=source_id,
+                selection_strategy=selection_strategy,
+                binning_strategy=binning_strategy,
+                start_time=start_time,
+                end_time=end_time,
+            )
+        else:
+            bands = await _get_lightcurve_arrays(
+                backend, workers, source_id, selection_strategy
+            )
+            lightcurve = await workers.run(
+                bin_lightcurve,
+                source_id,
+                selection_strategy,
+                bands,
+                bin_width=bin_width,
+                start_time=start_time,
+                end_time=end_time,
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except SourceNotFoundException:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Source {source_id} not found or has no observations in this band",
         )
 
+    if format in TABLE_MEDIA_TYPES:
+        return await _table_response(
+            workers,
+            lightcurve,
+            format=format,
+            metadata={
+                "source_id": str(source_id),
+                "selection_strategy": selection_strategy,
+                "binning_strategy": (
+                    binning_strategy if bin_width is None else str(bin_width)
+                ),
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat(),
+            },
+            filename=f"lightcurve_binned_source_{source_id}",
+        )
+
+    return model_response(lightcurve, format, headers={"Vary": "Accept"})
+
+
+@lightcurves_router.get(
+    "/{source_id}/plot",
+    summary="Plot a lightcurve",
+    description=(
+        "Render a plot of a source's lightcurve, flux against time with error "
+        "bars and a colour per band by frequency, as PNG or SVG. Long bands are "
+        "downsampled for drawing. Plots are cached until new measurements "
+        "arrive. Requires scope lcs:read."
+    ),
+    response_class=Response,
+)
+@requires("lcs:read")
+async def lightcurves_get_plot(
+    request: Request,
+    backend: DatabaseBackend,
+    workers: Workers,
+    source_id: UUID = Path(..., description="Source identifier."),
+    selection_strategy: Literal["frequency", "instrument"] = Query(
+        "instrument",
+        description="Choose frequency- or instrument-selected lightcurve view.",
+    ),
+    format: PlotFormat = Query("png", description="Image format."),
+    width: int = Query(640, ge=64, le=2048, description="Width in pixels."),
+    height: int = Query(360, ge=64, le=2048, description="Height in pixels."),
+) -> Response:
+    """
+    Return a plot of the lightcurve, rendered in the worker pool from the
+    (cached) lightcurve arrays.
+    """
+
+    try:
+        bands = await _get_lightcurve_arrays(
+            backend, workers, source_id, selection_strategy
+        )
+    except SourceNotFoundException:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Source {source_id} not found or has no observations",
+        )
+
+    latest = max((x.time[-1] for x in bands.values() if len(x.time)), default=None)
+
+    if latest is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Source {source_id} has no observations",
+        )
+
+    key = (source_id, selection_strategy, float(latest), format, width, height)
+    cached = plot_cache.get(key)
+
+    if cached is None:
+        content = await workers.run(
+            render_lightcurve_plot,
+            bands,
+            format=format,
+            width=width,
+            height=height,
+            max_points=settings.lightcurve_plot_max_points,
+        )
+        cached = (content, strong_etag(content))
+        plot_cache.put(key, cached, size=len(content))
+
+    content, etag = cached
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Last-Modified": http_date(datetime.fromtimestamp(latest, tz=timezone.utc)),
+    }
+
+    if etag_matches(request, etag):
+        return not_modified(headers)
+
+    return Response(
+        content=content, media_type=PLOT_MEDIA_TYPES[format], headers=headers
+    )
+
+
+@lightcurves_router.get(
+    "/{source_id}/download",
+    summary="Download a lightcurve",
+    description=(
+        "Stream a lightcurve for a source as CSV (one row per measurement, with a "
+        "final band column) or HDF5 (a group per band). Requires scope lcs:read."
+    ),
+)
+@requires("lcs:read")
+async def lightcurves_download(
+    request: Request,
+    backend: DatabaseBackend,
+    source_id: UUID = Path(..., description="Source identifier."),
+    format: Literal["csv", "hdf5"] = Query("hdf5", description="Output format."),
+    selection_strategy: Literal["frequency", "instrument"] = Query(
+        "instrument",
+        description="Choose frequency- or instrument-selected lightcurve view.",
+    ),
+    band: list[str] | None = Query(
+        None, description="Bands to include, by name; defaults to all bands."
+    ),
+) -> StreamingResponse:
+    """
+    Return the lightcurve in CSV or HDF5 format, depending on user choice.
+    Files are generated as they are sent, so memory use does not grow with
+    the length of the lightcurve.
+    """
+
+    try:
+        lightcurve = await backend.lightcurves.get_source_lightcurve(
+            source_id=source_id, selection_strategy=selection_strategy
+        )
+    except SourceNotFoundException:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Source {source_id} not found or has no observations",
+        )
+
+    bands = select_bands(lightcurve.lightcurves, band)
+
+    if not bands:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Source {source_id} has no observations in bands {band}",
+        )
+
+    if format == "csv":
+        content = iterate_lightcurve_csv(bands)
+        media_type = "text/csv"
+    else:
+        source = await backend.sources.get(source_id=source_id)
+        content = iterate_lightcurve_hdf5(bands, source)
+        media_type = "application/x-hdf5"
+
+    filename = f"lightcurve_source_{source_id}.{format}"
+
+    # Iterated in a thread by the response, so formatting never blocks the
+    # event loop.
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+async def _select_export_sources(
+    backend: DatabaseBackend,
+    index: SpatialIndex,
+    export: LightcurveExportRequest,
+) -> list[Source | UUID]:
+    """
+    Sources to export: those in the cone (from the source index, if it is
+    loaded), or else the requested IDs, which are looked up as their
+    lightcurves are fetched.
+    """
+    if export.cone is None:
+        return list(dict.fromkeys(export.source_ids))
+
+    try:
+        if index is not None:
+            sources, _ = index.cone(
+                ra=export.cone.ra, dec=export.cone.dec, radius=export.cone.radius
+            )
+        else:
+            sources = await source_read_in_radius(
+                center=(export.cone.ra, export.cone.dec),
+                radius=export.cone.radius,
+                backend=backend,
+            )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid parameters for cone search",
+        )
+
+    if len(sources) > settings.lightcurve_export_max_sources:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=(
+                f"Cone contains {len(sources)} sources, more than the "
+                f"{settings.lightcurve_export_max_sources} allowed in one export"
+            ),
+        )
+
+    return sources
+
+
+async def _write_archive(workers: Workers, function, *args):
+    """
+    Run a write to an archive in the worker pool, and, if cancelled, wait
+    for it to finish before re-raising: the thread it runs in cannot be
+    stopped, and must be done with the archive before it is closed.
+    """
+    write = asyncio.ensure_future(workers.run_local(function, *args))
+
+    try:
+        return await asyncio.shield(write)
+    except asyncio.CancelledError:
+        await asyncio.wait([write])
+        # Retrieved so that a failed write is not reported as unhandled.
+        write.exception()
+        raise
+
+
+async def write_lightcurve_archive(
+    backend: DatabaseBackend,
+    workers: Workers,
+    archive: LightcurveArchive,
+    sources: list[Source | UUID],
+    selection_strategy: str,
+    band: list[str] | None,
+) -> int:
+    """
+    Fetch the lightcurves of many sources concurrently, with at most
+    lightcurve_export_concurrency in flight, writing each to the archive as
+    it arrives. A slot is only freed once its lightcurve has been written,
+    so at most that many lightcurves are held in memory at once. Sources
+    without observations are recorded as missing. Writes go through the
+    worker pool, in this process as the archive is an open file.
+
+    Returns
+    -------
+    int
+        Number of sources written.
+    """
+
+    semaphore = asyncio.Semaphore(settings.lightcurve_export_concurrency)
+    # Archives are written to from one thread at a time.
+    lock = asyncio.Lock()
+    written = 0
+
+    async def export(source: Source | UUID):
+        nonlocal written
+
+        source_id = source.source_id if isinstance(source, Source) else source
+
+        async with semaphore:
+            try:
+                if not isinstance(source, Source):
+                    source = await backend.sources.get(source_id=source_id)
+
+                lightcurve = await backend.lightcurves.get_source_lightcurve(
+                    source_id=source_id, selection_strategy=selection_strategy
+                )
+            except SourceNotFoundException:
+                archive.missing.append(str(source_id))
+                return
+
+            bands = select_bands(lightcurve.lightcurves, band)
+
+            if not bands:
+                archive.missing.append(str(source_id))
+                return
+
+            async with lock:
+                await _write_archive(workers, archive.add, source, bands)
+                written += 1
+
+    tasks = [asyncio.ensure_future(export(x)) for x in sources]
+
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # E.g. the pool is full: stop the remaining fetches before the
+        # archive is closed.
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    return written
+
+
+@lightcurves_router.post(
+    "/export",
+    summary="Export many lightcurves",
+    description=(
+        "Export the lightcurves of a list of sources, or of every source in a "
+        "cone, as a single HDF5 file (a group per source, each with a group per "
+        "band) or Parquet file (a row per measurement, with source_id and band "
+        "columns). Sources without observations are listed in the file's "
+        "missing_source_ids metadata. Requires scope lcs:read."
+    ),
+)
+@requires("lcs:read")
+async def lightcurves_export(
+    request: Request,
+    backend: DatabaseBackend,
+    workers: Workers,
+    index: SpatialIndex,
+    export: LightcurveExportRequest,
+    format: Literal["hdf5", "parquet"] = Query("hdf5", description="Output format."),
+) -> StreamingResponse:
+    """
+    Export the lightcurves of many sources in one file. The file is built
+    (spooling to disk if it gets large) before it is sent.
+    """
+
+    if format == "parquet" and not TABLES_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail="parquet output requires pyarrow (install lightserve[arrow])",
+        )
+
+    sources = await _select_export_sources(backend, index, export)
+
+    metadata = {"selection_strategy": export.selection_strategy}
+
+    if export.cone is not None:
+        metadata.update({k: str(v) for k, v in export.cone.model_dump().items()})
+
+    archive = LightcurveArchive(format, metadata=metadata)
+
+    try:
+        written = await write_lightcurve_archive(
+            backend,
+            workers,
+            archive,
+            sources,
+            selection_strategy=export.selection_strategy,
+            band=export.band,
+        )
+
+        if not written:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="None of the selected sources have observations",
+            )
+
+        handle = await _write_archive(workers, archive.finish)
+    except BaseException:
+        archive.close()
+        raise
 
-# @lightcurves_router.get("/{source_id}/{band_name}/download")
-# @requires("lcs:read")
-# async def lightcurve_download(
-#     request: Request,
-#     source_id: int,
-#     band_name: str,
-#     conn: AsyncSessionDependency,
-#     format: Literal["csv", "hdf5"] = "hdf5",
-# ) -> Response:
-#     """
-#     Return the lightcurves in CSV or HDF5 format, depending on user choice.
-#     """
-#     try:
-#         if band_name == "all":
-#             lightcurve_data = await lightcurve_read_source(id=source_id, conn=conn)
-#             filename = f"lightcurve_source_{source_id}_all_bands.{format}"
-#         else:
-#             lightcurve_data = await lightcurve_read_band(
-#                 id=source_id, band_name=band_name, conn=conn
-#             )
-#             filename = f"lightcurve_source_{source_id}_band_{band_name}.{format}"
-#     except SourceNotFound:
-#         raise HTTPException(
-#             status_code=status.HTTP_404_NOT_FOUND,
-#             detail=f"Source {source_id} not found or has no observations in this band",
-#         )
-#     except BandNotFound:
-#         raise HTTPException(
-#             status_code=status.HTTP_404_NOT_FOUND, detail=f"Band {band_name} not found"
-#         )
-
-#     if format == "csv":
-#         with io.StringIO() as buffer:
-#             if band_name == "all":
-#                 _transform_lc_to_csv(lightcurve=lightcurve_data, handle=buffer)
-#             else:
-#                 _transform_band_lc_to_csv(
-#                     lightcurve_band=lightcurve_data, handle=buffer
-#                 )
-
-#             return Response(
-#                 content=buffer.getvalue(),
-#                 media_type="text/csv",
-#                 headers={
-#                     "Content-Disposition": f"attachment; filename={filename}",
-#                 },
-#             )
-#     elif format == "hdf5":
-#         with io.BytesIO() as buffer:
-#             if band_name == "all":
-#                 _transform_lc_to_hdf5(lightcurve=lightcurve_data, handle=buffer)
-#             else:
-#                 _transform_band_lc_to_hdf5(
-#                     lightcurve_band=lightcurve_data, handle=buffer
-#                 )
-
-#             return Response(
-#                 content=buffer.getvalue(),
-#                 media_type="application/x-hdf5",
-#                 headers={
-#                     "Content-Disposition": f"attachment; filename={filename}",
-#                 },
-#             )
-#     else:
-#         raise HTTPException(
-#             status_code=status.HTTP_400_BAD_REQUEST,
-#             detail=f"Unsupported format: {format}. Supported formats are 'csv' and 'hdf5'",
-#         )
+    return StreamingResponse(
+        iterate_file(handle),
+        media_type=(
+            "application/x-hdf5" if format == "hdf5" else TABLE_MEDIA_TYPES[format]
+        ),
+        headers={
+            "Content-Disposition": f"attachment; filename=lightcurves.{format}",
+            "Content-Length": str(file_size(handle)),
+        },
+    )
@@ -0,0 +1,98 @@
+"""
+Helpers for choosing a response format from the Accept header.
+"""
+
+from fastapi import HTTPException, Request, status
+
+
+def parse_accept(header: str) -> list[tuple[str, float]]:
+    """
+    Parse an Accept header into (media range, quality) pairs. Media type
+    parameters other than q are ignored, as are malformed entries.
+    """
+    ranges = []
+
+    for entry in header.split(","):
+        media_range, *parameters = (x.strip() for x in entry.split(";"))
+
+        if "/" not in media_range:
+            continue
+
+        quality = 1.0
+
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+
+            if name.strip().lower() == "q":
+                try:
+                    quality = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    quality = 0.0
+
+        ranges.append((media_range.lower(), quality))
+
+    return ranges
+
+
+def _quality(media_type: str, ranges: list[tuple[str, float]]) -> float:
+    """
+    Quality the client gives a media type, taken from the most specific
+    matching range.
+    """
+    kind = media_type.split("/")[0]
+    best, specificity = 0.0, -1
+
+    for media_range, quality in ranges:
+        if media_range == media_type:
+            matched = 2
+        elif media_range == f"{kind}/*":
+            matched = 1
+        elif media_range == "*/*":
+            matched = 0
+        else:
+            continue
+
+        if matched > specificity:
+            best, specificity = quality, matched
+
+    return best
+
+
+def negotiate(request: Request, offers: list[str]) -> str:
+    """
+    Choose the media type to respond with.
+
+    Parameters
+    ----------
+    request : Request
+        Incoming request; its Accept header is used.
+    offers : list[str]
+        Media types we can produce, in order of preference. Ties in the
+        client's quality values go to the earlier offer.
+
+    Returns
+    -------
+    str
+        The chosen media type; the first offer if there is no Accept header.
+
+    Raises
+    ------
+    HTTPException
+        406 if the client accepts none of the offers.
+    """
+    header = request.headers.get("accept")
+
+    if not header:
+        return offers[0]
+
+    ranges = parse_accept(header)
+    scored = [(_quality(offer, ranges), -index) for index, offer in enumerate(offers)]
+    quality, index = max(scored)
+
+    if quality <= 0.0:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"Unable to produce any of: {header}. Available: {', '.join(offers)}",
+        )
+
+    return offers[-index]
@@ -0,0 +1,129 @@
+"""
+Fast serialization of large responses.
+
+Returning a model from an endpoint has FastAPI validate it against the
+response model, and then encode it (through jsonable_encoder and
+json.dumps in older releases, or through a serializer for the whole
+response union in newer ones). Our responses are already validated models,
+so the endpoints here serialize them directly with pydantic-core instead,
+and return the bytes. The declared response models still document the
+endpoints.
+
+MessagePack is offered as well, through the Accept header, when the
+optional msgpack dependency (the `msgpack` extra) is installed. It carries
+the same structure as the JSON, with times as ISO-8601 strings. Endpoints
+that return tables can also offer Arrow and Parquet (`resolve_format`).
+"""
+
+import importlib.util
+from functools import lru_cache
+from typing import Any, Literal
+
+from fastapi import HTTPException, Request, Response, status
+from pydantic import TypeAdapter
+
+from lightserve.processing.renderer import TABLE_MEDIA_TYPES, TABLES_AVAILABLE
+
+from .negotiation import negotiate
+
+SerializationFormat = Literal["json", "msgpack"]
+TableFormat = Literal["json", "msgpack", "arrow", "parquet"]
+
+SERIALIZATION_MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+}
+"Media types of the formats that models can be serialized to."
+
+MSGPACK_AVAILABLE = importlib.util.find_spec("msgpack") is not None
+"Whether msgpack is installed, and so MessagePack output is available."
+
+
+def serialization_offers() -> dict[str, str]:
+    """
+    Media types that responses can be serialized to, by format, preferred
+    (JSON) first.
+    """
+    if MSGPACK_AVAILABLE:
+        return dict(SERIALIZATION_MEDIA_TYPES)
+
+    return {"json": SERIALIZATION_MEDIA_TYPES["json"]}
+
+
+def negotiate_serialization(request: Request) -> SerializationFormat:
+    """
+    Pick JSON or MessagePack from the Accept header, preferring JSON.
+    """
+    offers = serialization_offers()
+    media_type = negotiate(request, list(offers.values()))
+
+    return next(k for k, v in offers.items() if v == media_type)
+
+
+def resolve_format(request: Request, format: TableFormat | None) -> str:
+    """
+    Pick the output format of an endpoint that can return tables: the one
+    asked for, or else one negotiated from the Accept header, preferring
+    JSON. MessagePack is only offered when msgpack is installed, and Arrow
+    and Parquet when pyarrow is.
+    """
+    offers = serialization_offers()
+
+    if TABLES_AVAILABLE:
+        offers.update(TABLE_MEDIA_TYPES)
+
+    if format is None:
+        media_type = negotiate(request, list(offers.values()))
+        return next(k for k, v in offers.items() if v == media_type)
+
+    if format not in offers:
+        extra = "msgpack" if format == "msgpack" else "arrow"
+
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"{format} output requires the {extra} extra (lightserve[{extra}])",
+        )
+
+    return format
+
+
+@lru_cache
+def _adapter(annotation: Any) -> TypeAdapter:
+    return TypeAdapter(annotation)
+
+
+def serialize(value: Any, format: SerializationFormat, annotation: Any = None) -> bytes:
+    """
+    Serialize a model, or a value of the given type (e.g. a list of
+    models), to JSON or MessagePack bytes. Models are serialized as their
+    own type, rather than as the response union they belong to.
+    """
+    adapter = _adapter(annotation if annotation is not None else type(value))
+
+    if format == "json":
+        return adapter.dump_json(value)
+
+    python = adapter.dump_python(value, mode="json")
+
+    if format != "msgpack":
+        raise ValueError(f"Unsupported serialization format {format}")
+
+    import msgpack
+
+    return msgpack.packb(python)
+
+
+def model_response(
+    value: Any,
+    format: SerializationFormat = "json",
+    annotation: Any = None,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    """
+    Build a response holding a serialized model (see :func:`serialize`).
+    """
+    return Response(
+        content=serialize(value, format, annotation),
+        media_type=SERIALIZATION_MEDIA_TYPES[format],
+        headers=headers,
+    )
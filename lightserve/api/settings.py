@@ -2,6 +2,9 @@
 Settings for the project.
 """
 
+from pathlib import Path
+from typing import Literal
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -22,6 +25,91 @@ class Settings(BaseSettings):
     feed_frequency: int = 145
     "Band information to use for feeds"
 
+    feed_materialize: bool = True
+    "Keep precomputed feed rankings in memory, served by /sources/feed/page."
+    feed_frequencies: list[int] | None = None
+    "Frequencies to keep materialized feeds for; defaults to feed_frequency alone."
+    feed_max_items: int = 4096
+    "Number of top-ranked sources kept in each materialized feed."
+    feed_refresh_interval: int = 60
+    "Seconds between re-reads of the materialized feeds."
+    feed_page_size: int = 16
+    feed_page_max_size: int = 256
+    "Default and largest number of sources in a page of the materialized feed."
+
+    cutout_cache_bytes: int = 256 * 1024 * 1024
+    "Memory ceiling for the in-process cache of rendered cutouts; zero disables it."
+    thumbnail_cache_bytes: int = 64 * 1024 * 1024
+    "Memory ceiling for the separate cache of resampled (thumbnail) cutouts."
+    render_limits_cache_entries: int = 65536
+    "Number of automatically scaled render ranges to remember, one per cutout and scaling."
+    cutout_cache_max_age: int = 86400
+    "Cache-Control max-age, in seconds, sent with cutout responses."
+
+    cutout_disk_cache_directory: Path | None = None
+    "Directory of the persistent cache of pre-rendered cutouts, shared with lightgest; None disables it."
+    cache_warm_formats: list[Literal["webp", "png"]] = ["webp", "png"]
+    cache_warm_thumbnail_sizes: list[int] = [128]
+    "Image formats, and thumbnail sizes (as well as full size), pre-rendered with default options when warming the disk cache."
+    cache_warm_feed_pages: int = 4
+    "Number of feed pages that the lightserve-warm command warms by default."
+
+    png_compress_level: int = 6
+    "zlib compression level (0-9) for PNG images; higher is smaller but slower."
+    webp_lossless: bool = True
+    webp_quality: int = 90
+    webp_method: int = 4
+    "WebP encoder settings: lossless or lossy, quality (0-100; effort when lossless) and method (0-6, speed/size trade-off)."
+
+    worker_pool_kind: Literal["thread", "process"] = "thread"
+    worker_pool_size: int = 4
+    worker_pool_queue_size: int = 64
+    "Pool used for CPU-bound rendering and encoding; work beyond size + queue_size is rejected with a 503."
+
+    cutout_batch_max_size: int = 256
+    cutout_batch_concurrency: int = 8
+    "Maximum number of cutouts in one batch request, and how many are fetched from the backend at once."
+
+    cutout_cube_max_size: int = 4096
+    "Maximum number of cutouts assembled into a single data cube."
+
+    lightcurve_array_cache_bytes: int = 256 * 1024 * 1024
+    "Memory ceiling for the cache of unbinned lightcurve arrays used for in-process binning."
+    lightcurve_array_cache_ttl: int = 300
+    "Seconds that cached lightcurve arrays are used for before being refetched, so new observations appear."
+
+    lightcurve_plot_cache_bytes: int = 64 * 1024 * 1024
+    "Memory ceiling for the cache of rendered lightcurve plots."
+    lightcurve_plot_max_points: int = 2000
+    "Bands with more measurements than this are downsampled before plotting."
+
+    lightcurve_export_max_sources: int = 10000
+    lightcurve_export_concurrency: int = 8
+    "Maximum number of sources in one bulk lightcurve export, and how many lightcurves are fetched from the backend at once."
+
+    source_index_enable: bool = True
+    "Keep an in-memory spatial index of the source catalog for cone searches, instead of querying the database."
+    source_index_zone_height: float = 0.25
+    "Height in degrees of the declination zones of the source index; around the typical search radius is best."
+    source_catalog_enable: bool = True
+    "Keep an in-memory snapshot of the source catalog, ordered by ID, for paginated listing."
+    source_refresh_interval: int = 60
+    "Seconds between re-reads of the source catalog, to pick up new sources in the index and snapshot."
+    source_page_size: int = 1000
+    source_page_max_size: int = 10000
+    "Default and largest number of sources in a page of the source listing."
+    crossmatch_max_rows: int = 1_000_000
+    crossmatch_max_upload_bytes: int = 256 * 1024 * 1024
+    "Largest position table, in rows and in bytes, accepted for a bulk cross-match."
+    crossmatch_max_radius: float = 1.0
+    "Largest cross-match radius in degrees."
+
+    montage_columns: int = 4
+    "Number of tiles per row in feed montages."
+    montage_measurement_cache_entries: int = 4096
+    montage_measurement_cache_ttl: int = 60
+    "Number of feed sources whose latest measurement is remembered for montages, and for how many seconds."
+
     auth_system: str | None = None
 
     soauth_service_url: str | None = None
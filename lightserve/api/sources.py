@@ -2,9 +2,12 @@
 API for getting source information.
 """
 
+from datetime import datetime
+from typing import Iterator, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException, Path, Query, Request, status
+from fastapi import APIRouter, HTTPException, Path, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from lightcurvedb.client.feed import feed_read
 from lightcurvedb.client.source import (
     source_read_in_radius,
@@ -13,20 +16,109 @@ from lightcurvedb.models.exceptions import SourceNotFoundException
 from lightcurvedb.models.feed import FeedResult
 from lightcurvedb.models.source import Source
 from lightcurvedb.models.statistics import SourceStatistics
+from pydantic import BaseModel
 
-from lightserve.database import DatabaseBackend
+from lightserve.database import (
+    CatalogSnapshot,
+    DatabaseBackend,
+    Feed,
+    SpatialIndex,
+    Workers,
+)
+from lightserve.feed import FeedCursor
+from lightserve.processing.catalog import SourceCatalog
+from lightserve.processing.crossmatch import (
+    POSITION_MEDIA_TYPES,
+    crossmatch_positions,
+    encode_crossmatch_table,
+)
+from lightserve.processing.renderer import TABLE_MEDIA_TYPES, TABLES_AVAILABLE
 
 from .auth import requires
+from .serialization import (
+    TableFormat,
+    model_response,
+    negotiate_serialization,
+    resolve_format,
+    serialize,
+)
 from .settings import settings
 
 sources_router = APIRouter(prefix="/sources", tags=["Sources"])
 
 
+class SourcePage(BaseModel):
+    sources: list[Source]
+    "Sources in this page, ordered by source ID."
+    next: UUID | None
+    "Cursor for the next page (pass as after), or None if this is the last."
+
+
+FeedItems = FeedResult.model_fields["items"].annotation
+"Type of the items of a feed, as returned by lightcurvedb."
+
+
+class FeedPage(BaseModel):
+    frequency: int
+    "Frequency, in GHz, of the feed."
+    items: FeedItems
+    "Sources in this page, in feed order."
+    next: str | None
+    "Cursor for the next page, or None if this is the last."
+    total: int | None
+    "Number of sources in the feed, when it is materialized."
+    refreshed_at: datetime | None
+    "When the feed ranking was computed, when it is materialized."
+
+
+class CrossmatchResult(BaseModel):
+    radius: float
+    "Match radius in degrees."
+    row: list[int]
+    "Row numbers, from zero, of the uploaded positions that have a match."
+    source_id: list[UUID]
+    "ID of the nearest source to each matched position."
+    ra: list[float]
+    "Right ascension of each matched source in degrees."
+    dec: list[float]
+    "Declination of each matched source in degrees."
+    separation: list[float]
+    "Separation of each position from its source in degrees."
+
+
+async def _catalog(backend: DatabaseBackend, catalog: CatalogSnapshot) -> SourceCatalog:
+    """
+    The in-memory catalog snapshot, or, if it is not loaded, one read from
+    the database for this request.
+    """
+    if catalog is not None:
+        return catalog
+
+    return SourceCatalog(await backend.sources.get_all())
+
+
+def iterate_sources_ndjson(
+    catalog: SourceCatalog, after: UUID | None, page_size: int
+) -> Iterator[bytes]:
+    """
+    Stream a catalog as newline-delimited JSON, one source per line, a page
+    at a time.
+    """
+    while True:
+        sources, after = catalog.page(after, page_size)
+
+        if sources:
+            yield b"".join(serialize(x, "json", Source) + b"\n" for x in sources)
+
+        if after is None:
+            return
+
+
 @sources_router.get(
     "/cone",
     summary="Search sources in a cone",
     description=(
-        "Return sources within a cone search radius in degrees. "
+        "Return sources within a cone search radius in degrees, nearest first. "
         "Requires scope lcs:read."
     ),
 )
@@ -34,26 +126,171 @@ sources_router = APIRouter(prefix="/sources", tags=["Sources"])
 async def sources_get_in_cone(
     request: Request,
     backend: DatabaseBackend,
+    index: SpatialIndex,
     ra: float = Query(..., description="Right ascension in degrees (-180 to 180)."),
     dec: float = Query(..., description="Declination in degrees (-90 to 90)."),
     radius: float = Query(..., description="Cone radius in degrees (>= 0)."),
 ) -> list[Source]:
     """
-    Get the sources that are within a square cone around a specific right
+    Get the sources that are within a cone around a specific right
     ascention and declination. All values are in degrees, with
-    -180 < ra < 180, -90 < dec < 90, radius >= 0.
+    -180 < ra < 180, -90 < dec < 90, radius >= 0. Answered from the
+    in-memory source index, as a true great-circle cone, when it is
+    loaded; otherwise by the database, as a square cone.
     """
 
+    format = negotiate_serialization(request)
+
     try:
-        return await source_read_in_radius(
-            center=(ra, dec), radius=radius, backend=backend
-        )
+        if index is not None:
+            sources, _ = index.cone(ra=ra, dec=dec, radius=radius)
+        else:
+            sources = await source_read_in_radius(
+                center=(ra, dec), radius=radius, backend=backend
+            )
     except ValueError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid parameters for cone search",
         )
 
+    return model_response(
+        sources, format, annotation=list[Source], headers={"Vary": "Accept"}
+    )
+
+
+async def _read_upload(request: Request, max_bytes: int) -> bytes:
+    """
+    Read a request body, giving up with 413 once it is larger than
+    max_bytes.
+    """
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Uploads are limited to {max_bytes} bytes",
+        )
+
+    chunks, size = [], 0
+
+    async for chunk in request.stream():
+        size += len(chunk)
+
+        if size > max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Uploads are limited to {max_bytes} bytes",
+            )
+
+        chunks.append(chunk)
+
+    return b"".join(chunks)
+
+
+@sources_router.post(
+    "/crossmatch",
+    summary="Cross-match a table of positions",
+    description=(
+        "Upload a table of positions (CSV, Arrow IPC stream or Parquet, given by "
+        "Content-Type, with ra and dec columns in degrees) and get the nearest "
+        "source within the match radius of each, with the separations. Returned "
+        "as JSON (columns of matched rows) by default, or as Arrow or Parquet "
+        "(with format, or through the Accept header). Needs the in-memory source "
+        "index. Requires scope lcs:read."
+    ),
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                media_type: {"schema": {"type": "string", "format": "binary"}}
+                for media_type in POSITION_MEDIA_TYPES.values()
+            },
+        }
+    },
+)
+@requires("lcs:read")
+async def sources_crossmatch(
+    request: Request,
+    workers: Workers,
+    index: SpatialIndex,
+    radius: float = Query(
+        ...,
+        ge=0.0,
+        le=settings.crossmatch_max_radius,
+        description="Match radius in degrees.",
+    ),
+    format: Optional[TableFormat] = Query(
+        None, description="Output format; negotiated from Accept if not given."
+    ),
+) -> CrossmatchResult:
+    """
+    Cross-match uploaded positions against the catalog with the in-memory
+    spatial index; unavailable (503) if the index is disabled or failed to
+    load. Matching runs in the worker pool, but in this process, as the
+    index is not sent to worker processes.
+    """
+    format = resolve_format(request, format)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    upload = next(
+        (k for k, v in POSITION_MEDIA_TYPES.items() if v == content_type.lower()),
+        None,
+    )
+
+    if upload is None or (upload != "csv" and not TABLES_AVAILABLE):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=(
+                f"Unsupported position table type {content_type or 'none'}; "
+                "Arrow and Parquet uploads require the arrow extra"
+            ),
+        )
+
+    if index is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Cross-matching needs the in-memory source index, which is not loaded",
+        )
+
+    data = await _read_upload(request, settings.crossmatch_max_upload_bytes)
+
+    try:
+        matches = await workers.run_local(
+            crossmatch_positions,
+            index,
+            data,
+            upload,
+            radius,
+            max_rows=settings.crossmatch_max_rows,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if format in TABLE_MEDIA_TYPES:
+        content = await workers.run(
+            encode_crossmatch_table, matches, format, metadata={"radius": str(radius)}
+        )
+
+        return Response(
+            content=content,
+            media_type=TABLE_MEDIA_TYPES[format],
+            headers={
+                "Content-Disposition": f"attachment; filename=crossmatch.{format}",
+                "Vary": "Accept",
+            },
+        )
+
+    return model_response(
+        CrossmatchResult(
+            radius=radius,
+            row=matches.row.tolist(),
+            source_id=matches.source_id,
+            ra=matches.ra.tolist(),
+            dec=matches.dec.tolist(),
+            separation=matches.separation.tolist(),
+        ),
+        format,
+        headers={"Vary": "Accept"},
+    )
+
 
 @sources_router.get(
     "/",
@@ -67,7 +304,80 @@ async def sources_get_list(request: Request, backend: DatabaseBackend) -> list[S
     (e.g. their position on sky).
     """
 
-    return await backend.sources.get_all()
+    format = negotiate_serialization(request)
+    sources = await backend.sources.get_all()
+
+    return model_response(
+        sources, format, annotation=list[Source], headers={"Vary": "Accept"}
+    )
+
+
+@sources_router.get(
+    "/page",
+    summary="List sources a page at a time",
+    description=(
+        "Return a page of sources, ordered by source ID, and the cursor for the "
+        "next page. Requires scope lcs:read."
+    ),
+)
+@requires("lcs:read")
+async def sources_get_page(
+    request: Request,
+    backend: DatabaseBackend,
+    catalog: CatalogSnapshot,
+    after: UUID | None = Query(
+        None, description="Cursor from the previous page; omit for the first page."
+    ),
+    limit: int = Query(
+        settings.source_page_size,
+        ge=1,
+        le=settings.source_page_max_size,
+        description="Maximum number of sources in the page.",
+    ),
+) -> SourcePage:
+    """
+    Get a page of the source list. Pages are keyed on the last source ID of
+    the previous page, rather than an offset, so they remain consistent as
+    sources are added.
+    """
+
+    format = negotiate_serialization(request)
+    sources, next = (await _catalog(backend, catalog)).page(after, limit)
+
+    return model_response(
+        SourcePage(sources=sources, next=next), format, headers={"Vary": "Accept"}
+    )
+
+
+@sources_router.get(
+    "/stream",
+    summary="Stream all sources",
+    description=(
+        "Stream the whole source list, ordered by source ID, as newline-delimited "
+        "JSON with one source per line. Requires scope lcs:read."
+    ),
+    response_class=StreamingResponse,
+)
+@requires("lcs:read")
+async def sources_get_stream(
+    request: Request,
+    backend: DatabaseBackend,
+    catalog: CatalogSnapshot,
+    after: UUID | None = Query(
+        None, description="Resume after this source ID (the last one received)."
+    ),
+) -> StreamingResponse:
+    """
+    Stream the source list. Sources are serialized a page at a time as they
+    are sent, so neither side needs to hold the whole list as JSON.
+    """
+
+    return StreamingResponse(
+        iterate_sources_ndjson(
+            await _catalog(backend, catalog), after, settings.source_page_size
+        ),
+        media_type="application/x-ndjson",
+    )
 
 
 @sources_router.get(
@@ -95,6 +405,72 @@ async def sources_get_feed(
     return result
 
 
+@sources_router.get(
+    "/feed/page",
+    summary="Get a page of the source feed",
+    description=(
+        "Return a page of the source feed for a frequency, served from a ranking "
+        "that is precomputed periodically, and the cursor for the next page. "
+        "Paging with cursors sees one consistent ranking, even across refreshes. "
+        "Requires scope lcs:read."
+    ),
+)
+@requires("lcs:read")
+async def sources_get_feed_page(
+    request: Request,
+    backend: DatabaseBackend,
+    feed: Feed,
+    frequency: int = Query(
+        settings.feed_frequency, description="Frequency of the feed in GHz."
+    ),
+    cursor: str | None = Query(
+        None, description="Cursor from the previous page; omit for the first page."
+    ),
+    limit: int = Query(
+        settings.feed_page_size,
+        ge=1,
+        le=settings.feed_page_max_size,
+        description="Maximum number of sources in the page.",
+    ),
+) -> FeedPage:
+    """
+    Get a page of the materialized feed. Feeds that are not materialized
+    are read from the database, with the cursor holding the offset.
+    """
+
+    try:
+        position = FeedCursor.decode(cursor) if cursor is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if feed is not None and frequency in feed.frequencies:
+        snapshot, items, next = feed.page(frequency, position, limit)
+        total, refreshed_at = len(snapshot.items), snapshot.refreshed_at
+    else:
+        start = position.offset if position is not None else 0
+        result = await feed_read(
+            start=start, number=limit, frequency=frequency, backend=backend
+        )
+        items, total, refreshed_at = result.items, None, None
+        next = (
+            FeedCursor(generation=0, offset=start + len(items), last=None)
+            if len(items) == limit
+            else None
+        )
+
+    return model_response(
+        FeedPage(
+            frequency=frequency,
+            items=items,
+            next=next.encode() if next is not None else None,
+            total=total,
+            refreshed_at=refreshed_at,
+        ),
+        negotiate_serialization(request),
+        headers={"Vary": "Accept"},
+    )
+
+
 @sources_router.get(
     "/{source_id}/summary",
     summary="Get source summary",
@@ -6,16 +6,39 @@ dependency to gain access to the database inside the FastAPI endpoints.
 
 By importing this, you will set up two postgres connections - synchronous
 and asynchronous.
+
+The lifespan also owns the worker pool used to take CPU-bound rendering and
+encoding off the event loop, which is available through the `Workers`
+dependency. Finally, it keeps two in-memory views of the source catalog,
+refreshed from the database periodically: a spatial index for cone
+searches (`SpatialIndex`) and a snapshot ordered by ID for paginated
+listing (`CatalogSnapshot`), and the materialized feed rankings
+(`Feed`), also refreshed on a timer. Each dependency is None when its view
+is disabled or failed to load, in which case endpoints use the database.
 """
 
+import asyncio
 from typing import Annotated, Optional
 
 from fastapi import Depends, FastAPI
 from lightcurvedb.config import settings as lightcurvedb_settings
 from lightcurvedb.storage.prototype.backend import Backend
+from loguru import logger
+
+from lightserve.feed import MaterializedFeed
+from lightserve.processing.catalog import SourceCatalog
+from lightserve.processing.spatial import SourceIndex
+from lightserve.workers import WorkerPool
 
 # Global backend instance
 _backend_instance: Optional[Backend] = None
+# Global worker pool instance
+_worker_pool_instance: Optional[WorkerPool] = None
+# Global source index and catalog snapshot instances
+_source_index_instance: Optional[SourceIndex] = None
+_source_catalog_instance: Optional[SourceCatalog] = None
+# Global materialized feed instance
+_feed_instance: Optional[MaterializedFeed] = None
 
 
 async def get_backend() -> Backend:
@@ -24,15 +47,162 @@ async def get_backend() -> Backend:
     yield _backend_instance
 
 
+async def get_worker_pool() -> WorkerPool:
+    if _worker_pool_instance is None:
+        raise RuntimeError("Worker pool is not initialized.")
+    yield _worker_pool_instance
+
+
+async def get_source_index() -> Optional[SourceIndex]:
+    yield _source_index_instance
+
+
+async def get_source_catalog() -> Optional[SourceCatalog]:
+    yield _source_catalog_instance
+
+
+async def refresh_sources(
+    backend: Backend, views: list[SourceIndex | SourceCatalog], interval: float
+):
+    """
+    Re-read the source catalog every interval seconds, updating each of the
+    in-memory views of it (which only rebuild if it has changed). Runs
+    until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            sources = await backend.sources.get_all()
+
+            for view in views:
+                if await asyncio.to_thread(view.update, sources):
+                    logger.info(
+                        f"Refreshed {type(view).__name__}, now {len(view)} sources"
+                    )
+        except Exception:
+            logger.exception("Failed to refresh the source catalog")
+
+
+async def get_feed() -> Optional[MaterializedFeed]:
+    yield _feed_instance
+
+
+async def refresh_feed(backend: Backend, feed: MaterializedFeed, interval: float):
+    """
+    Re-read the materialized feed rankings every interval seconds. Runs
+    until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            await feed.refresh(backend)
+        except Exception:
+            logger.exception("Failed to refresh the materialized feed")
+
+
 async def lifespan(app: FastAPI):
-    global _backend_instance
+    global _backend_instance, _worker_pool_instance
+    global _source_index_instance, _source_catalog_instance, _feed_instance
+
+    # Imported here as the API package itself imports this module.
+    from lightserve.api.settings import settings
 
     async with lightcurvedb_settings.backend as backend:
         app.database_backend = backend
         _backend_instance = app.database_backend
         print("Initialized global backend instance")
 
-        yield
+        app.worker_pool = WorkerPool(
+            kind=settings.worker_pool_kind,
+            size=settings.worker_pool_size,
+            queue_size=settings.worker_pool_queue_size,
+        )
+        _worker_pool_instance = app.worker_pool
+        print(
+            f"Initialized {settings.worker_pool_kind} worker pool with "
+            f"{settings.worker_pool_size} workers"
+        )
+
+        app.source_index = None
+        app.source_catalog = None
+        views = []
+
+        try:
+            if settings.source_index_enable or settings.source_catalog_enable:
+                sources = await backend.sources.get_all()
+
+            if settings.source_index_enable:
+                app.source_index = await asyncio.to_thread(
+                    SourceIndex, sources, zone_height=settings.source_index_zone_height
+                )
+                views.append(app.source_index)
+
+            if settings.source_catalog_enable:
+                app.source_catalog = await asyncio.to_thread(SourceCatalog, sources)
+                views.append(app.source_catalog)
+        except Exception:
+            logger.exception("Failed to load the source catalog, using the database")
+
+        _source_index_instance = app.source_index
+        _source_catalog_instance = app.source_catalog
+
+        for view in views:
+            print(f"Initialized {type(view).__name__} with {len(view)} sources")
+
+        refresh = (
+            asyncio.create_task(
+                refresh_sources(
+                    backend, views, interval=settings.source_refresh_interval
+                )
+            )
+            if views
+            else None
+        )
+
+        app.feed = None
+        feed_refresh = None
+
+        if settings.feed_materialize:
+            feed = MaterializedFeed(
+                frequencies=settings.feed_frequencies or [settings.feed_frequency],
+                max_items=settings.feed_max_items,
+            )
+
+            try:
+                await feed.refresh(backend)
+                app.feed = feed
+                print(f"Initialized materialized feed for {feed.frequencies} GHz")
+            except Exception:
+                logger.exception("Failed to load the feed, using the database")
+
+        if app.feed is not None:
+            _feed_instance = app.feed
+            feed_refresh = asyncio.create_task(
+                refresh_feed(backend, app.feed, interval=settings.feed_refresh_interval)
+            )
+
+        try:
+            yield
+        finally:
+            for task in (refresh, feed_refresh):
+                if task is not None:
+                    task.cancel()
+
+            _source_index_instance = None
+            _source_catalog_instance = None
+            _feed_instance = None
+            _worker_pool_instance = None
+            app.worker_pool.shutdown()
 
 
 DatabaseBackend = Annotated[Backend, Depends(get_backend, use_cache=True)]
+Workers = Annotated[WorkerPool, Depends(get_worker_pool, use_cache=True)]
+SpatialIndex = Annotated[
+    Optional[SourceIndex], Depends(get_source_index, use_cache=True)
+]
+CatalogSnapshot = Annotated[
+    Optional[SourceCatalog], Depends(get_source_catalog, use_cache=True)
+]
+Feed = Annotated[Optional[MaterializedFeed], Depends(get_feed, use_cache=True)]
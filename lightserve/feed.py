@@ -0,0 +1,207 @@
+"""
+A materialized source feed: the feed ranking for each configured frequency
+is read from the database in full (up to a limit) on a timer, and pages are
+then served from memory, so deep pages cost the same as the first and page
+loads never recompute the ranking.
+
+Pages are addressed with opaque cursors that name the snapshot they were
+taken from, the position in it, and the last source returned. The previous
+few snapshots are kept, so a client paging through the feed sees one
+consistent ranking even if the feed is refreshed meanwhile. Once a
+snapshot has been dropped, its cursors continue after their last source in
+the current snapshot (or at the same position, if that source has left the
+feed).
+"""
+
+import base64
+import binascii
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, NamedTuple
+from uuid import UUID
+
+from lightcurvedb.client.feed import feed_read
+
+
+class FeedSnapshot(NamedTuple):
+    generation: int
+    "Increasing number identifying the snapshot."
+    frequency: int
+    "Frequency, in GHz, of the feed."
+    items: list[Any]
+    "Feed items, in ranked order."
+    refreshed_at: datetime
+    "When the ranking was read."
+
+
+class FeedCursor(NamedTuple):
+    generation: int
+    "Snapshot that the cursor points into; zero when read live from the database."
+    offset: int
+    "Position of the next item."
+    last: UUID | None
+    "Source ID of the last item returned."
+
+    def encode(self) -> str:
+        text = f"{self.generation}:{self.offset}:{self.last or ''}"
+
+        return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, cursor: str) -> "FeedCursor":
+        """
+        Read a cursor produced by encode.
+
+        Raises
+        ------
+        ValueError
+            If the cursor is malformed.
+        """
+        try:
+            text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            generation, offset, last = text.decode().split(":")
+
+            return cls(
+                generation=int(generation),
+                offset=max(int(offset), 0),
+                last=UUID(last) if last else None,
+            )
+        except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+            raise ValueError(f"Invalid feed cursor {cursor}") from e
+
+
+async def read_feed(
+    backend: Any, frequency: int, max_items: int, chunk_size: int
+) -> list[Any]:
+    """
+    Read the whole ranking of a feed, up to max_items, chunk_size at a time.
+    """
+    items = []
+
+    while len(items) < max_items:
+        number = min(chunk_size, max_items - len(items))
+        feed = await feed_read(
+            start=len(items), number=number, frequency=frequency, backend=backend
+        )
+        items.extend(feed.items)
+
+        if len(feed.items) < number:
+            break
+
+    return items
+
+
+class MaterializedFeed:
+    """
+    In-memory feed rankings, by frequency.
+    """
+
+    frequencies: list[int]
+    "Frequencies, in GHz, that feeds are kept for."
+    max_items: int
+    "Maximum number of items kept in each feed."
+    chunk_size: int
+    "Number of items read from the database at a time when refreshing."
+
+    def __init__(
+        self,
+        frequencies: list[int],
+        max_items: int,
+        chunk_size: int = 256,
+        history: int = 3,
+    ):
+        self.frequencies = frequencies
+        self.max_items = max_items
+        self.chunk_size = chunk_size
+
+        self._generation = 0
+        self._snapshots: dict[int, deque[FeedSnapshot]] = {
+            frequency: deque(maxlen=history) for frequency in frequencies
+        }
+
+    async def refresh(self, backend: Any):
+        """
+        Re-read the ranking of every feed from the database.
+        """
+        for frequency in self.frequencies:
+            items = await read_feed(
+                backend, frequency, self.max_items, chunk_size=self.chunk_size
+            )
+
+            self._generation += 1
+            self._snapshots[frequency].append(
+                FeedSnapshot(
+                    generation=self._generation,
+                    frequency=frequency,
+                    items=items,
+                    refreshed_at=datetime.now(timezone.utc),
+                )
+            )
+
+    def snapshot(self, frequency: int) -> FeedSnapshot | None:
+        """
+        The latest snapshot of a feed, or None if it has not been read.
+        """
+        snapshots = self._snapshots.get(frequency)
+
+        return snapshots[-1] if snapshots else None
+
+    def page(
+        self, frequency: int, cursor: FeedCursor | None, limit: int
+    ) -> tuple[FeedSnapshot, list[Any], FeedCursor | None]:
+        """
+        Get a page of a feed.
+
+        Arguments
+        ---------
+        frequency: int
+            Frequency of the feed.
+        cursor: FeedCursor | None
+            Cursor from the previous page, or None for the first page.
+        limit: int
+            Maximum number of items in the page.
+
+        Returns
+        -------
+        tuple[FeedSnapshot, list[Any], FeedCursor | None]
+            The snapshot the page was taken from, its items, and the cursor
+            for the next page (None if this is the last).
+
+        Raises
+        ------
+        KeyError
+            If the feed is not kept, or has not been read yet.
+        """
+        snapshots = self._snapshots.get(frequency)
+
+        if not snapshots:
+            raise KeyError(frequency)
+
+        snapshot, offset = snapshots[-1], 0
+
+        if cursor is not None:
+            offset = cursor.offset
+            held = [x for x in snapshots if x.generation == cursor.generation]
+
+            if held:
+                snapshot = held[0]
+            elif cursor.last is not None:
+                ids = [item.source_id for item in snapshot.items]
+
+                if cursor.last in ids:
+                    offset = ids.index(cursor.last) + 1
+
+        items = snapshot.items[offset : offset + limit]
+
+        if offset + limit >= len(snapshot.items) or not items:
+            return snapshot, items, None
+
+        return (
+            snapshot,
+            items,
+            FeedCursor(
+                generation=snapshot.generation,
+                offset=offset + len(items),
+                last=items[-1].source_id,
+            ),
+        )
@@ -0,0 +1,194 @@
+"""
+Binning of lightcurves in time with NumPy, for bin widths that the
+database does not aggregate.
+
+Bands are first converted to arrays (unix seconds, flux and uncertainty,
+sorted by time), which is the expensive part and so is cached by the API.
+Each bin then holds the inverse-variance weighted mean of the fluxes in
+it, with uncertainty 1 / sqrt(sum of weights). Measurements with a
+non-finite flux, or an uncertainty that is not positive and finite, carry
+no weight and are dropped. Bins are aligned to the start of the window
+and only bins holding at least one measurement are returned.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from uuid import UUID
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict
+
+
+class BandArrays(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    frequency: int
+    "Frequency of the band in GHz."
+    module: str | None
+    "Module that the band was observed with, if selected by instrument."
+    time: np.ndarray
+    "Measurement times as float64 unix seconds, sorted."
+    flux: np.ndarray
+    "Flux of each measurement."
+    flux_err: np.ndarray
+    "Uncertainty of each measurement's flux."
+
+    @property
+    def nbytes(self) -> int:
+        return self.time.nbytes + self.flux.nbytes + self.flux_err.nbytes
+
+
+class BinnedLightcurveBand(BaseModel):
+    frequency: int
+    "Frequency of the band in GHz."
+    module: str | None = None
+    "Module that the band was observed with, if selected by instrument."
+    time: list[datetime]
+    "Center of each bin."
+    flux: list[float]
+    "Inverse-variance weighted mean flux in each bin."
+    flux_err: list[float]
+    "Uncertainty of the mean flux in each bin."
+    count: list[int]
+    "Number of measurements in each bin."
+
+
+class BinnedLightcurve(BaseModel):
+    source_id: UUID
+    "Source that the lightcurve belongs to."
+    selection_strategy: str
+    "Frequency- or instrument-selected lightcurve view."
+    bin_width: timedelta
+    "Width of each bin."
+    lightcurves: dict[str, BinnedLightcurveBand]
+    "Binned bands, by name."
+
+
+def _as_unix(time: datetime) -> float:
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+
+    return time.timestamp()
+
+
+def unix_times(times: list[datetime]) -> np.ndarray:
+    """
+    Convert times to unix seconds. Naive times are taken to be UTC, as the
+    database stores them, rather than local time.
+    """
+    return np.fromiter((_as_unix(x) for x in times), dtype=np.float64, count=len(times))
+
+
+def band_arrays(band: Any) -> BandArrays:
+    """
+    Convert a band of an unbinned lightcurve to arrays, sorted by time.
+    """
+    time = unix_times(band.time)
+    order = np.argsort(time, kind="stable")
+
+    return BandArrays(
+        frequency=band.frequency,
+        module=getattr(band, "module", None),
+        time=time[order],
+        flux=np.asarray(band.flux, dtype=np.float64)[order],
+        flux_err=np.asarray(band.flux_err, dtype=np.float64)[order],
+    )
+
+
+def lightcurve_arrays(bands: dict[str, Any]) -> dict[str, BandArrays]:
+    """
+    Convert every band of an unbinned lightcurve to arrays. CPU-bound for
+    long lightcurves; run in the worker pool.
+    """
+    return {name: band_arrays(band) for name, band in bands.items()}
+
+
+def bin_band(
+    arrays: BandArrays, width: float, start: float, end: float
+) -> BinnedLightcurveBand:
+    """
+    Bin one band in time.
+
+    Arguments
+    ---------
+    arrays: BandArrays
+        The band to bin.
+    width: float
+        Bin width in seconds.
+    start: float
+        Start of the window, and of the first bin, in unix seconds.
+    end: float
+        End of the window in unix seconds (inclusive).
+
+    Returns
+    -------
+    BinnedLightcurveBand
+        The non-empty bins.
+    """
+    lower = np.searchsorted(arrays.time, start, side="left")
+    upper = np.searchsorted(arrays.time, end, side="right")
+
+    time = arrays.time[lower:upper]
+    flux = arrays.flux[lower:upper]
+    flux_err = arrays.flux_err[lower:upper]
+
+    valid = np.isfinite(flux) & np.isfinite(flux_err) & (flux_err > 0)
+    time, flux, flux_err = time[valid], flux[valid], flux_err[valid]
+
+    # Times are sorted, so bin indices are too and each bin is a contiguous
+    # run, which reduceat can sum over directly.
+    index = np.floor((time - start) / width).astype(np.int64)
+    bins, first, count = np.unique(index, return_index=True, return_counts=True)
+
+    weight = flux_err**-2
+    weight_sum = np.add.reduceat(weight, first) if len(time) else weight
+    weighted_flux = np.add.reduceat(weight * flux, first) if len(time) else flux
+
+    centers = start + (bins + 0.5) * width
+
+    return BinnedLightcurveBand(
+        frequency=arrays.frequency,
+        module=arrays.module,
+        time=[datetime.fromtimestamp(x, tz=timezone.utc) for x in centers],
+        flux=(weighted_flux / weight_sum).tolist(),
+        flux_err=(weight_sum**-0.5).tolist(),
+        count=count.tolist(),
+    )
+
+
+def bin_lightcurve(
+    source_id: UUID,
+    selection_strategy: str,
+    bands: dict[str, BandArrays],
+    bin_width: timedelta,
+    start_time: datetime,
+    end_time: datetime,
+) -> BinnedLightcurve:
+    """
+    Bin every band of a lightcurve in time, within a window. CPU-bound; run
+    in the worker pool.
+
+    Raises
+    ------
+    ValueError
+        If the bin width is not positive, or the window is empty.
+    """
+    width = bin_width.total_seconds()
+
+    if width <= 0:
+        raise ValueError("Bin width must be positive")
+
+    start, end = _as_unix(start_time), _as_unix(end_time)
+
+    if end < start:
+        raise ValueError("End time must not be before start time")
+
+    return BinnedLightcurve(
+        source_id=source_id,
+        selection_strategy=selection_strategy,
+        bin_width=bin_width,
+        lightcurves={
+            name: bin_band(arrays, width=width, start=start, end=end)
+            for name, arrays in bands.items()
+        },
+    )
@@ -0,0 +1,115 @@
+"""
+In-process caches with a memory ceiling, and the entity tags of cached
+content.
+"""
+
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from hashlib import blake2b
+from typing import Any
+
+from pydantic import BaseModel
+
+
+def strong_etag(content: bytes) -> str:
+    """
+    Compute a strong entity tag for a response body.
+    """
+    return '"' + blake2b(content, digest_size=16).hexdigest() + '"'
+
+
+class CacheStatistics(BaseModel):
+    entries: int
+    "Number of items currently held."
+    size_bytes: int
+    "Total size of the items currently held."
+    max_bytes: int
+    "Memory ceiling for the cache."
+    hits: int
+    "Number of lookups that found an item."
+    misses: int
+    "Number of lookups that did not find an item."
+    evictions: int
+    "Number of items removed to stay under the memory ceiling."
+
+
+class ByteBudgetLRUCache:
+    """
+    A least-recently-used cache that evicts items once the total size of
+    what it holds goes over a byte budget. Sizes are provided by the caller
+    when storing items. Safe to use from multiple threads.
+    """
+
+    max_bytes: int
+    "Memory ceiling for the cache; a value of zero disables caching."
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+        self._items: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        """
+        Get an item from the cache, marking it as recently used. Returns None
+        if the item is not held.
+        """
+        with self._lock:
+            item = self._items.get(key)
+
+            if item is None:
+                self.misses += 1
+                return None
+
+            self._items.move_to_end(key)
+            self.hits += 1
+
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, size: int):
+        """
+        Store an item, evicting the least recently used items until the
+        cache is back under its budget. Items larger than the whole budget
+        are not stored.
+        """
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._items.pop(key, None)
+
+            if previous is not None:
+                self._size -= previous[1]
+
+            self._items[key] = (value, size)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all items from the cache. Counters are preserved.
+        """
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def statistics(self) -> CacheStatistics:
+        with self._lock:
+            return CacheStatistics(
+                entries=len(self._items),
+                size_bytes=self._size,
+                max_bytes=self.max_bytes,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+            )
@@ -0,0 +1,85 @@
+"""
+An in-memory snapshot of the source catalog, ordered by source ID, for
+keyset (cursor) pagination.
+
+A page is everything after a given source ID, so pages stay consistent
+while the catalog changes underneath a client walking through it: sources
+are never repeated or skipped, except for those added or removed during
+the walk. Like the spatial index, the snapshot is replaced whole when
+refreshed, so it can be read from any thread.
+"""
+
+from bisect import bisect_right
+from typing import Iterable, NamedTuple
+from uuid import UUID
+
+from lightcurvedb.models.source import Source
+
+
+class _CatalogState(NamedTuple):
+    keys: list[UUID]
+    "Source IDs, sorted."
+    sources: list[Source]
+    "Sources, in the same order."
+
+
+class SourceCatalog:
+    """
+    Sources ordered by ID.
+    """
+
+    def __init__(self, sources: Iterable[Source] = ()):
+        self._state = self._build(sources)
+
+    def __len__(self) -> int:
+        return len(self._state.sources)
+
+    @staticmethod
+    def _build(sources: Iterable[Source]) -> _CatalogState:
+        ordered = sorted(sources, key=lambda s: s.source_id)
+
+        return _CatalogState(keys=[s.source_id for s in ordered], sources=ordered)
+
+    def update(self, sources: Iterable[Source]) -> bool:
+        """
+        Replace the snapshot if the catalog has changed.
+
+        Returns
+        -------
+        bool
+            Whether the snapshot changed.
+        """
+        state = self._build(sources)
+
+        if state.sources == self._state.sources:
+            return False
+
+        self._state = state
+
+        return True
+
+    def page(self, after: UUID | None, limit: int) -> tuple[list[Source], UUID | None]:
+        """
+        Get up to limit sources following a source ID.
+
+        Arguments
+        ---------
+        after: UUID | None
+            ID of the last source of the previous page; None for the first.
+        limit: int
+            Maximum number of sources to return.
+
+        Returns
+        -------
+        tuple[list[Source], UUID | None]
+            The sources, and the cursor for the next page (None if this is
+            the last).
+        """
+        state = self._state
+        start = 0 if after is None else bisect_right(state.keys, after)
+        sources = state.sources[start : start + limit]
+
+        if start + limit >= len(state.sources) or not sources:
+            return sources, None
+
+        return sources, sources[-1].source_id
@@ -0,0 +1,224 @@
+"""
+Bulk positional cross-matching of uploaded position tables against the
+source catalog.
+
+Positions are read from CSV, an Arrow IPC stream or a Parquet file, with
+columns named ra and dec (any case) in degrees, and matched all at once
+with the spatial index (see `SourceIndex.nearest`). Each position gets
+the nearest source within the match radius, if any; the result has a row
+per matched position, holding its row number in the upload. Arrow and
+Parquet, and fast CSV parsing, need the optional pyarrow dependency (the
+`arrow` extra); without it CSV is read with the standard library.
+"""
+
+import csv
+import io
+from typing import NamedTuple
+from uuid import UUID
+
+import numpy as np
+
+from lightserve.processing.renderer import TABLE_MEDIA_TYPES, TABLES_AVAILABLE
+from lightserve.processing.spatial import SourceIndex
+
+POSITION_MEDIA_TYPES = {"csv": "text/csv", **TABLE_MEDIA_TYPES}
+"Media types of the position tables that can be uploaded, by format."
+
+POSITION_COLUMNS = ("ra", "dec")
+"Columns read from position tables, matched without regard to case."
+
+
+class CrossmatchMatches(NamedTuple):
+    row: np.ndarray
+    "Row numbers, from zero, of the matched positions in the upload."
+    source_id: list[UUID]
+    "ID of the nearest source to each matched position."
+    ra: np.ndarray
+    "Right ascension of each matched source in degrees."
+    dec: np.ndarray
+    "Declination of each matched source in degrees."
+    separation: np.ndarray
+    "Separation of each position from its source in degrees."
+
+
+def _column_names(names: list[str]) -> list[str]:
+    """
+    The names, as given, of the position columns among a table's columns.
+    """
+    lower = {name.strip().lower(): name for name in names}
+    missing = [x for x in POSITION_COLUMNS if x not in lower]
+
+    if missing:
+        raise ValueError(f"Position table has no {', '.join(missing)} column")
+
+    return [lower[x] for x in POSITION_COLUMNS]
+
+
+def _read_csv(data: bytes) -> tuple[np.ndarray, np.ndarray]:
+    if TABLES_AVAILABLE:
+        import pyarrow as pa
+        import pyarrow.csv as pcsv
+
+        try:
+            table = pcsv.read_csv(pa.py_buffer(data))
+        except pa.ArrowInvalid as e:
+            raise ValueError(f"Could not read position table: {e}") from e
+
+        return _table_columns(table)
+
+    reader = csv.reader(io.StringIO(data.decode("utf-8-sig")))
+    header = next(reader, None)
+
+    if header is None:
+        raise ValueError("Position table is empty")
+
+    columns = [header.index(x) for x in _column_names(header)]
+    rows = []
+
+    for row in reader:
+        if not row:
+            continue
+
+        if len(row) != len(header):
+            raise ValueError(
+                f"Could not read position table: expected {len(header)} columns, "
+                f"got {len(row)} on line {reader.line_num}"
+            )
+
+        rows.append([row[i] for i in columns])
+
+    try:
+        values = np.array(rows, dtype=np.float64).reshape(-1, 2)
+    except ValueError as e:
+        raise ValueError(f"Could not read position table: {e}") from e
+
+    return values[:, 0], values[:, 1]
+
+
+def _table_columns(table) -> tuple[np.ndarray, np.ndarray]:
+    import pyarrow as pa
+
+    ra, dec = (table.column(x) for x in _column_names(table.column_names))
+
+    try:
+        return tuple(
+            x.cast(pa.float64()).to_numpy(zero_copy_only=False) for x in (ra, dec)
+        )
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        raise ValueError(f"Position columns must be numeric: {e}") from e
+
+
+def read_positions(data: bytes, format: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Read the right ascensions and declinations from an uploaded position
+    table.
+
+    Arguments
+    ---------
+    data: bytes
+        The uploaded file.
+    format: str
+        One of the formats in POSITION_MEDIA_TYPES.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        Right ascensions and declinations, in degrees.
+
+    Raises
+    ------
+    ValueError
+        If the table cannot be read, or has no numeric ra and dec columns.
+    """
+    if format == "csv":
+        return _read_csv(data)
+
+    if format not in TABLE_MEDIA_TYPES or not TABLES_AVAILABLE:
+        raise ValueError(f"Unsupported position table format {format}")
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    try:
+        if format == "arrow":
+            table = pa.ipc.open_stream(pa.py_buffer(data)).read_all()
+        else:
+            table = pq.read_table(pa.BufferReader(data))
+    except (pa.ArrowInvalid, OSError) as e:
+        raise ValueError(f"Could not read position table: {e}") from e
+
+    return _table_columns(table)
+
+
+def crossmatch_positions(
+    index: SourceIndex, data: bytes, format: str, radius: float, max_rows: int
+) -> CrossmatchMatches:
+    """
+    Match every position in an uploaded table to its nearest source within
+    radius. CPU-bound; run in a thread, as the index is not sent to worker
+    processes.
+
+    Raises
+    ------
+    ValueError
+        If the table cannot be read, has more than max_rows positions, or
+        holds invalid positions.
+    """
+    ra, dec = read_positions(data, format)
+
+    if len(ra) > max_rows:
+        raise ValueError(f"Position table has more than {max_rows} rows")
+
+    row, sources, separation = index.nearest(ra, dec, radius)
+
+    return CrossmatchMatches(
+        row=row,
+        source_id=[x.source_id for x in sources],
+        ra=np.fromiter((x.ra for x in sources), np.float64, count=len(sources)),
+        dec=np.fromiter((x.dec for x in sources), np.float64, count=len(sources)),
+        separation=separation,
+    )
+
+
+def encode_crossmatch_table(
+    matches: CrossmatchMatches, format: str, metadata: dict[str, str]
+) -> bytes:
+    """
+    Encode matches as an Arrow IPC stream or Parquet file, with a row per
+    matched position.
+    """
+    import pyarrow as pa
+
+    schema = pa.schema(
+        [
+            pa.field("row", pa.int64(), metadata={"description": "Upload row"}),
+            pa.field("source_id", pa.string()),
+            pa.field("ra", pa.float64(), metadata={"units": "deg"}),
+            pa.field("dec", pa.float64(), metadata={"units": "deg"}),
+            pa.field("separation", pa.float64(), metadata={"units": "deg"}),
+        ],
+        metadata=metadata,
+    )
+    table = pa.Table.from_arrays(
+        [
+            pa.array(matches.row),
+            pa.array([str(x) for x in matches.source_id], type=pa.string()),
+            pa.array(matches.ra),
+            pa.array(matches.dec),
+            pa.array(matches.separation),
+        ],
+        schema=schema,
+    )
+    sink = pa.BufferOutputStream()
+
+    if format == "arrow":
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    elif format == "parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, sink, compression="zstd")
+    else:
+        raise ValueError(f"Unsupported table format {format}")
+
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,392 @@
+"""
+Rendering and encoding of single cutouts, and the keys they are cached
+under.
+
+These are shared by the cutout endpoints and by cache warming, which runs
+in lightgest as well as lightserve, so nothing here depends on the API
+package or its settings. Image encoder settings are passed in as a
+`CutoutEncoder`, whose fingerprint is part of every cache key: a process
+configured differently never reads renders that do not match its own
+settings.
+"""
+
+import io
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, BinaryIO, Literal, Optional, Union
+from uuid import UUID
+
+import matplotlib
+import numpy as np
+from matplotlib.colors import LogNorm, Normalize
+from pydantic import BaseModel, ConfigDict, Field
+
+from lightserve.processing.encoders import (
+    QUANTIZE_LEVEL,
+    FitsCompression,
+    encode_fits,
+    encode_fits_image,
+    encode_hdf5,
+)
+from lightserve.processing.images import (
+    ASINH_SOFTENING,
+    BAD_ALPHA,
+    BAD_COLOR,
+    LUT_SIZE,
+    apply_colormap,
+    encode_png,
+    scale_limits,
+    thumbnail,
+)
+
+CUTOUT_MEDIA_TYPES = {
+    "webp": "image/webp",
+    "png": "image/png",
+    "fits": "image/fits",
+    "hdf5": "application/x-hdf5",
+}
+"Formats cutouts are available in, in order of preference when negotiating."
+
+
+class RenderOptions(BaseModel):
+    cmap: str = Field(default="viridis")
+    "Color map to use for rendering, defaults to 'viridis', and may not be used if RGBA buffers are provided."
+    vmin: float = Field(default=0.0)
+    "Color map range minimum, defaults to 0.0"
+    vmax: float = Field(default=1000.0)
+    "Color map range maximum, defaults to 1000.0"
+    log_norm: bool = Field(default=False)
+    "Whether to use a log normalization, defaults to False."
+    clip: bool = Field(default=True)
+    "Whether to clip values outside of the range, defaults to True."
+    scaling: Literal["fixed", "minmax", "percentile", "zscale"] = Field(default="fixed")
+    "How to choose the range: 'fixed' uses vmin and vmax, the others compute them from the data. Defaults to 'fixed'."
+    percentile: float = Field(default=99.5, gt=0.0, le=100.0)
+    "Percentage of pixels kept within the range for percentile scaling, defaults to 99.5."
+    stretch: Literal["linear", "asinh"] = Field(default="linear")
+    "Stretch applied after normalization, defaults to 'linear'."
+    asinh_a: float = Field(default=ASINH_SOFTENING, gt=0.0, le=1.0)
+    "Softening parameter for the asinh stretch, defaults to 0.1."
+
+    @property
+    def norm(self) -> Normalize:
+        if self.log_norm:
+            return LogNorm(vmin=self.vmin, vmax=self.vmax, clip=self.clip)
+        else:
+            return Normalize(vmin=self.vmin, vmax=self.vmax, clip=self.clip)
+
+    def resolve(self, buffer: np.ndarray | list) -> "RenderOptions":
+        """
+        Fix the range for this buffer. For automatic scalings, returns a copy
+        with vmin and vmax computed from the data and a 'fixed' scaling;
+        buffers with no usable data keep the given range.
+        """
+
+        if self.scaling == "fixed":
+            return self
+
+        limits = scale_limits(
+            np.asarray(buffer),
+            scaling=self.scaling,
+            percentile=self.percentile,
+            positive=self.log_norm,
+        )
+
+        if limits is None:
+            return self.model_copy(update={"scaling": "fixed"})
+
+        return self.model_copy(
+            update={"vmin": limits[0], "vmax": limits[1], "scaling": "fixed"}
+        )
+
+
+class ResampleOptions(BaseModel):
+    size: Optional[int] = Field(default=None, ge=1, le=4096)
+    "Longest edge of the output in pixels; larger cutouts are shrunk to fit. Defaults to native resolution."
+    scale: Optional[int] = Field(default=None, ge=1, le=64)
+    "Integer factor to shrink the cutout by, averaging scale x scale blocks. Applied before size."
+
+    @property
+    def native(self) -> bool:
+        return self.size is None and self.scale is None
+
+
+class CompressionOptions(BaseModel):
+    compression: Optional[FitsCompression] = Field(default=None)
+    "Tile compression for FITS output, defaults to None (uncompressed)."
+    quantize_level: float = Field(default=QUANTIZE_LEVEL, ge=0.0)
+    "Quantization level for compressing float data; higher keeps more precision, and 0 is lossless (GZIP only). Defaults to 16."
+
+
+class Renderer:
+    format: Optional[str]
+    "Format to render images to, defaults to 'webp'."
+    pil_kwargs: Optional[dict[str, Any]]
+    "Keyword arguments to pass to PIL for rendering, defaults to None."
+
+    def __init__(
+        self,
+        format: Optional[str] = "webp",
+        pil_kwargs: Optional[dict[str, Any]] = None,
+    ):
+        self.format = format
+        self.pil_kwargs = pil_kwargs
+
+        return
+
+    def rgba(self, buffer: np.ndarray, render_options: RenderOptions) -> np.ndarray:
+        """
+        Convert the buffer to an 8-bit image, ready for encoding.
+
+        Parameters
+        ----------
+        buffer : np.ndarray
+            Buffer to convert. 2D buffers are colour mapped, 3D buffers are
+            treated as (x, y, channel) images and used directly.
+        render_options : RenderOptions
+            Options for rendering.
+
+        Returns
+        -------
+        np.ndarray
+            uint8 image with the top row first.
+        """
+
+        if buffer.ndim == 2:
+            # Render with colour mapping, this is 'raw data'. Flipped as we
+            # render with the origin at the bottom.
+            render_options = render_options.resolve(buffer)
+
+            return apply_colormap(
+                buffer,
+                cmap=render_options.cmap,
+                vmin=render_options.vmin,
+                vmax=render_options.vmax,
+                log_norm=render_options.log_norm,
+                clip=render_options.clip,
+                stretch=render_options.stretch,
+                asinh_a=render_options.asinh_a,
+            )[::-1]
+        else:
+            # Direct rendering
+            image = buffer.swapaxes(0, 1)
+
+            if np.issubdtype(image.dtype, np.floating):
+                image = np.clip(image, 0.0, 1.0) * 255
+
+            return np.ascontiguousarray(image, dtype=np.uint8)
+
+    def render(
+        self,
+        fname: Union[str, Path, BinaryIO],
+        buffer: np.ndarray,
+        render_options: RenderOptions,
+    ):
+        """
+        Renders the buffer to the given file.
+
+        Parameters
+        ----------
+        fname : Union[str, Path, BinaryIO]
+            Output for the rendering.
+        buffer : np.ndarray
+            Buffer to render to disk or IO.
+        render_options : RenderOptions
+            Options for rendering.
+
+        Notes
+        -----
+
+        Buffer is transposed in x, y to render correctly within this function.
+        PNGs are encoded directly (only the compress_level PIL keyword is
+        respected); other formats are handed to PIL.
+        """
+
+        image = self.rgba(buffer, render_options)
+        pil_kwargs = self.pil_kwargs or {}
+
+        if self.format == "png":
+            content = encode_png(
+                image, compress_level=pil_kwargs.get("compress_level", 6)
+            )
+
+            if isinstance(fname, (str, Path)):
+                Path(fname).write_bytes(content)
+            else:
+                fname.write(content)
+        else:
+            from PIL import Image
+
+            Image.fromarray(image).save(fname, format=self.format, **pil_kwargs)
+
+        return
+
+
+class RenderedCutout(BaseModel):
+    content: bytes
+    "Encoded cutout, ready to send."
+    media_type: str
+    "Media type of the encoded cutout."
+    etag: str
+    "Strong entity tag for the content."
+    headers: dict[str, str] = Field(default_factory=dict)
+    "Additional headers to send with the content, e.g. computed render limits."
+
+
+CUTOUT_RENDER_VERSION = 1
+"Version of the cutout rendering; bump it when a change alters rendered bytes, to retire cached renders."
+
+
+class CutoutEncoder(BaseModel):
+    png_compress_level: int = 6
+    "zlib compression level (0-9) for PNG images."
+    webp_lossless: bool = True
+    "Whether WebP images are lossless."
+    webp_quality: int = 90
+    "WebP quality (0-100; effort when lossless)."
+    webp_method: int = 4
+    "WebP method (0-6, speed/size trade-off)."
+
+    model_config = ConfigDict(frozen=True)
+
+    @property
+    def fingerprint(self) -> tuple:
+        """
+        Everything besides the request options that determines the bytes of
+        a render: these settings, the rendering version, and the colour map
+        configuration.
+        """
+        return (
+            CUTOUT_RENDER_VERSION,
+            matplotlib.__version__,
+            LUT_SIZE,
+            BAD_COLOR,
+            BAD_ALPHA,
+            *self.model_dump().values(),
+        )
+
+    def renderers(self) -> dict[str, "Renderer"]:
+        """
+        Renderers for the image formats, by format.
+        """
+        return _renderers(self)
+
+
+@lru_cache(maxsize=16)
+def _renderers(encoder: CutoutEncoder) -> dict[str, Renderer]:
+    return {
+        "png": Renderer(
+            format="png", pil_kwargs={"compress_level": encoder.png_compress_level}
+        ),
+        "webp": Renderer(
+            format="webp",
+            pil_kwargs={
+                "lossless": encoder.webp_lossless,
+                "quality": encoder.webp_quality,
+                "method": encoder.webp_method,
+            },
+        ),
+    }
+
+
+def encode_cutout(
+    data: list[list[float]] | np.ndarray,
+    ext: Literal["webp", "png", "fits", "hdf5"],
+    render_options: RenderOptions,
+    resample_options: ResampleOptions | None = None,
+    compression_options: CompressionOptions | None = None,
+    encoder: CutoutEncoder | None = None,
+) -> tuple[bytes, str]:
+    """
+    Render or encode a cutout. This is CPU-bound and is run in the worker
+    pool rather than on the event loop.
+
+    Parameters
+    ----------
+    data : list[list[float]] | np.ndarray
+        Cutout data, as returned from the backend.
+    ext : Literal["webp", "png", "fits", "hdf5"]
+        Output format.
+    render_options : RenderOptions
+        Options for rendering, only used for images.
+    resample_options : ResampleOptions | None
+        Options for shrinking the cutout before it is rendered or encoded.
+    compression_options : CompressionOptions | None
+        Options for compressing FITS output.
+    encoder : CutoutEncoder | None
+        Image encoder settings, defaults to CutoutEncoder().
+
+    Returns
+    -------
+    tuple[bytes, str]
+        The encoded cutout and its media type.
+    """
+
+    renderers = (encoder or CutoutEncoder()).renderers()
+
+    if resample_options is not None and not resample_options.native:
+        data = thumbnail(
+            np.asarray(data),
+            size=resample_options.size,
+            scale=resample_options.scale,
+        )
+
+    if ext in renderers:
+        with io.BytesIO() as output:
+            renderers[ext].render(
+                output, np.asarray(data), render_options=render_options
+            )
+            return output.getvalue(), CUTOUT_MEDIA_TYPES[ext]
+    elif ext == "fits":
+        if compression_options is None or compression_options.compression is None:
+            return encode_fits_image(data), CUTOUT_MEDIA_TYPES[ext]
+
+        content = encode_fits(
+            [(data, None, [])],
+            dtype="f4",
+            compression=compression_options.compression,
+            quantize_level=compression_options.quantize_level,
+        )
+        return content, CUTOUT_MEDIA_TYPES[ext]
+    elif ext == "hdf5":
+        return encode_hdf5({"data": (data, {})}), CUTOUT_MEDIA_TYPES[ext]
+
+    raise ValueError(f"Unsupported cutout format {ext}")
+
+
+def render_limits(
+    data: list[list[float]] | np.ndarray, render_options: RenderOptions
+) -> tuple[float, float]:
+    """
+    Compute the (vmin, vmax) that the render options resolve to for this
+    cutout. Run in the worker pool.
+    """
+    resolved = render_options.resolve(data)
+
+    return resolved.vmin, resolved.vmax
+
+
+def cutout_cache_key(
+    source_id: UUID,
+    measurement_id: UUID,
+    ext: str,
+    render_options: RenderOptions,
+    resample_options: ResampleOptions,
+    compression_options: CompressionOptions,
+    encoder: CutoutEncoder,
+) -> tuple:
+    """
+    Key identifying a rendered cutout in the in-process and on-disk caches.
+    The on-disk cache is shared with other processes, which may be
+    configured differently, so the key includes the encoder fingerprint as
+    well as the request options.
+    """
+    return (
+        source_id,
+        measurement_id,
+        ext,
+        tuple(render_options.model_dump().values()),
+        tuple(resample_options.model_dump().values()),
+        tuple(compression_options.model_dump().values()),
+        encoder.fingerprint,
+    )
@@ -0,0 +1,75 @@
+"""
+A persistent, on-disk cache of rendered outputs, shared between processes.
+
+Entries are pickled into one file each, named by a hash of their key, and
+written atomically so that the ingest service (or the warming CLI) can
+fill the cache while the API reads from it. The directory must only be
+writable by the services themselves, as entries are unpickled on read.
+"""
+
+import os
+import pickle
+import tempfile
+from collections.abc import Hashable
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any
+
+
+class DiskCache:
+    """
+    Cache items as files under a directory. Keys must have a stable repr
+    (e.g. tuples of UUIDs, strings and numbers), as that is what is hashed
+    to find their file. Nothing is ever evicted; prune the directory
+    externally (e.g. by access time) if it grows too large.
+    """
+
+    directory: Path
+    "Root directory of the cache."
+
+    def __init__(self, directory: Path | str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: Hashable) -> Path:
+        """
+        File that holds the item for a key. Files are spread over 256
+        subdirectories to keep directory listings small.
+        """
+        digest = blake2b(repr(key).encode(), digest_size=20).hexdigest()
+
+        return self.directory / digest[:2] / digest[2:]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.path(key).exists()
+
+    def get(self, key: Hashable) -> Any | None:
+        """
+        Read an item from the cache. Returns None if the item is not held
+        or cannot be read.
+        """
+        try:
+            with open(self.path(key), "rb") as handle:
+                return pickle.load(handle)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Store an item, replacing any existing one. The item is written to a
+        temporary file and moved into place, so readers never see partial
+        entries.
+        """
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True)
+
+        descriptor, temporary = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+
+        try:
+            with os.fdopen(descriptor, "wb") as handle:
+                pickle.dump(value, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
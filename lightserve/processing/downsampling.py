@@ -0,0 +1,157 @@
+"""
+Shape-preserving downsampling of lightcurves for plotting, so that what is
+sent to (and drawn by) a browser is bounded however long a source has been
+observed.
+
+Two methods are available, both choosing a subset of the measurements so
+that every field (IDs, positions, uncertainties) is kept for each chosen
+point:
+
+- lttb: Largest-Triangle-Three-Buckets. Measurements are split into equal
+  count buckets, and from each the point making the largest triangle with
+  the previous choice and the mean of the next bucket is kept. Follows the
+  visual shape of the curve closely.
+- minmax: the lowest and highest flux in each bucket. Guarantees that
+  every flare and dip survives, at the cost of a noisier looking curve.
+
+The first and last measurements are always kept. Measurements without a
+finite flux cannot be drawn and are dropped before downsampling.
+"""
+
+from typing import Any, Iterable, Literal
+
+import numpy as np
+
+from lightserve.processing.binning import unix_times
+
+DownsamplingMethod = Literal["lttb", "minmax"]
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Choose up to max_points points with Largest-Triangle-Three-Buckets. x
+    must be sorted.
+
+    Returns
+    -------
+    np.ndarray
+        Indices of the chosen points, in order.
+    """
+    n = len(x)
+
+    if n <= max_points or max_points < 3:
+        return np.arange(min(n, max(max_points, 0)))
+
+    # Bucket edges for the n - 2 points between the fixed first and last.
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+
+    chosen = np.empty(max_points, dtype=np.int64)
+    chosen[0] = 0
+    chosen[-1] = n - 1
+
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+
+        if bucket + 2 < len(edges):
+            following = slice(end, edges[bucket + 2])
+            next_x, next_y = x[following].mean(), y[following].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        previous = chosen[bucket]
+        # Twice the triangle area; the constant factor does not matter.
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        chosen[bucket + 1] = start + np.argmax(area)
+
+    return chosen
+
+
+def minmax_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Choose up to max_points points by keeping the lowest and highest value
+    in each of (max_points - 2) / 2 equal count buckets, plus the first and
+    last points.
+
+    Returns
+    -------
+    np.ndarray
+        Indices of the chosen points, in order.
+    """
+    n = len(y)
+
+    if n <= max_points or max_points < 4:
+        return np.arange(min(n, max(max_points, 0)))
+
+    buckets = (max_points - 2) // 2
+    bucket = np.minimum(
+        np.arange(n - 2, dtype=np.int64) * buckets // (n - 2), buckets - 1
+    )
+
+    # Sorting by value within bucket puts each bucket's minimum first and
+    # its maximum last.
+    order = np.lexsort((y[1:-1], bucket)) + 1
+    last = np.flatnonzero(np.diff(bucket[order - 1], append=buckets))
+    first = np.concatenate([[0], last[:-1] + 1])
+
+    return np.unique(np.concatenate([[0, n - 1], order[first], order[last]]))
+
+
+def take_measurements(band: Any, keep: Iterable[int]) -> Any:
+    """
+    Copy a band of an unbinned lightcurve, keeping only the measurements at
+    the given indices, in that order, in every per-measurement field.
+    """
+    keep = list(keep)
+    size = len(band.time)
+
+    return band.model_copy(
+        update={
+            field: [values[i] for i in keep]
+            for field, values in band
+            if isinstance(values, list) and len(values) == size
+        }
+    )
+
+
+def downsample_band(band: Any, max_points: int, method: DownsamplingMethod) -> Any:
+    """
+    Reduce a band of an unbinned lightcurve to at most max_points
+    measurements. Bands that are already small enough are returned as-is.
+    """
+    if len(band.time) <= max_points:
+        return band
+
+    x = unix_times(band.time)
+    y = np.asarray(band.flux, dtype=np.float64)
+
+    finite = np.flatnonzero(np.isfinite(y))
+    order = finite[np.argsort(x[finite], kind="stable")]
+
+    if method == "lttb":
+        selected = lttb_indices(x[order], y[order], max_points)
+    elif method == "minmax":
+        selected = minmax_indices(y[order], max_points)
+    else:
+        raise ValueError(f"Unsupported downsampling method {method}")
+
+    return take_measurements(band, order[selected])
+
+
+def downsample_lightcurve(
+    lightcurve: Any, max_points: int, method: DownsamplingMethod
+) -> Any:
+    """
+    Downsample every band of an unbinned lightcurve to at most max_points
+    measurements. CPU-bound for long lightcurves; run in the worker pool.
+    """
+    return lightcurve.model_copy(
+        update={
+            "lightcurves": {
+                name: downsample_band(band, max_points, method)
+                for name, band in lightcurve.lightcurves.items()
+            }
+        }
+    )
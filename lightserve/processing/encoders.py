@@ -0,0 +1,396 @@
+"""
+Low-overhead FITS and HDF5 encoders for cutouts.
+
+FITS files are written directly: headers are formatted as fixed-format
+80-character cards, and data is converted to big-endian exactly once, into
+the output buffer itself. Tile-compressed FITS images are the exception,
+and are handed to astropy (and so CFITSIO's algorithms). HDF5 files are
+built with h5py's in-memory core driver and handed back as a single file
+image, rather than going through a Python file object.
+"""
+
+import io
+from typing import Any, BinaryIO, Iterable, Literal
+from uuid import uuid4
+
+import h5py
+import numpy as np
+from astropy.io import fits
+
+FITS_BLOCK = 2880
+"FITS files are made of blocks of this many bytes."
+
+FITS_CARD = 80
+"Length of each header card."
+
+FITS_BITPIX = {
+    np.dtype("uint8"): 8,
+    np.dtype("int16"): 16,
+    np.dtype("int32"): 32,
+    np.dtype("int64"): 64,
+    np.dtype("float32"): -32,
+    np.dtype("float64"): -64,
+}
+"BITPIX for each supported image data type (in native byte order)."
+
+FITS_TFORM = {"u1": "B", "i2": "I", "i4": "J", "i8": "K", "f4": "E", "f8": "D"}
+"Binary table TFORM codes for each supported column type."
+
+Card = tuple[str, Any] | tuple[str, Any, str]
+"A header card: (keyword, value) or (keyword, value, comment)."
+
+FitsCompression = Literal["RICE_1", "GZIP_1", "GZIP_2"]
+"Supported tile compression algorithms."
+
+QUANTIZE_LEVEL = 16.0
+"Default quantization level for compressing floating point images."
+
+
+def _padded(nbytes: int) -> int:
+    return -(-nbytes // FITS_BLOCK) * FITS_BLOCK
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return f"{'T' if value else 'F':>20}"
+    elif isinstance(value, (int, np.integer)):
+        return f"{value:>20}"
+    elif isinstance(value, (float, np.floating)):
+        formatted = repr(float(value)).upper()
+        if "E" not in formatted and "." not in formatted:
+            formatted += ".0"
+        return f"{formatted:>20}"
+    else:
+        escaped = str(value).replace("'", "''")
+        if len(escaped) > 68:
+            raise ValueError(f"FITS string value too long: {value}")
+        quoted = f"'{escaped:<8}'"
+        return f"{quoted:<20}"
+
+
+def fits_card(keyword: str, value: Any = None, comment: str | None = None) -> bytes:
+    """
+    Format a single fixed-format FITS header card.
+
+    Parameters
+    ----------
+    keyword : str
+        Keyword, up to 8 characters.
+    value : Any
+        Value; bools, integers, floats and strings are supported. If None,
+        the card has no value indicator (e.g. END).
+    comment : str | None
+        Optional comment, truncated to fit the card.
+
+    Returns
+    -------
+    bytes
+        The 80-byte card.
+    """
+    card = f"{keyword.upper():<8}"
+
+    if value is not None:
+        card += "= " + _format_value(value)
+
+    if comment:
+        card += f" / {comment}"
+
+    return card[:FITS_CARD].ljust(FITS_CARD).encode("ascii")
+
+
+def fits_header(cards: Iterable[Card]) -> bytes:
+    """
+    Build a complete header, including END and padding to a whole block.
+    """
+    header = b"".join(fits_card(*card) for card in cards) + fits_card("END")
+
+    return header.ljust(_padded(len(header)), b" ")
+
+
+def image_cards(
+    shape: tuple[int, ...],
+    dtype: np.dtype,
+    extension: bool = False,
+    name: str | None = None,
+) -> list[Card]:
+    """
+    Mandatory cards describing an image HDU of the given shape and type.
+    Shapes are in NumPy (C) order; NAXIS1 is the last axis.
+    """
+    cards: list[Card] = [("XTENSION", "IMAGE")] if extension else [("SIMPLE", True)]
+    cards.append(("BITPIX", FITS_BITPIX[np.dtype(dtype).newbyteorder("=")]))
+    cards.append(("NAXIS", len(shape)))
+    cards.extend((f"NAXIS{i + 1}", n) for i, n in enumerate(reversed(shape)))
+
+    if extension:
+        cards.extend([("PCOUNT", 0), ("GCOUNT", 1)])
+    else:
+        cards.append(("EXTEND", True))
+
+    if name is not None:
+        cards.append(("EXTNAME", name))
+
+    return cards
+
+
+def encode_fits_image(
+    data: np.ndarray | list,
+    cards: Iterable[Card] = (),
+    extension: bool = False,
+    name: str | None = None,
+    dtype: np.dtype | str = "f8",
+) -> bytes:
+    """
+    Encode an image HDU into a single pre-sized buffer.
+
+    Parameters
+    ----------
+    data : np.ndarray | list
+        Image data, e.g. straight from a cutout.
+    cards : Iterable[Card]
+        Additional header cards.
+    extension : bool
+        Whether this is an IMAGE extension rather than the primary HDU.
+    name : str | None
+        EXTNAME to give the HDU.
+    dtype : np.dtype | str
+        Data type to store the image as.
+
+    Returns
+    -------
+    bytes
+        The header and data blocks.
+    """
+    # NumPy converts nested lists far faster to native than big-endian types.
+    data = np.asarray(data)
+    dtype = np.dtype(dtype)
+    shape = data.shape
+    header = fits_header(image_cards(shape, dtype, extension, name) + list(cards))
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+
+    output = bytearray(len(header) + _padded(nbytes))
+    output[: len(header)] = header
+    # The byte swap writes straight into the output buffer.
+    np.frombuffer(
+        output,
+        dtype=dtype.newbyteorder(">"),
+        count=nbytes // dtype.itemsize,
+        offset=len(header),
+    ).reshape(shape)[...] = data
+    del data
+
+    return bytes(output)
+
+
+def encode_fits_compressed_image(
+    data: np.ndarray | list,
+    cards: Iterable[Card] = (),
+    name: str | None = None,
+    compression: FitsCompression = "RICE_1",
+    quantize_level: float = QUANTIZE_LEVEL,
+    tile_shape: tuple[int, ...] | None = None,
+    dtype: np.dtype | str = "f4",
+) -> bytes:
+    """
+    Encode a tile-compressed image extension, following the FITS tiled image
+    compression convention. Tile-compressed images cannot be the primary
+    HDU, so this must follow one.
+
+    Parameters
+    ----------
+    data : np.ndarray | list
+        Image data.
+    cards : Iterable[Card]
+        Additional header cards.
+    name : str | None
+        EXTNAME to give the HDU.
+    compression : FitsCompression
+        Compression algorithm. RICE_1 is the fastest and, for quantized
+        float data, usually the smallest.
+    quantize_level : float
+        Floating point data is quantized to steps of the background noise
+        divided by this before compression, so higher values keep more
+        precision. Zero stores floats losslessly, which is only supported
+        by the GZIP algorithms.
+    tile_shape : tuple[int, ...] | None
+        Shape of the compression tiles, in NumPy order. Defaults to one
+        row per tile.
+    dtype : np.dtype | str
+        Data type to store the image as.
+
+    Returns
+    -------
+    bytes
+        The extension's header and data blocks.
+    """
+    dtype = np.dtype(dtype)
+
+    if compression == "RICE_1" and dtype.kind == "f" and quantize_level == 0:
+        raise ValueError("RICE_1 compression of float data requires quantization")
+
+    hdu = fits.CompImageHDU(
+        np.asarray(data, dtype=dtype),
+        header=fits.Header(list(cards)),
+        name=name,
+        compression_type=compression,
+        quantize_level=quantize_level,
+        tile_shape=tile_shape,
+    )
+    primary = fits.PrimaryHDU()
+
+    with io.BytesIO() as output:
+        # astropy only writes whole files, so drop the primary HDU it needs.
+        fits.HDUList([primary, hdu]).writeto(output)
+        return output.getvalue()[len(primary.header.tostring()) :]
+
+
+def encode_fits(
+    images: Iterable[tuple[np.ndarray | list, str | None, Iterable[Card]]],
+    dtype: np.dtype | str = "f8",
+    compression: FitsCompression | None = None,
+    quantize_level: float = QUANTIZE_LEVEL,
+) -> bytes:
+    """
+    Encode a multi-extension FITS file: an empty primary HDU followed by an
+    image extension per entry of (data, name, cards). With a compression
+    algorithm, the extensions are tile-compressed images.
+    """
+    if compression is None:
+        extensions = (
+            encode_fits_image(data, cards, extension=True, name=name, dtype=dtype)
+            for data, name, cards in images
+        )
+    else:
+        extensions = (
+            encode_fits_compressed_image(
+                data,
+                cards,
+                name=name,
+                compression=compression,
+                quantize_level=quantize_level,
+                dtype=dtype,
+            )
+            for data, name, cards in images
+        )
+
+    return b"".join([fits_header(image_cards((), dtype)), *extensions])
+
+
+def encode_fits_table(
+    columns: dict[str, np.ndarray],
+    units: dict[str, str] | None = None,
+    name: str | None = None,
+) -> bytes:
+    """
+    Encode a BINTABLE extension from a set of equal-length 1D columns.
+    Numeric columns and fixed-length byte strings are supported.
+    """
+    units = units or {}
+    fields = []
+    cards: list[Card] = []
+
+    for index, (column, values) in enumerate(columns.items(), start=1):
+        values = np.asarray(values)
+
+        if values.dtype.kind == "S":
+            fields.append((column, values.dtype))
+            tform = f"{values.dtype.itemsize}A"
+        else:
+            fields.append((column, values.dtype.newbyteorder(">")))
+            tform = FITS_TFORM[values.dtype.newbyteorder("=").str[1:]]
+
+        cards.extend([(f"TTYPE{index}", column), (f"TFORM{index}", tform)])
+
+        if column in units:
+            cards.append((f"TUNIT{index}", units[column]))
+
+    rows = len(next(iter(columns.values())))
+    table = np.empty(rows, dtype=fields)
+
+    for column, values in columns.items():
+        table[column] = values
+
+    header_cards: list[Card] = [
+        ("XTENSION", "BINTABLE"),
+        ("BITPIX", 8),
+        ("NAXIS", 2),
+        ("NAXIS1", table.dtype.itemsize),
+        ("NAXIS2", rows),
+        ("PCOUNT", 0),
+        ("GCOUNT", 1),
+        ("TFIELDS", len(columns)),
+        *cards,
+    ]
+
+    if name is not None:
+        header_cards.append(("EXTNAME", name))
+
+    data = table.tobytes()
+
+    return fits_header(header_cards) + data.ljust(_padded(len(data)), b"\0")
+
+
+def write_fits_image_planes(
+    handle: BinaryIO,
+    planes: Iterable[np.ndarray],
+    shape: tuple[int, ...],
+    cards: Iterable[Card] = (),
+    extension: bool = False,
+    name: str | None = None,
+    dtype: np.dtype | str = "f4",
+):
+    """
+    Write an image HDU whose first axis is built up plane by plane, so that
+    large cubes never need to be held in memory.
+
+    Parameters
+    ----------
+    handle : BinaryIO
+        File to write to.
+    planes : Iterable[np.ndarray]
+        Planes of the image, each of shape shape[1:].
+    shape : tuple[int, ...]
+        Full shape of the image, in NumPy order.
+    cards, extension, name, dtype
+        As for :func:`encode_fits_image`.
+    """
+    dtype = np.dtype(dtype)
+    handle.write(fits_header(image_cards(shape, dtype, extension, name) + list(cards)))
+
+    written = 0
+
+    for plane in planes:
+        written += handle.write(np.asarray(plane, dtype=dtype.newbyteorder(">")).data)
+
+    handle.write(b"\0" * (_padded(written) - written))
+
+
+def encode_hdf5(
+    datasets: dict[str, tuple[np.ndarray | list, dict[str, Any]]],
+    **dataset_kwargs: Any,
+) -> bytes:
+    """
+    Encode datasets into an in-memory HDF5 file and return its image.
+
+    Parameters
+    ----------
+    datasets : dict[str, tuple[np.ndarray | list, dict[str, Any]]]
+        Map from dataset path to (data, attributes).
+    **dataset_kwargs
+        Passed to every create_dataset call (e.g. compression).
+
+    Returns
+    -------
+    bytes
+        The complete HDF5 file.
+    """
+    # HDF5 tracks open files by name, even in memory, so each needs its own.
+    with h5py.File(uuid4().hex, "w", driver="core", backing_store=False) as f:
+        for path, (data, attrs) in datasets.items():
+            # h5py is very slow at converting nested lists itself.
+            dataset = f.create_dataset(path, data=np.asarray(data), **dataset_kwargs)
+            dataset.attrs.update(attrs)
+
+        f.flush()
+
+        return f.id.get_file_image()
@@ -0,0 +1,415 @@
+"""
+Vectorized image rendering primitives for cutouts.
+
+Colour maps are converted once into 256-entry RGBA lookup tables, buffers
+are normalized and mapped through those tables with pure NumPy indexing,
+and PNGs are encoded directly with zlib. Nothing here touches pyplot's
+global state, so all of these functions are safe to call from multiple
+threads at once.
+"""
+
+import struct
+import zlib
+from functools import lru_cache
+from typing import Literal
+
+import numpy as np
+from astropy.visualization import ZScaleInterval
+from matplotlib import colormaps
+from matplotlib.colors import to_rgba
+
+LUT_SIZE = 256
+"Number of colours in each lookup table; the bad colour is stored after these."
+
+BAD_INDEX = LUT_SIZE
+"Index into the lookup table used for NaN (and, for log norms, non-positive) pixels."
+
+BAD_COLOR = "#dddddd"
+BAD_ALPHA = 0.0
+"Colour used for bad pixels, matching what we used to set with cmap.set_bad."
+
+ASINH_SOFTENING = 0.1
+"Default softening parameter for the asinh stretch; smaller is closer to log."
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+"Map from number of channels to PNG colour type (grey, grey+alpha, RGB, RGBA)."
+
+
+@lru_cache(maxsize=64)
+def colormap_lut(
+    name: str, bad: str = BAD_COLOR, bad_alpha: float = BAD_ALPHA
+) -> np.ndarray:
+    """
+    Build (once) the RGBA lookup table for a named matplotlib colour map.
+
+    Parameters
+    ----------
+    name : str
+        Name of a registered matplotlib colour map, e.g. 'viridis'.
+    bad : str
+        Colour to use for bad pixels.
+    bad_alpha : float
+        Alpha to use for bad pixels.
+
+    Returns
+    -------
+    np.ndarray
+        Read-only uint8 array of shape (LUT_SIZE + 1, 4). The final entry
+        is the bad colour.
+
+    Raises
+    ------
+    ValueError
+        If the colour map is not known to matplotlib.
+    """
+    try:
+        cmap = colormaps[name].resampled(LUT_SIZE)
+    except KeyError:
+        raise ValueError(f"Unknown colour map {name}")
+
+    lut = np.empty((LUT_SIZE + 1, 4), dtype=np.uint8)
+    lut[:LUT_SIZE] = cmap(np.arange(LUT_SIZE), bytes=True)
+    # Same truncation as matplotlib uses when producing bytes.
+    lut[BAD_INDEX] = (np.array(to_rgba(bad, bad_alpha)) * 255).astype(np.uint8)
+    lut.setflags(write=False)
+
+    return lut
+
+
+def lut_indices(
+    buffer: np.ndarray,
+    vmin: float,
+    vmax: float,
+    log_norm: bool = False,
+    clip: bool = True,
+    stretch: Literal["linear", "asinh"] = "linear",
+    asinh_a: float = ASINH_SOFTENING,
+) -> np.ndarray:
+    """
+    Normalize a 2D buffer and convert it to indices into a lookup table
+    produced by :func:`colormap_lut`.
+
+    Parameters
+    ----------
+    buffer : np.ndarray
+        Raw data to normalize.
+    vmin : float
+        Value mapped to the bottom of the colour map.
+    vmax : float
+        Value mapped to the top of the colour map.
+    log_norm : bool
+        Whether to normalize logarithmically. Non-positive values are bad.
+    clip : bool
+        Whether to clip values to [vmin, vmax] before normalizing.
+    stretch : Literal["linear", "asinh"]
+        Stretch applied to the normalized values. The asinh stretch maps
+        x to asinh(x / a) / asinh(1 / a), bringing out faint structure
+        while keeping bright sources from saturating.
+    asinh_a : float
+        Softening parameter a of the asinh stretch.
+
+    Returns
+    -------
+    np.ndarray
+        Integer array with the same shape as buffer. Values below vmin
+        map to the first colour, values above vmax to the last, and bad
+        values to BAD_INDEX. If vmin equals vmax, every value maps to the
+        first colour.
+
+    Notes
+    -----
+    This reproduces the behaviour of matplotlib's Normalize and LogNorm
+    followed by Colormap.__call__ on a 256-entry colour map.
+    """
+
+    if vmin > vmax:
+        raise ValueError("vmin must be less than or equal to vmax")
+
+    if vmin == vmax:
+        # Like Normalize and LogNorm, map every pixel (even bad ones) to the
+        # first colour when the range is empty.
+        return np.zeros(np.shape(buffer), dtype=np.intp)
+
+    data = np.array(buffer, dtype=np.float64)
+
+    if clip:
+        np.clip(data, vmin, vmax, out=data)
+
+    if log_norm:
+        if vmin <= 0.0:
+            raise ValueError("vmin must be positive when using a log normalization")
+
+        data[data <= 0.0] = np.nan
+        np.log10(data, out=data)
+        low, high = np.log10(vmin), np.log10(vmax)
+    else:
+        low, high = vmin, vmax
+
+    bad = np.isnan(data)
+
+    if stretch == "asinh":
+        data -= low
+        data /= high - low
+        data /= asinh_a
+        np.arcsinh(data, out=data)
+        data *= LUT_SIZE / np.arcsinh(1.0 / asinh_a)
+    else:
+        data -= low
+        data *= LUT_SIZE / (high - low)
+
+    data[bad] = 0.0
+    np.clip(data, 0.0, LUT_SIZE - 1, out=data)
+
+    indices = data.astype(np.intp)
+    indices[bad] = BAD_INDEX
+
+    return indices
+
+
+def apply_colormap(
+    buffer: np.ndarray,
+    cmap: str,
+    vmin: float,
+    vmax: float,
+    log_norm: bool = False,
+    clip: bool = True,
+    stretch: Literal["linear", "asinh"] = "linear",
+    asinh_a: float = ASINH_SOFTENING,
+) -> np.ndarray:
+    """
+    Colour-map a 2D buffer to a (ny, nx, 4) uint8 RGBA image.
+
+    Parameters
+    ----------
+    buffer : np.ndarray
+        Raw data to render.
+    cmap : str
+        Name of the matplotlib colour map to use.
+    vmin, vmax, log_norm, clip, stretch, asinh_a
+        Normalization options, see :func:`lut_indices`.
+
+    Returns
+    -------
+    np.ndarray
+        RGBA image in the same row order as the buffer.
+    """
+    indices = lut_indices(buffer, vmin, vmax, log_norm, clip, stretch, asinh_a)
+
+    return colormap_lut(cmap)[indices]
+
+
+def scale_limits(
+    buffer: np.ndarray,
+    scaling: Literal["minmax", "percentile", "zscale"],
+    percentile: float = 99.5,
+    positive: bool = False,
+) -> tuple[float, float] | None:
+    """
+    Choose display limits from the data in a buffer.
+
+    Parameters
+    ----------
+    buffer : np.ndarray
+        Data to choose limits for. NaNs and infinities are ignored.
+    scaling : Literal["minmax", "percentile", "zscale"]
+        How to choose the limits: the full data range, the central
+        percentile of the data, or IRAF's zscale algorithm.
+    percentile : float
+        Percentage of pixels to keep between the limits for percentile
+        scaling, e.g. 99.5 clips the top and bottom 0.25%.
+    positive : bool
+        Only consider positive values, as needed for log normalizations.
+
+    Returns
+    -------
+    tuple[float, float] | None
+        (vmin, vmax), or None if there are no usable values.
+    """
+
+    values = np.asarray(buffer, dtype=np.float64).ravel()
+    usable = np.isfinite(values)
+
+    if positive:
+        usable &= values > 0.0
+
+    values = values[usable]
+
+    if values.size == 0:
+        return None
+
+    if scaling == "minmax":
+        vmin, vmax = values.min(), values.max()
+    elif scaling == "percentile":
+        tail = (100.0 - percentile) / 2
+        vmin, vmax = np.percentile(values, [tail, 100.0 - tail])
+    elif scaling == "zscale":
+        vmin, vmax = ZScaleInterval().get_limits(values)
+
+        if positive:
+            # zscale can reach below the data; keep log norms valid.
+            vmin = min(max(vmin, values.min()), vmax)
+    else:
+        raise ValueError(f"Unknown scaling {scaling}")
+
+    return float(vmin), float(vmax)
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + tag
+        + data
+        + struct.pack(">I", zlib.crc32(tag + data))
+    )
+
+
+def encode_png(image: np.ndarray, compress_level: int = 6) -> bytes:
+    """
+    Encode an 8-bit image straight to PNG bytes.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        uint8 array of shape (ny, nx) or (ny, nx, channels) with 1-4
+        channels. The first row is the top of the image.
+    compress_level : int
+        zlib compression level, 0-9.
+
+    Returns
+    -------
+    bytes
+        The encoded PNG file.
+    """
+
+    if image.ndim == 2:
+        image = image[:, :, None]
+
+    height, width, channels = image.shape
+
+    # Each scanline is prefixed with its filter type; we always use 0 (None)
+    # as the colour-mapped data compresses well without filtering.
+    scanlines = np.zeros((height, width * channels + 1), dtype=np.uint8)
+    scanlines[:, 1:] = image.reshape(height, width * channels)
+
+    header = struct.pack(
+        ">IIBBBBB", width, height, 8, PNG_COLOR_TYPES[channels], 0, 0, 0
+    )
+
+    return b"".join(
+        [
+            PNG_SIGNATURE,
+            _png_chunk(b"IHDR", header),
+            _png_chunk(b"IDAT", zlib.compress(scanlines.data, compress_level)),
+            _png_chunk(b"IEND", b""),
+        ]
+    )
+
+
+def block_average(buffer: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Shrink a 2D buffer by an integer factor, averaging each factor x factor
+    block of pixels and ignoring NaNs. Edge blocks that are cut short are
+    averaged over the pixels they do have.
+
+    Parameters
+    ----------
+    buffer : np.ndarray
+        Buffer to shrink.
+    factor : int
+        Shrink factor along both axes.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape ceil(buffer.shape / factor). Blocks that are all NaN
+        are NaN.
+    """
+
+    if factor <= 1:
+        return np.asarray(buffer, dtype=np.float64)
+
+    ny, nx = buffer.shape
+    out_y, out_x = -(-ny // factor), -(-nx // factor)
+
+    padded = np.full((out_y * factor, out_x * factor), np.nan)
+    padded[:ny, :nx] = buffer
+
+    blocks = padded.reshape(out_y, factor, out_x, factor)
+    valid = ~np.isnan(blocks)
+    total = np.where(valid, blocks, 0.0).sum(axis=(1, 3))
+    count = valid.sum(axis=(1, 3))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def _bilinear_weights(n_in: int, n_out: int) -> tuple[np.ndarray, ...]:
+    # Align pixel centres, as e.g. PIL and OpenCV do.
+    position = (np.arange(n_out) + 0.5) * (n_in / n_out) - 0.5
+    np.clip(position, 0, n_in - 1, out=position)
+
+    low = np.floor(position).astype(np.intp)
+    high = np.minimum(low + 1, n_in - 1)
+
+    return low, high, position - low
+
+
+def resample_bilinear(buffer: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    """
+    Resample a 2D buffer to a new shape with bilinear interpolation.
+    """
+
+    buffer = np.asarray(buffer, dtype=np.float64)
+    y_low, y_high, y_weight = _bilinear_weights(buffer.shape[0], shape[0])
+    x_low, x_high, x_weight = _bilinear_weights(buffer.shape[1], shape[1])
+
+    top = buffer[y_low]
+    bottom = buffer[y_high]
+    y_weight = y_weight[:, None]
+
+    rows = top * (1.0 - y_weight) + bottom * y_weight
+
+    return rows[:, x_low] * (1.0 - x_weight) + rows[:, x_high] * x_weight
+
+
+def thumbnail(
+    buffer: np.ndarray, size: int | None = None, scale: int | None = None
+) -> np.ndarray:
+    """
+    Shrink a 2D buffer for display at lower resolution.
+
+    Parameters
+    ----------
+    buffer : np.ndarray
+        Buffer to shrink.
+    size : int | None
+        Length, in pixels, of the longest edge of the output. The buffer is
+        block-averaged down to just above this size (to avoid aliasing) and
+        then bilinearly resampled to it. Buffers are never enlarged.
+    scale : int | None
+        Integer factor to block-average the buffer by. Applied before size.
+
+    Returns
+    -------
+    np.ndarray
+        The shrunk buffer (or the original, if neither option is given).
+    """
+
+    if scale is not None:
+        buffer = block_average(buffer, scale)
+
+    if size is not None and max(buffer.shape) > size:
+        longest = max(buffer.shape)
+        buffer = block_average(buffer, max(1, longest // size))
+
+        ratio = size / max(buffer.shape)
+        shape = (
+            max(1, round(buffer.shape[0] * ratio)),
+            max(1, round(buffer.shape[1] * ratio)),
+        )
+
+        if shape != buffer.shape:
+            buffer = resample_bilinear(buffer, shape)
+
+    return buffer
@@ -1,37 +1,101 @@
-import io
+"""
+Conversion of lightcurves to downloadable CSV, HDF5, Arrow IPC and Parquet
+files.
+
+Both writers are generators of byte chunks, suitable for handing straight
+to a StreamingResponse. CSV is produced a block of rows at a time, with
+each column formatted for the whole block at once with NumPy. HDF5 is
+written to a spooled temporary file, which only goes to disk once it gets
+large, and then read back out in chunks. Arrow and Parquet output needs
+the optional pyarrow dependency (the `arrow` extra), which is only imported
+when used.
+"""
+
+import importlib.util
+import re
+import tempfile
+from datetime import datetime
+from typing import Any, Iterable, Iterator
+from uuid import UUID
 
 import h5py
-from lightcurvedb.client.lightcurve import (
-    LightcurveBandResult,
-    LightcurveResult,
-    Source,
-)
+import numpy as np
+from lightcurvedb.models.source import Source
 
-LIGHTCURVE_FIELD_CONFIG: dict[str, dict[str, str]] = {
-    "id": {
-        "description": "Source ID",
-        "output_type": "i4",
+from lightserve.processing.streaming import iterate_file
+
+LightcurveBand = Any
+"A band of a source lightcurve, with a list (or array) for each field below."
+
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_UUID_HEX_SPANS = [(0, 8), (8, 12), (12, 16), (16, 20), (20, 32)]
+
+
+def _uuids_to_strings(values: Iterable[UUID]) -> np.ndarray:
+    """
+    Convert UUIDs to their canonical 36-character form, as an S36 array,
+    hex-encoding all of their bytes at once.
+    """
+    raw = np.frombuffer(b"".join([x.bytes for x in values]), dtype=np.uint8)
+    raw = raw.reshape(-1, 16)
+
+    digits = np.empty((len(raw), 32), dtype=np.uint8)
+    digits[:, 0::2] = _HEX_DIGITS[raw >> 4]
+    digits[:, 1::2] = _HEX_DIGITS[raw & 0xF]
+
+    text = np.full((len(raw), 36), ord("-"), dtype=np.uint8)
+
+    for offset, (start, end) in enumerate(_UUID_HEX_SPANS):
+        text[:, start + offset : end + offset] = digits[:, start:end]
+
+    return text.view("S36").ravel()
+
+
+def _datetimes_to_unix(values: Iterable[datetime] | np.ndarray) -> np.ndarray:
+    """
+    Convert times to integer unix seconds (truncating). datetime64 arrays
+    are converted with a single cast; lists of datetimes have to visit each
+    element, so do as little as possible per element.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind == "M":
+        return values.astype("datetime64[s]").astype(np.int64)
+
+    seconds = np.fromiter(
+        (x.timestamp() for x in values), dtype=np.float64, count=len(values)
+    )
+
+    return seconds.astype(np.int64)
+
+
+# Conversion functions take, and return, a whole column.
+LIGHTCURVE_FIELD_CONFIG: dict[str, dict[str, Any]] = {
+    "measurement_id": {
+        "description": "Flux measurement ID",
+        "output_type": "S36",
+        "arrow_type": "string",
         "units": "dimensionless",
-        "format_string": r"{:08d}",
+        "conversion_function": _uuids_to_strings,
+        "format_string": r"{}",
     },
     "time": {
         "description": "Observation timestamp",
         "output_type": "i8",
+        "arrow_type": "timestamp[s]",  # Always UTC
         "units": "seconds",
-        "conversion_function": lambda x: int(x.timestamp()),
+        "conversion_function": _datetimes_to_unix,
         "format_string": r"{:d}",
     },
-    "i_flux": {
-        "description": "Source intensity",
+    "flux": {
+        "description": "Source flux",
         "output_type": "f4",
         "units": "Jy",
         "format_string": r"{:+010.4f}",  # Up to 9999 Jy with 0.1 mJy precision
     },
-    "i_uncertainty": {
-        "description": "Source intensity uncertainty",
+    "flux_err": {
+        "description": "Source flux uncertainty",
         "output_type": "f4",
         "units": "Jy",
-        "format_string": r"{:+010.4f}",  # Up to 9999 Jy with 1 mJy precision
+        "format_string": r"{:+010.4f}",  # Up to 9999 Jy with 0.1 mJy precision
     },
     "ra": {
         "description": "Source right ascension",
@@ -45,80 +109,200 @@ LIGHTCURVE_FIELD_CONFIG: dict[str, dict[str, str]] = {
         "output_type": "f4",
         "format_string": r"{:+08.4f}",  # down to 0.4 arcsec precision with leading zeros and +/-
     },
-    # "ra_uncertainty": {
-    #     "description": "Source right ascension uncertainty",
-    #     "output_type": "f4",
-    #     "units": "degrees",
-    # },
-    # "dec_uncertainty": {
-    #     "description": "Source declination uncertainty",
-    #     "output_type": "f4",
-    #     "units": "degrees",
-    # },
 }
 
+# Arrow and Parquet tables also hold the per-bin counts of binned
+# lightcurves, which the CSV and HDF5 writers leave out.
+TABLE_FIELD_CONFIG: dict[str, dict[str, Any]] = {
+    **LIGHTCURVE_FIELD_CONFIG,
+    "count": {
+        "description": "Number of measurements in each bin",
+        "output_type": "i4",
+        "units": "dimensionless",
+        "format_string": r"{:d}",
+    },
+}
+
+CSV_CHUNK_ROWS = 65536
+"Number of rows formatted, and sent, at a time when streaming CSV."
+
+HDF5_SPOOL_BYTES = 16 * 1024 * 1024
+"Size above which HDF5 files being built for download are moved to disk."
+
+_NUMERIC_FORMAT = re.compile(
+    r"\{:(?P<sign>\+?)(?P<zero>0?)(?P<width>\d*)(?:\.(?P<decimals>\d+))?(?P<kind>[df])\}"
+)
+
 
 def _prepare_data_columnar(
-    lightcurve_band: LightcurveBandResult,
-) -> dict[str, list[float | str | int]]:
+    lightcurve_band: LightcurveBand, fields: Iterable[str] | None = None
+) -> dict[str, np.ndarray]:
     """
     Prepare lightcurve data for writing in a columnar format by using
-    conversion functions where specified.
+    conversion functions where specified. Each column is converted once,
+    to a typed array, which all of the writers use directly.
 
     Arguments
     ---------
-    lightcurve_band: LightcurveBandResult
-        The columnar formatted band result.
+    lightcurve_band: LightcurveBand
+        The columnar formatted band.
+    fields: Iterable[str] | None
+        Fields to prepare, from TABLE_FIELD_CONFIG, defaults to all of
+        LIGHTCURVE_FIELD_CONFIG.
 
     Returns
     -------
-    dict[str,  list[float | str | int]]
-        Columns formatted using "conversion_function"s.
-
-
+    dict[str, np.ndarray]
+        Columns formatted using "conversion_function"s, as arrays of their
+        "output_type".
     """
 
     data = {}
 
-    for field, config in LIGHTCURVE_FIELD_CONFIG.items():
-        data[field] = getattr(lightcurve_band, field)
+    for field in fields or LIGHTCURVE_FIELD_CONFIG:
+        config = TABLE_FIELD_CONFIG[field]
+        values = getattr(lightcurve_band, field)
 
         if "conversion_function" in config:
-            data[field] = list(map(config["conversion_function"], data[field]))
+            values = config["conversion_function"](values)
+
+        data[field] = np.asarray(values, dtype=config["output_type"])
 
     return data
 
 
-def _prepare_data_row(lightcurve_band: LightcurveBandResult) -> list[str]:
+def _format_fixed_width(values: np.ndarray, format_string: str) -> np.ndarray | None:
     """
-    Prepare lightcurve data for writing in a row-based format, i.e. formats
-    them as comma-separated strings according to their string formatter.
-
-    Arguments
-    ---------
-    lightcurve_band: LightcurveBandResult
-        The columnar formatted band result.
+    Format a numeric column with a zero-padded, fixed-width format string
+    (e.g. '{:+010.4f}' or '{:08d}') using only array arithmetic.
 
     Returns
     -------
-    list[str]
-        Rows formatted using "conversion_function"s and the "format_string"
-        options above.
+    np.ndarray | None
+        uint8 array of shape (len(values), width) holding the ASCII text of
+        each value, matching str.format up to rounding of the final digit.
+        None if the format is not supported, or if any value is not finite
+        or does not fit in the width, in which case the caller must fall
+        back to str.format.
+    """
+    match = _NUMERIC_FORMAT.fullmatch(format_string)
+
+    if match is None or (match["width"] and not match["zero"]):
+        return None
+
+    sign = match["sign"] == "+"
+    decimals = int(match["decimals"] or 0)
+
+    if match["kind"] == "f":
+        # Scale in double precision, as str.format would see the values.
+        values = values.astype(np.float64)
+
+        if not np.isfinite(values).all():
+            return None
+
+        negative = np.signbit(values)
+        magnitude = np.rint(np.abs(values) * 10.0**decimals).astype(np.int64)
+    else:
+        values = values.astype(np.int64)
+        negative = values < 0
+        magnitude = np.abs(values)
+
+    largest = int(magnitude.max(initial=0))
+
+    if match["width"]:
+        digits = int(match["width"]) - sign - (decimals > 0)
+    else:
+        # Without a width there is no padding, so every value must have the
+        # same number of digits (as do, e.g., all current unix times).
+        digits = max(len(str(largest)), decimals + 1)
+
+        if magnitude.size and int(magnitude.min()) < 10 ** (digits - 1):
+            return None
+
+    if largest >= 10**digits:
+        return None
+
+    # Without a sign column, negative values use up a digit for their sign.
+    if not sign and negative.any():
+        if int(magnitude[negative].max()) >= 10 ** (digits - 1) or not match["width"]:
+            return None
 
+    # Peel off digits from the right, writing each straight into its column
+    # of the output; 32-bit division is much faster, where values allow it.
+    point = sign + digits - decimals
+    text = np.empty((len(magnitude), sign + digits + (decimals > 0)), dtype=np.uint8)
+    remaining = magnitude.astype(np.uint32 if largest < 2**32 else np.uint64)
+
+    for position in reversed(range(digits)):
+        column = sign + position + (decimals > 0 and sign + position >= point)
+        quotient = remaining // 10
+        text[:, column] = remaining - quotient * 10
+        remaining = quotient
+
+    text += ord("0")
+
+    if decimals:
+        text[:, point] = ord(".")
+
+    if sign:
+        text[:, 0] = np.where(negative, ord("-"), ord("+"))
+    else:
+        text[negative, 0] = ord("-")
+
+    return text
+
+
+def _format_column(values: np.ndarray, format_string: str) -> np.ndarray | list[str]:
+    """
+    Format a column for CSV output, as a (rows, width) uint8 array of ASCII
+    text where possible, or otherwise a list of strings.
     """
+    if values.dtype.kind == "S":
+        if format_string == "{}":
+            return values.view(np.uint8).reshape(len(values), values.dtype.itemsize)
+    else:
+        text = _format_fixed_width(values, format_string)
 
-    formatting_string = ",".join(
-        c["format_string"] for c in LIGHTCURVE_FIELD_CONFIG.values()
-    )
+        if text is not None:
+            return text
 
-    data = [
-        formatting_string.format(*args)
-        for args in zip(
-            *_prepare_data_columnar(lightcurve_band=lightcurve_band).values()
-        )
+    if values.dtype.kind == "S":
+        values = values.astype(str)
+
+    return [format_string.format(x) for x in values.tolist()]
+
+
+def _join_csv_rows(columns: list[np.ndarray | list[str]]) -> bytes:
+    """
+    Join formatted columns (see :func:`_format_column`) into CSV rows.
+    """
+    if all(isinstance(column, np.ndarray) for column in columns):
+        rows = len(columns[0])
+        widths = [column.shape[1] for column in columns]
+        output = np.full((rows, sum(widths) + len(widths)), ord(","), dtype=np.uint8)
+
+        start = 0
+
+        for column, width in zip(columns, widths):
+            output[:, start : start + width] = column
+            start += width + 1
+
+        output[:, -1] = ord("\n")
+
+        return output.tobytes()
+
+    text = [
+        np.ascontiguousarray(column)
+        .view(f"S{column.shape[1]}")
+        .ravel()
+        .astype(str)
+        .tolist()
+        if isinstance(column, np.ndarray)
+        else column
+        for column in columns
     ]
 
-    return data
+    return "".join(",".join(row) + "\n" for row in zip(*text)).encode()
 
 
 def _get_csv_headers() -> str:
@@ -133,57 +317,43 @@ def _get_csv_headers() -> str:
     )
 
 
-def _transform_band_lc_to_csv(
-    lightcurve_band: LightcurveBandResult, handle: io.StringIO
-):
+def iterate_lightcurve_csv(
+    bands: dict[str, LightcurveBand], chunk_rows: int = CSV_CHUNK_ROWS
+) -> Iterator[bytes]:
     """
-    Transform a single band's lightcurve data to CSV format.
+    Stream lightcurve bands as a single CSV file, with a final column naming
+    the band of each row.
 
     Arguments
     ---------
-    lightcurve_band: LightcurveBandResult
-        Single band lightcurve data
-    handle: io.StringIO
-        Byte stream supporting string I/O (managed by caller)
-    """
-
-    def row_generator():
-        yield _get_csv_headers() + "\n"
-        for row in _prepare_data_row(lightcurve_band):
-            yield row + "\n"
-
-    handle.writelines(row_generator())
-
-    return
-
+    bands: dict[str, LightcurveBand]
+        Bands to write, by name.
+    chunk_rows: int
+        Number of rows to format at a time.
 
-def _transform_lc_to_csv(lightcurve: LightcurveResult, handle: io.StringIO):
+    Returns
+    -------
+    Iterator[bytes]
+        The header, and then blocks of up to chunk_rows rows.
     """
-    Transform multi-band lightcurve data to CSV format.
 
-    Arguments
-    ---------
-    lightcurve: LightcurveResult
-        Multi-band lightcurve data
-    handle: io.StringIO
-        Byte stream supporting string I/O (managed by caller)
-    """
+    yield (_get_csv_headers() + ",band\n").encode()
 
-    def row_generator():
-        # Same as above, but need to add band as final argument.
-        header = _get_csv_headers() + ",band [Ghz]" + "\n"
-        yield header
+    formats = [c["format_string"] for c in LIGHTCURVE_FIELD_CONFIG.values()]
 
-        for band_data in sorted(lightcurve.bands, key=lambda x: x.band.frequency):
-            for row in _prepare_data_row(band_data):
-                yield row + f",{band_data.band.frequency:03.0f}\n"
+    for band_name, band in bands.items():
+        data = list(_prepare_data_columnar(band).values())
+        name = np.frombuffer(str(band_name).encode(), dtype=np.uint8)
 
-    handle.writelines(row_generator())
+        for start in range(0, len(data[0]), chunk_rows):
+            chunk = [values[start : start + chunk_rows] for values in data]
+            columns = [_format_column(v, f) for v, f in zip(chunk, formats)]
+            columns.append(np.broadcast_to(name, (len(chunk[0]), len(name))))
 
-    return
+            yield _join_csv_rows(columns)
 
 
-def _create_hdf5_dataset(group: h5py.Group, field: str, data: list):
+def _create_hdf5_dataset(group: h5py.Group, field: str, data: np.ndarray):
     """
     Create an HDF5 dataset with metadata from configuration.
 
@@ -194,8 +364,8 @@ def _create_hdf5_dataset(group: h5py.Group, field: str, data: list):
     field: str
         Field name from LIGHTCURVE_FIELD_CONFIG, specifies output type
         and additional metadata
-    data: list
-        Numpy array or list to store in dataset
+    data: np.ndarray
+        Column to store in dataset
     """
     config = LIGHTCURVE_FIELD_CONFIG[field]
 
@@ -205,68 +375,316 @@ def _create_hdf5_dataset(group: h5py.Group, field: str, data: list):
     dataset.attrs["units"] = config["units"]
 
 
-def _add_source_metadata_to_hdf5(hf: h5py.File, source: Source):
+def _add_source_metadata_to_hdf5(hf: h5py.Group, source: Source):
     """
-    Add source metadata to an HDF5 file.
+    Add source metadata to an HDF5 file (or a group within one).
 
     Parameters
     ----------
-    hf : h5py.File
-        HDF5 file handle to add metadata to
+    hf : h5py.Group
+        HDF5 file handle, or group, to add metadata to
     source : Source
     """
     metadata_group = hf.create_group("Metadata")
-    metadata_group.attrs["source_name"] = source.name
+    metadata_group.attrs["source_id"] = str(source.source_id)
+    if source.name is not None:
+        metadata_group.attrs["source_name"] = source.name
     if source.ra is not None:
         metadata_group.attrs["source_ra"] = source.ra
     if source.dec is not None:
         metadata_group.attrs["source_dec"] = source.dec
 
 
-def _transform_band_lc_to_hdf5(
-    lightcurve_band: LightcurveBandResult, handle: io.BytesIO
-):
+def _add_bands_to_hdf5(group: h5py.Group, bands: dict[str, LightcurveBand]):
+    """
+    Add a group per band, holding a dataset per field, to an HDF5 group.
     """
-    Transform a single band's lightcurve data to HDF5 format.
+    for band_name, band in bands.items():
+        band_group = group.create_group(str(band_name))
+        band_group.attrs["frequency"] = band.frequency
+
+        if band.module is not None:
+            band_group.attrs["module"] = band.module
+
+        data = _prepare_data_columnar(band)
+
+        for field in LIGHTCURVE_FIELD_CONFIG.keys():
+            _create_hdf5_dataset(band_group, field, data[field])
+
+
+def iterate_lightcurve_hdf5(
+    bands: dict[str, LightcurveBand],
+    source: Source,
+    spool_bytes: int = HDF5_SPOOL_BYTES,
+) -> Iterator[bytes]:
+    """
+    Write lightcurve bands to an HDF5 file, with a group per band, and
+    stream it back out.
 
     Arguments
     ---------
-    lightcurve_band: LightcurveBandResult
-        Single band lightcurve data
-    handle: io.BytesIO
-        Binary stream to write to (managed by caller)
+    bands: dict[str, LightcurveBand]
+        Bands to write, by name.
+    source: Source
+        Source that the lightcurve belongs to, stored as metadata.
+    spool_bytes: int
+        Size above which the file is moved from memory to disk.
+
+    Returns
+    -------
+    Iterator[bytes]
+        Chunks of the file. Nothing is yielded until it is complete.
     """
 
-    with h5py.File(handle, "w") as hf:
-        _add_source_metadata_to_hdf5(hf, lightcurve_band.source)
-        data = _prepare_data_columnar(lightcurve_band)
+    handle = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
 
-        for field in LIGHTCURVE_FIELD_CONFIG.keys():
-            _create_hdf5_dataset(hf, field, data[field])
+    try:
+        with h5py.File(handle, "w") as hf:
+            _add_source_metadata_to_hdf5(hf, source)
+            _add_bands_to_hdf5(hf, bands)
+    except BaseException:
+        handle.close()
+        raise
 
-    return
+    yield from iterate_file(handle)
 
 
-def _transform_lc_to_hdf5(lightcurve: LightcurveResult, handle: io.BytesIO):
+def select_bands(
+    lightcurves: dict[Any, LightcurveBand], names: Iterable[str] | None = None
+) -> dict[str, LightcurveBand]:
+    """
+    Key the bands of a lightcurve by name, optionally keeping only some.
     """
-    Transform multi-band lightcurve data to HDF5 format.
+    bands = {str(name): band for name, band in lightcurves.items()}
+
+    if names is None:
+        return bands
+
+    return {name: bands[name] for name in names if name in bands}
+
+
+TABLE_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+"Media types of the columnar binary formats."
+
+TABLES_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+"Whether pyarrow is installed, and so Arrow and Parquet output is available."
+
+
+def _arrow_type(field: str):
+    import pyarrow as pa
+
+    config = TABLE_FIELD_CONFIG[field]
+
+    if "arrow_type" not in config:
+        return pa.from_numpy_dtype(np.dtype(config["output_type"]))
+
+    arrow_type = pa.type_for_alias(config["arrow_type"])
+
+    if pa.types.is_timestamp(arrow_type):
+        return pa.timestamp(arrow_type.unit, tz="UTC")
+
+    return arrow_type
+
+
+def lightcurve_table(bands: dict[str, LightcurveBand], metadata: dict[str, str]):
+    """
+    Build a single Arrow table from lightcurve bands, with a row per
+    measurement and band and frequency columns. Columns are typed and
+    annotated (description and units, as field metadata) from
+    TABLE_FIELD_CONFIG; only fields that the bands have are included, so
+    this works for binned lightcurves too, which also get a count column.
 
     Arguments
     ---------
-    lightcurve: LightcurveResult
-        Multi-band lightcurve data
-    handle: io.BytesIO
-        Binary stream to write to (managed by caller)
+    bands: dict[str, LightcurveBand]
+        Bands to include, by name.
+    metadata: dict[str, str]
+        Table-level metadata, e.g. the source ID.
+
+    Returns
+    -------
+    pyarrow.Table
+        The lightcurve table.
+    """
+    import pyarrow as pa
+
+    first = next(iter(bands.values()), None)
+    fields = [f for f in TABLE_FIELD_CONFIG if hasattr(first, f)]
+
+    schema = pa.schema(
+        [
+            pa.field(
+                field,
+                _arrow_type(field),
+                metadata={
+                    "description": TABLE_FIELD_CONFIG[field]["description"],
+                    "units": TABLE_FIELD_CONFIG[field]["units"],
+                },
+            )
+            for field in fields
+        ]
+        + [
+            pa.field("band", pa.dictionary(pa.int32(), pa.string())),
+            pa.field("frequency", pa.int32(), metadata={"units": "GHz"}),
+        ],
+        metadata=metadata,
+    )
+
+    names = list(bands.keys())
+    tables = []
+
+    for index, (name, band) in enumerate(bands.items()):
+        data = _prepare_data_columnar(band, fields)
+        rows = len(data[fields[0]]) if fields else 0
+        columns = [
+            pa.array(data[field]).cast(schema.field(field).type)
+            if data[field].dtype.kind == "S"
+            else pa.array(data[field], type=schema.field(field).type)
+            for field in fields
+        ]
+        columns.append(
+            pa.DictionaryArray.from_arrays(
+                pa.array(np.full(rows, index, dtype=np.int32)), pa.array(names)
+            )
+        )
+        columns.append(pa.array(np.full(rows, band.frequency, dtype=np.int32)))
+
+        tables.append(pa.Table.from_arrays(columns, schema=schema))
+
+    if not tables:
+        return schema.empty_table()
+
+    return pa.concat_tables(tables)
+
+
+def encode_lightcurve_table(
+    bands: dict[str, LightcurveBand], format: str, metadata: dict[str, str]
+) -> bytes:
+    """
+    Encode lightcurve bands (see :func:`lightcurve_table`) as an Arrow IPC
+    stream or a Parquet file. CPU-bound; run in the worker pool.
     """
-    with h5py.File(handle, "w") as hf:
-        _add_source_metadata_to_hdf5(hf, lightcurve.source)
-        for band_data in lightcurve.bands:
-            band_group = hf.create_group(band_data.band.name)
-            band_group.attrs.update(**band_data.band.model_dump())
+    import pyarrow as pa
 
-            data = _prepare_data_columnar(band_data)
+    table = lightcurve_table(bands, metadata)
+    sink = pa.BufferOutputStream()
 
-            for field in LIGHTCURVE_FIELD_CONFIG.keys():
-                _create_hdf5_dataset(band_group, field, data[field])
+    if format == "arrow":
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    elif format == "parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, sink, compression="zstd")
+    else:
+        raise ValueError(f"Unsupported table format {format}")
+
+    return sink.getvalue().to_pybytes()
+
+
+class LightcurveArchive:
+    """
+    A single file holding the lightcurves of many sources, written one
+    source at a time so that only one lightcurve needs to be in memory.
+    HDF5 archives have a group per source (named by source ID, with the
+    same layout as a single-source download); Parquet archives are one
+    table (see :func:`lightcurve_table`) with a leading source_id column,
+    written as a row group per source. The file is spooled, and only goes
+    to disk once it gets large.
+
+    Writing blocks, so call add and finish from a thread rather than the
+    event loop. Open file handles cannot be sent to worker processes.
+    """
+
+    format: str
+    "Either 'hdf5' or 'parquet'."
+    metadata: dict[str, str]
+    "File-level metadata, stored as HDF5 root attributes or Parquet key-values."
+    handle: tempfile.SpooledTemporaryFile
+    "The file being written."
+    missing: list[str]
+    "IDs of sources asked for that had no lightcurve, recorded when finished."
+
+    def __init__(
+        self,
+        format: str,
+        metadata: dict[str, str],
+        spool_bytes: int = HDF5_SPOOL_BYTES,
+    ):
+        if format not in ("hdf5", "parquet"):
+            raise ValueError(f"Unsupported archive format {format}")
+
+        self.format = format
+        self.metadata = metadata
+        self.handle = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        self.missing = []
+
+        self._hdf5 = None
+        self._parquet = None
+
+        if format == "hdf5":
+            self._hdf5 = h5py.File(self.handle, "w")
+            self._hdf5.attrs.update(metadata)
+
+    def add(self, source: Source, bands: dict[str, LightcurveBand]):
+        """
+        Write the lightcurve of one source to the archive.
+        """
+        if self._hdf5 is not None:
+            group = self._hdf5.create_group(str(source.source_id))
+            _add_source_metadata_to_hdf5(group, source)
+            _add_bands_to_hdf5(group, bands)
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = lightcurve_table(bands, metadata={})
+        table = table.add_column(
+            0,
+            pa.field("source_id", pa.dictionary(pa.int32(), pa.string())),
+            pa.DictionaryArray.from_arrays(
+                pa.array(np.zeros(table.num_rows, dtype=np.int32)),
+                pa.array([str(source.source_id)]),
+            ),
+        )
 
-    return
+        if self._parquet is None:
+            self._parquet = pq.ParquetWriter(
+                self.handle,
+                table.schema.with_metadata(self.metadata),
+                compression="zstd",
+            )
+
+        self._parquet.write_table(table)
+
+    def finish(self) -> tempfile.SpooledTemporaryFile:
+        """
+        Complete the archive, recording the IDs of any sources that were
+        asked for but had no lightcurve, and return the file handle,
+        which the caller then owns (e.g. to pass to
+        :func:`~lightserve.processing.streaming.iterate_file`).
+        """
+        missing = ",".join(self.missing)
+
+        if self._hdf5 is not None:
+            self._hdf5.attrs["missing_source_ids"] = missing
+            self._hdf5.close()
+        elif self._parquet is not None:
+            self._parquet.add_key_value_metadata({"missing_source_ids": missing})
+            self._parquet.close()
+
+        return self.handle
+
+    def close(self):
+        """
+        Abandon the archive, discarding the file.
+        """
+        for writer in (self._hdf5, self._parquet):
+            if writer is not None:
+                writer.close()
+
+        self.handle.close()
@@ -0,0 +1,400 @@
+"""
+An in-memory spatial index over the source catalog, for cone searches that
+do not need to go to the database.
+
+Sources are split into zones: strips of declination of fixed height, and
+sorted by right ascension within each zone (Gray et al. 2007, "The Zones
+Algorithm for Finding Points-Near-a-Point or Cross-Matching Spatial
+Datasets"). A cone search visits only the zones that overlap the cone, and
+within each only the range of right ascension that can be inside it,
+found by bisection. That range widens towards the poles, and wraps through
+RA = 0; zones near a pole are searched whole. Candidates are then tested
+exactly on the unit sphere, comparing chord lengths, so results are true
+great-circle cones.
+
+Cross-matches of many positions at once (`nearest`) run the same search
+for every position together, with NumPy: the right ascension ranges of all
+positions in a zone are found with one bisection over the whole index,
+the candidate pairs are expanded and tested in bulk, and the nearest
+source is picked for each position. Positions are processed a chunk at a
+time to bound the memory used by candidate pairs.
+
+The index is immutable once built; updates build a new state and swap it
+in, so it can be read from any thread while being refreshed.
+"""
+
+from typing import Iterable, NamedTuple
+
+import numpy as np
+from lightcurvedb.models.source import Source
+
+
+class _IndexState(NamedTuple):
+    sources: list[Source]
+    "Sources, sorted by zone and then right ascension."
+    ra: np.ndarray
+    "Right ascension of each source in degrees, in [0, 360)."
+    dec: np.ndarray
+    "Declination of each source in degrees."
+    xyz: np.ndarray
+    "Unit vector of each source, shape (n, 3)."
+    zone_starts: np.ndarray
+    "Offset of the first source in each zone, with a final entry of n."
+    keys: np.ndarray
+    "Zone times 360 plus right ascension of each source; sorted, for bisection across zones."
+
+
+def unit_vectors(ra: np.ndarray, dec: np.ndarray) -> np.ndarray:
+    """
+    Unit vectors, shape (n, 3), for positions in degrees.
+    """
+    ra, dec = np.radians(ra), np.radians(dec)
+    cos_dec = np.cos(dec)
+
+    return np.stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)], -1)
+
+
+def chord_to_degrees(chord: np.ndarray) -> np.ndarray:
+    """
+    Convert chord lengths between unit vectors to angular separations in
+    degrees. Unlike arccos of a dot product, this is accurate for small
+    separations.
+    """
+    return np.degrees(2.0 * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0)))
+
+
+def degrees_to_chord(radius: float) -> float:
+    """
+    Chord length between unit vectors separated by an angle in degrees.
+    """
+    return 2.0 * np.sin(np.radians(min(radius, 180.0)) / 2.0)
+
+
+def ra_half_width(dec: float, radius: float) -> float | None:
+    """
+    Half-width in right ascension, in degrees, of the smallest range that
+    contains a cone, or None if the cone contains a pole (or is so large
+    that every right ascension is needed).
+    """
+    if radius >= 90.0 or abs(dec) + radius >= 90.0:
+        return None
+
+    lower, upper = np.radians(dec - radius), np.radians(dec + radius)
+    alpha = np.degrees(
+        np.arctan(
+            np.sin(np.radians(radius)) / np.sqrt(abs(np.cos(lower) * np.cos(upper)))
+        )
+    )
+
+    return None if alpha >= 180.0 else float(alpha)
+
+
+def ra_half_widths(dec: np.ndarray, radius: float) -> np.ndarray:
+    """
+    Vectorized ra_half_width, with NaN where every right ascension is
+    needed.
+    """
+    dec = np.asarray(dec, dtype=np.float64)
+
+    if radius >= 90.0:
+        return np.full(dec.shape, np.nan)
+
+    lower, upper = np.radians(dec - radius), np.radians(dec + radius)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        alpha = np.degrees(
+            np.arctan(
+                np.sin(np.radians(radius))
+                / np.sqrt(np.abs(np.cos(lower) * np.cos(upper)))
+            )
+        )
+
+    return np.where((np.abs(dec) + radius >= 90.0) | (alpha >= 180.0), np.nan, alpha)
+
+
+class SourceIndex:
+    """
+    Zones index over sources with a position. Sources without a right
+    ascension or declination are not indexed.
+    """
+
+    zone_height: float
+    "Height of each declination zone in degrees."
+    zones: int
+    "Number of zones, from the south pole to the north."
+
+    def __init__(self, sources: Iterable[Source] = (), zone_height: float = 0.25):
+        self.zone_height = zone_height
+        self.zones = int(np.ceil(180.0 / zone_height))
+        self._state = self._build(list(sources))
+
+    def __len__(self) -> int:
+        return len(self._state.sources)
+
+    def _zone(self, dec: np.ndarray) -> np.ndarray:
+        zone = np.floor((np.asarray(dec) + 90.0) / self.zone_height).astype(np.int64)
+
+        return np.clip(zone, 0, self.zones - 1)
+
+    def _build(self, sources: list[Source]) -> _IndexState:
+        sources = [s for s in sources if s.ra is not None and s.dec is not None]
+
+        ra = np.fromiter((s.ra for s in sources), dtype=np.float64, count=len(sources))
+        dec = np.fromiter((s.dec for s in sources), np.float64, count=len(sources))
+        ra = np.mod(ra, 360.0)
+
+        zone = self._zone(dec)
+        order = np.lexsort((ra, zone))
+
+        return _IndexState(
+            sources=[sources[i] for i in order],
+            ra=ra[order],
+            dec=dec[order],
+            xyz=unit_vectors(ra[order], dec[order]),
+            zone_starts=np.searchsorted(zone[order], np.arange(self.zones + 1)),
+            keys=zone[order] * 360.0 + ra[order],
+        )
+
+    def update(self, sources: Iterable[Source]) -> bool:
+        """
+        Bring the index in line with the current catalog, rebuilding it only
+        if sources have been added, removed or moved.
+
+        Returns
+        -------
+        bool
+            Whether the index changed.
+        """
+        sources = [s for s in sources if s.ra is not None and s.dec is not None]
+
+        current = {(s.source_id, s.ra, s.dec) for s in self._state.sources}
+
+        if len(current) == len(sources) and all(
+            (s.source_id, s.ra, s.dec) in current for s in sources
+        ):
+            return False
+
+        self._state = self._build(sources)
+
+        return True
+
+    def _candidates(
+        self, state: _IndexState, ra: float, dec: float, radius: float
+    ) -> np.ndarray:
+        """
+        Indices (into state) of every source that might be within a cone:
+        those in the zones and right ascension range that it overlaps.
+        """
+        zones = self._zone([dec - radius, dec + radius])
+        alpha = ra_half_width(dec, radius)
+
+        if alpha is None:
+            windows = [(0.0, 360.0)]
+        else:
+            # Widened slightly so rounding can never exclude a source on the
+            # edge; the exact test that follows is what decides.
+            alpha += 1e-9
+            lower, upper = (ra - alpha) % 360.0, (ra + alpha) % 360.0
+            windows = (
+                [(lower, upper)] if lower <= upper else [(lower, 360.0), (0.0, upper)]
+            )
+
+        ranges = [np.empty(0, dtype=np.int64)]
+
+        for zone in range(zones[0], zones[1] + 1):
+            start, end = state.zone_starts[zone], state.zone_starts[zone + 1]
+            zone_ra = state.ra[start:end]
+
+            for low, high in windows:
+                ranges.append(
+                    np.arange(
+                        start + np.searchsorted(zone_ra, low, side="left"),
+                        start + np.searchsorted(zone_ra, high, side="right"),
+                    )
+                )
+
+        return np.concatenate(ranges)
+
+    def cone(
+        self, ra: float, dec: float, radius: float
+    ) -> tuple[list[Source], np.ndarray]:
+        """
+        Find the sources within a great-circle cone.
+
+        Arguments
+        ---------
+        ra: float
+            Right ascension of the center in degrees (any range; wrapped).
+        dec: float
+            Declination of the center in degrees.
+        radius: float
+            Radius in degrees.
+
+        Returns
+        -------
+        tuple[list[Source], np.ndarray]
+            Sources in the cone, nearest first, and their separations from
+            the center in degrees.
+        """
+        if radius < 0 or not -90.0 <= dec <= 90.0:
+            raise ValueError("Invalid parameters for cone search")
+
+        state = self._state
+        ra = ra % 360.0
+        candidates = self._candidates(state, ra, dec, radius)
+
+        center = unit_vectors(np.array([ra]), np.array([dec]))[0]
+        chord = np.linalg.norm(state.xyz[candidates] - center, axis=1)
+        inside = chord <= degrees_to_chord(radius)
+
+        candidates, chord = candidates[inside], chord[inside]
+        order = np.argsort(chord, kind="stable")
+
+        return (
+            [state.sources[i] for i in candidates[order]],
+            chord_to_degrees(chord[order]),
+        )
+
+    def _candidate_pairs(
+        self, state: _IndexState, ra: np.ndarray, dec: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Pairs of (position, source index into state) for every source that
+        might be within radius of each position; the vectorized form of
+        _candidates.
+        """
+        positions = np.arange(len(ra))
+        low_zone, high_zone = self._zone(dec - radius), self._zone(dec + radius)
+
+        # As in _candidates, widened so rounding never excludes a source.
+        alpha = ra_half_widths(dec, radius) + 1e-9
+        whole = np.isnan(alpha)
+        lower = np.where(whole, 0.0, (ra - alpha) % 360.0)
+        upper = np.where(whole, 360.0, (ra + alpha) % 360.0)
+        wrap = ~whole & (lower > upper)
+
+        # Each position searches one or two windows of right ascension per
+        # zone: the range itself, or its two halves either side of RA = 0.
+        windows = [
+            (lower, np.where(wrap, 360.0, upper), np.ones(len(ra), dtype=bool)),
+            (np.zeros(len(ra)), upper, wrap),
+        ]
+
+        pairs = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))]
+
+        for offset in range(int((high_zone - low_zone).max(initial=-1)) + 1):
+            zone = low_zone + offset
+            in_zone = zone <= high_zone
+
+            for low, high, used in windows:
+                select = in_zone & used
+                base = zone[select] * 360.0
+                starts = np.maximum(
+                    np.searchsorted(state.keys, base + low[select], side="left"),
+                    state.zone_starts[zone[select]],
+                )
+                ends = np.minimum(
+                    np.searchsorted(state.keys, base + high[select], side="right"),
+                    state.zone_starts[zone[select] + 1],
+                )
+                counts = np.maximum(ends - starts, 0)
+                total = int(counts.sum())
+
+                if total == 0:
+                    continue
+
+                # Expand each [start, end) range into its source indices.
+                first = np.repeat(np.cumsum(counts) - counts, counts)
+                pairs.append(
+                    (
+                        np.repeat(positions[select], counts),
+                        np.arange(total) - first + np.repeat(starts, counts),
+                    )
+                )
+
+        return (
+            np.concatenate([x for x, _ in pairs]),
+            np.concatenate([x for _, x in pairs]),
+        )
+
+    def nearest(
+        self,
+        ra: np.ndarray,
+        dec: np.ndarray,
+        radius: float,
+        chunk_size: int = 65536,
+    ) -> tuple[np.ndarray, list[Source], np.ndarray]:
+        """
+        Cross-match positions against the index: find the nearest source
+        within radius of each. CPU-bound; run in a thread.
+
+        Arguments
+        ---------
+        ra: np.ndarray
+            Right ascensions of the positions in degrees (any range; wrapped).
+        dec: np.ndarray
+            Declinations of the positions in degrees.
+        radius: float
+            Match radius in degrees.
+        chunk_size: int
+            Number of positions matched at a time.
+
+        Returns
+        -------
+        tuple[np.ndarray, list[Source], np.ndarray]
+            Indices of the positions that have a match, in order, their
+            nearest sources, and the separations in degrees.
+
+        Raises
+        ------
+        ValueError
+            If the radius is negative or a position is not finite or has
+            a declination outside [-90, 90].
+        """
+        ra = np.mod(np.asarray(ra, dtype=np.float64), 360.0)
+        dec = np.asarray(dec, dtype=np.float64)
+
+        if radius < 0 or ra.shape != dec.shape or ra.ndim != 1:
+            raise ValueError("Invalid parameters for cross-match")
+
+        if not (np.isfinite(ra).all() and (np.abs(dec) <= 90.0).all()):
+            raise ValueError("Positions must be finite, with -90 <= dec <= 90")
+
+        state = self._state
+        limit = degrees_to_chord(radius)
+        rows, matches, chords = [], [], []
+
+        for start in range(0, len(ra), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            position, candidate = self._candidate_pairs(
+                state, ra[chunk], dec[chunk], radius
+            )
+
+            xyz = unit_vectors(ra[chunk], dec[chunk])
+            chord = np.linalg.norm(state.xyz[candidate] - xyz[position], axis=1)
+            inside = chord <= limit
+            position, candidate, chord = (
+                position[inside],
+                candidate[inside],
+                chord[inside],
+            )
+
+            # Nearest first within each position, then the first of each.
+            order = np.lexsort((chord, position))
+            _, first = np.unique(position[order], return_index=True)
+            best = order[first]
+
+            rows.append(start + position[best])
+            matches.append(candidate[best])
+            chords.append(chord[best])
+
+        if not rows:
+            return np.empty(0, dtype=np.int64), [], np.empty(0)
+
+        matches = np.concatenate(matches)
+
+        return (
+            np.concatenate(rows),
+            [state.sources[i] for i in matches],
+            chord_to_degrees(np.concatenate(chords)),
+        )
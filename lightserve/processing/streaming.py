@@ -0,0 +1,32 @@
+"""
+Helpers for streaming large outputs back to clients without holding them
+in memory.
+"""
+
+import os
+from typing import BinaryIO, Iterator
+
+CHUNK_SIZE = 1024 * 1024
+"Size of the chunks read from disk when streaming a file out."
+
+
+def file_size(handle: BinaryIO) -> int:
+    """
+    Size in bytes of an open, seekable file.
+    """
+    return handle.seek(0, os.SEEK_END)
+
+
+def iterate_file(handle: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Read a file from the start in chunks, closing it once exhausted (or
+    once the consumer goes away). Suitable for passing to a
+    StreamingResponse.
+    """
+    try:
+        handle.seek(0)
+
+        while chunk := handle.read(chunk_size):
+            yield chunk
+    finally:
+        handle.close()
@@ -0,0 +1,108 @@
+"""
+Pre-render the latest cutouts in the feed into the on-disk cutout cache,
+e.g. straight after a nightly ingest.
+"""
+
+import asyncio
+
+from lightcurvedb.config import settings as lightcurvedb_settings
+
+from lightserve.api.cutouts import (
+    FEED_PAGE_SIZE,
+    cutout_encoder,
+    retrieve_feed_cutouts,
+)
+from lightserve.api.settings import settings
+from lightserve.processing.disk_cache import DiskCache
+from lightserve.warming import warm_cutouts
+from lightserve.workers import WorkerPool
+
+
+async def warm_feed(
+    backend, disk_cache: DiskCache, workers: WorkerPool, pages: int
+) -> int:
+    """
+    Warm the latest cutout of every source in the first pages of the feed,
+    one page at a time, spreading each page over the worker pool.
+
+    Returns
+    -------
+    int
+        Number of outputs rendered.
+    """
+    rendered = 0
+
+    for page in range(pages):
+        source_ids, cutouts = await retrieve_feed_cutouts(
+            backend, start=page * FEED_PAGE_SIZE
+        )
+
+        if not source_ids:
+            break
+
+        counts = await asyncio.gather(
+            *(
+                workers.run(
+                    warm_cutouts,
+                    [cutout],
+                    disk_cache,
+                    formats=settings.cache_warm_formats,
+                    thumbnail_sizes=settings.cache_warm_thumbnail_sizes,
+                    encoder=cutout_encoder,
+                )
+                for cutout in cutouts
+                if cutout is not None
+            )
+        )
+        rendered += sum(counts)
+
+    return rendered
+
+
+async def core(pages: int, workers: int) -> int:
+    if settings.cutout_disk_cache_directory is None:
+        raise SystemExit(
+            "No disk cache configured; set CUTOUT_DISK_CACHE_DIRECTORY to enable it."
+        )
+
+    disk_cache = DiskCache(settings.cutout_disk_cache_directory)
+    # Each feed page is at most FEED_PAGE_SIZE submissions, so the queue is
+    # never the limit here.
+    pool = WorkerPool(kind="process", size=workers)
+
+    try:
+        async with lightcurvedb_settings.backend as backend:
+            return await warm_feed(backend, disk_cache, pool, pages=pages)
+    finally:
+        pool.shutdown()
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description="Pre-render the latest feed cutouts into the disk cache."
+    )
+    parser.add_argument(
+        "-p",
+        "--pages",
+        type=int,
+        default=settings.cache_warm_feed_pages,
+        help="Number of feed pages to warm.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=settings.worker_pool_size,
+        help="Number of rendering processes.",
+    )
+
+    args = parser.parse_args()
+    rendered = asyncio.run(core(args.pages, args.workers))
+
+    print(f"Rendered {rendered} cutouts into {settings.cutout_disk_cache_directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Pre-render cutouts into the on-disk cache, so that the first viewer of a
+newly ingested observation does not pay for rendering it.
+
+Cutouts are rendered with the default options, in each of the configured
+formats at full size and as thumbnails, under exactly the keys that the
+cutout endpoint looks up. Warming is triggered by lightgest as cutouts are
+ingested, and can be run against the newest feed entries with the
+`lightserve-warm` command.
+
+As lightgest imports this module, it depends only on the processing
+modules, never on the API package and its settings; callers pass in the
+formats, thumbnail sizes and encoder settings to render with.
+"""
+
+from typing import Iterable
+
+from lightcurvedb.models.cutout import Cutout
+
+from lightserve.processing.cache import strong_etag
+from lightserve.processing.cutouts import (
+    CompressionOptions,
+    CutoutEncoder,
+    RenderedCutout,
+    RenderOptions,
+    ResampleOptions,
+    cutout_cache_key,
+    encode_cutout,
+)
+from lightserve.processing.disk_cache import DiskCache
+
+
+def warm_cutouts(
+    cutouts: Iterable[Cutout],
+    disk_cache: DiskCache,
+    formats: Iterable[str],
+    thumbnail_sizes: Iterable[int],
+    encoder: CutoutEncoder,
+) -> int:
+    """
+    Render cutouts with the default options into the disk cache, skipping
+    any that are already there. CPU-bound; run in a worker or background
+    thread.
+
+    Parameters
+    ----------
+    cutouts : Iterable[Cutout]
+        Cutouts to render.
+    disk_cache : DiskCache
+        Cache to render into.
+    formats : Iterable[str]
+        Image formats to render.
+    thumbnail_sizes : Iterable[int]
+        Thumbnail sizes to render as well as the full size cutout.
+    encoder : CutoutEncoder
+        Image encoder settings; renders are only found by processes that
+        use the same ones.
+
+    Returns
+    -------
+    int
+        Number of outputs rendered.
+    """
+    formats = list(formats)
+    resamples = [ResampleOptions()] + [
+        ResampleOptions(size=size) for size in thumbnail_sizes
+    ]
+    render_options = RenderOptions()
+    compression_options = CompressionOptions()
+
+    rendered = 0
+
+    for cutout in cutouts:
+        for ext in formats:
+            for resample_options in resamples:
+                key = cutout_cache_key(
+                    cutout.source_id,
+                    cutout.measurement_id,
+                    ext,
+                    render_options=render_options,
+                    resample_options=resample_options,
+                    compression_options=compression_options,
+                    encoder=encoder,
+                )
+
+                if key in disk_cache:
+                    continue
+
+                content, media_type = encode_cutout(
+                    cutout.data,
+                    ext=ext,
+                    render_options=render_options,
+                    resample_options=resample_options,
+                    encoder=encoder,
+                )
+                disk_cache.put(
+                    key,
+                    RenderedCutout(
+                        content=content,
+                        media_type=media_type,
+                        etag=strong_etag(content),
+                    ),
+                )
+                rendered += 1
+
+    return rendered
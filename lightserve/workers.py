@@ -0,0 +1,121 @@
+"""
+A pool of workers for CPU-bound work (rendering, encoding) that would
+otherwise block the event loop.
+
+The pool is created in the application lifespan and made available to
+endpoints through :data:`lightserve.database.Workers`. Submissions are
+bounded: once every worker is busy and the queue is full, further work is
+rejected with a 503 so that a burst of expensive requests cannot starve
+the rest of the API. Work on objects that cannot be sent to another
+process (open files, the in-memory source index) goes through `run_local`,
+which always uses threads but counts against the same limit.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Literal, TypeVar
+
+from fastapi import HTTPException, status
+
+T = TypeVar("T")
+
+
+class WorkerPool:
+    kind: Literal["thread", "process"]
+    "Whether work runs in threads or in separate processes."
+    size: int
+    "Number of workers."
+    queue_size: int
+    "Number of submissions that may wait for a free worker."
+
+    def __init__(
+        self,
+        kind: Literal["thread", "process"] = "thread",
+        size: int = 4,
+        queue_size: int = 64,
+    ):
+        self.kind = kind
+        self.size = size
+        self.queue_size = queue_size
+
+        self.executor: Executor = (
+            ProcessPoolExecutor(max_workers=size)
+            if kind == "process"
+            else ThreadPoolExecutor(
+                max_workers=size, thread_name_prefix="lightserve-worker"
+            )
+        )
+        self.local_executor: Executor = (
+            ThreadPoolExecutor(max_workers=size, thread_name_prefix="lightserve-local")
+            if kind == "process"
+            else self.executor
+        )
+
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        "Number of submissions that are running or queued."
+        return self._pending
+
+    async def _submit(
+        self, executor: Executor, func: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        if self._pending >= self.size + self.queue_size:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy rendering, please retry",
+                headers={"Retry-After": "1"},
+            )
+
+        loop = asyncio.get_running_loop()
+        future = executor.submit(functools.partial(func, *args, **kwargs))
+        self._pending += 1
+
+        # Released when the work itself finishes (in a worker thread, hence
+        # call_soon_threadsafe), not when the caller stops waiting: work of a
+        # cancelled request still occupies the executor.
+        future.add_done_callback(lambda _: self._release(loop))
+
+        return await asyncio.wrap_future(future)
+
+    def _decrement(self):
+        self._pending -= 1
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError:
+            # The loop has closed (at shutdown), so nothing is waiting.
+            pass
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run a function in the pool and wait for its result without blocking
+        the event loop. Exceptions raised by the function are re-raised here.
+
+        Raises
+        ------
+        HTTPException
+            With status 503 if the pool and its queue are full.
+        """
+        return await self._submit(self.executor, func, *args, **kwargs)
+
+    async def run_local(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Like run, but always in a thread of this process, for functions or
+        arguments that cannot be pickled. Shares the pool's limit.
+
+        Raises
+        ------
+        HTTPException
+            With status 503 if the pool and its queue are full.
+        """
+        return await self._submit(self.local_executor, func, *args, **kwargs)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+        if self.local_executor is not self.executor:
+            self.local_executor.shutdown(wait=True, cancel_futures=True)